@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       compare.py
+#
+#       Copyright 2018 Cimbali <me@cimba.li>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+""" Compare two result files of :mod:`run`, e.g. from two commits.
+
+Usage: python benchmarks/compare.py [--threshold PERCENT] before.jsonl after.jsonl
+"""
+
+from __future__ import print_function, unicode_literals
+
+import sys
+import json
+import getopt
+
+
+#: Metrics for which a higher value is better, all others are better when lower
+HIGHER_IS_BETTER = {'throughput', 'hit_rate', 'speedup'}
+
+
+def load(path):
+    """ Load a result file.
+
+    Args:
+        path (`str`):  path to the file written by :mod:`run`
+
+    Returns:
+        `dict`: the value and unit of each result, indexed by (deck, benchmark, metric)
+    """
+    results = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                result = json.loads(line)
+                results[(result['deck'], result['benchmark'], result['metric'])] = (result['value'], result['unit'])
+    return results
+
+
+def main(argv = sys.argv[1:]):
+    """ Print the results side by side, flagging changes beyond the threshold.
+
+    Returns:
+        `int`: 1 if any result is worse by more than the threshold, 0 otherwise
+    """
+    opts, args = getopt.getopt(argv, 't:', ['threshold='])
+    opts = dict(opts)
+    threshold = float(opts.get('-t', opts.get('--threshold', 10))) / 100
+
+    before, after = load(args[0]), load(args[1])
+    regressions = 0
+
+    print('{:<10} {:<14} {:<11} {:>12} {:>12} {:>8}'.format('deck', 'benchmark', 'metric', 'before', 'after', 'change'))
+    for key in sorted(set(before) & set(after)):
+        (old, unit), (new, _) = before[key], after[key]
+        change = (new - old) / old if old else 0.
+        worse = -change if key[2] in HIGHER_IS_BETTER else change
+
+        flag = ''
+        if worse > threshold:
+            flag = ' worse'
+            regressions += 1
+        elif worse < -threshold:
+            flag = ' better'
+
+        print('{:<10} {:<14} {:<11} {:>12.3f} {:>12.3f} {:>+7.1f}% {}{}'.format(key[0], key[1], key[2], old, new,
+                                                                             100 * change, unit, flag))
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       pages_cache.py
+#
+#       Copyright 2018 Cimbali <me@cimba.li>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+""" Measure the memory used by the pages loaded by :class:`~pympress.document.Document`.
+
+Walks through all the pages of a document, reading their links and annotations as the
+GUI does, once with an unbounded pages cache and once with the given bound.
+
+Usage: python benchmarks/pages_cache.py [--max-pages N] file.pdf
+"""
+
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+import gc
+import getopt
+import resource
+import subprocess
+
+# Use the pympress of this source tree
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def get_rss():
+    """ Get the memory currently used by this process.
+
+    Returns:
+        `int`: the resident set size in KiB, or the peak resident set size if the current one is not available
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def walk(path, max_pages):
+    """ Load all the pages of a document, then print the memory used before and after, in KiB.
+
+    Args:
+        path (`str`):  path to the PDF file
+        max_pages (`int`):  the bound of the pages cache, or a negative number for no bound
+    """
+    import gi
+    gi.require_version('Poppler', '0.18')
+    from gi.repository import Poppler
+    from pympress import document
+
+    poppler_doc = Poppler.Document.new_from_file(document.Document.path_to_uri(os.path.abspath(path)), None)
+    doc = document.Document(poppler_doc, path, 0, max_pages if max_pages >= 0 else sys.maxsize)
+
+    gc.collect()
+    before = get_rss()
+
+    for number in range(doc.pages_number()):
+        doc.pin({number, number + 1})
+        page = doc.page(number)
+        page.get_link_destinations()
+        page.get_annotations()
+        page.links
+
+    gc.collect()
+    after = get_rss()
+
+    print(before, after, len(doc.pages_cache))
+    doc.cleanup_media_files()
+
+
+def main(argv = sys.argv[1:]):
+    """ Run the benchmark, with and without bound, each in a new process so that memory is not shared.
+    """
+    opts, args = getopt.getopt(argv, 'm:w:', ['max-pages=', 'walk='])
+    opts = dict(opts)
+
+    if '-w' in opts or '--walk' in opts:
+        walk(args[0], int(opts.get('-w', opts.get('--walk'))))
+        return
+
+    max_pages = int(opts.get('-m', opts.get('--max-pages', 64)))
+    print('{:>10} {:>12} {:>12} {:>8}'.format('max pages', 'before (KiB)', 'after (KiB)', 'loaded'))
+
+    for bound in [-1, max_pages]:
+        out = subprocess.check_output([sys.executable, __file__, '--walk', str(bound), args[0]])
+        before, after, loaded = out.split()
+        print('{:>10} {:>12} {:>12} {:>8}'.format('none' if bound < 0 else bound,
+                                                  int(before), int(after), int(loaded)))
+
+
+if __name__ == '__main__':
+    main()
+
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       run.py
+#
+#       Copyright 2018 Cimbali <me@cimba.li>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+""" Benchmark the rendering and caching of pages, without a display.
+
+For each synthetic deck (see :mod:`synthetic`), in a separate process so that peak memory
+is measured per deck, this times:
+
+- cold rendering of every page with :meth:`~pympress.document.Page.render_cairo`,
+- rendering pages at several sizes with Poppler, compared to replaying their recorded drawings,
+  checking that both give the same pixels,
+- warm cache hits in the :class:`~pympress.surfacecache.SurfaceCache`,
+- a navigation sweep through the deck, prerendering pages as the GUI does,
+- a resize storm, resizing a widget many times and rendering the current page each time.
+
+It also times adding the pen samples of a long scribbling session to :class:`~pympress.strokes.Stroke`s,
+and drawing all of the resulting strokes, along with the number of points stored.
+
+Results are printed as one JSON object per line, and can be compared between commits
+with :mod:`compare`.
+
+Usage: python benchmarks/run.py [--pages N] [--decks text,vector,...] [--size WxH] [--output results.jsonl] [directory]
+"""
+
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+import math
+import time
+import random
+import json
+import getopt
+import resource
+import subprocess
+
+# Use the pympress of this source tree
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic
+
+
+class OffscreenWidget(object):
+    """ Stand-in for a :class:`~Gtk.DrawingArea` registered in the :class:`~pympress.surfacecache.SurfaceCache`,
+    creating image surfaces so that no display is needed.
+
+    Args:
+        name (`str`):  the name of the widget
+    """
+    #: `str` name of the widget
+    name = None
+    #: `int` number of times the widget was asked to redraw
+    redraws = 0
+
+    def __init__(self, name):
+        self.name = name
+        self.redraws = 0
+
+
+    def get_name(self):
+        """ Get the widget's name.
+        """
+        return self.name
+
+
+    def get_window(self):
+        """ Get the widget's window, which is the widget itself.
+        """
+        return self
+
+
+    def create_similar_surface(self, content, width, height):
+        """ Create a surface to render a page, as :meth:`~Gdk.Window.create_similar_surface`.
+        """
+        import cairo
+        return cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+
+
+    def queue_draw(self):
+        """ Count redraws requested by the cache.
+        """
+        self.redraws += 1
+
+
+def timed(function, *args):
+    """ Time a call.
+
+    Returns:
+        `float`: the time the call took, in milliseconds
+    """
+    start = time.time()
+    function(*args)
+    return (time.time() - start) * 1000
+
+
+def page_size(doc, width, height, dtype):
+    """ Get the size in pixels at which a page is displayed in a widget of the given size, keeping its aspect ratio.
+    """
+    ratio = doc.page(0).get_aspect_ratio(dtype)
+    if width / float(height) > ratio:
+        return int(height * ratio), height
+    else:
+        return width, int(width / ratio)
+
+
+def max_difference(surface, other):
+    """ Get the largest difference between the pixels of two renderings of the same size.
+
+    Returns:
+        `int`: the largest difference of a colour channel, from 0 for identical renderings to 255
+    """
+    surface.flush()
+    other.flush()
+    data, other_data = bytearray(surface.get_data()), bytearray(other.get_data())
+    if data == other_data:
+        return 0
+    return max(abs(a - b) for a, b in zip(data, other_data))
+
+
+def drain(cache):
+    """ Process all the prerendering jobs of a cache, as the main loop would at idle time.
+    """
+    while cache.job_queue:
+        cache.process_jobs()
+
+
+def bench_deck(path, width, height):
+    """ Run all the benchmarks on a deck.
+
+    Args:
+        path (`str`):  the path to the PDF file
+        width (`int`):  the width of the widgets
+        height (`int`):  the height of the widgets
+
+    Returns:
+        `list` of `tuple`: the benchmark, metric, value and unit of each result
+    """
+    import cairo
+    import gi
+    gi.require_version('Poppler', '0.18')
+    from gi.repository import Poppler
+    from pympress import document, surfacecache
+
+    def open_doc(max_recording_bytes = 64 << 20):
+        poppler_doc = Poppler.Document.new_from_file(document.Document.path_to_uri(os.path.abspath(path)), None)
+        doc = document.Document(poppler_doc, path, 0, 64, max_recording_bytes)
+        doc.page_change = lambda *args: None
+        return doc
+
+    results = []
+    doc = open_doc(0)
+    dtype = document.PDF_CONTENT_PAGE if doc.has_notes() else document.PDF_REGULAR
+    ww, wh = page_size(doc, width, height, dtype)
+    nb_pages = doc.pages_number()
+
+    # Cold rendering, of each page on a newly opened document
+    times = []
+    for number in range(nb_pages):
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24, ww, wh)
+        times.append(timed(doc.page(number).render_cairo, cairo.Context(surface), ww, wh, dtype))
+    results += [
+        ('cold_render', 'mean', sum(times) / len(times), 'ms'),
+        ('cold_render', 'max', max(times), 'ms'),
+        ('cold_render', 'throughput', 1000. * len(times) / sum(times), 'pages/s'),
+    ]
+
+    # Recordings: render each page at several sizes, with Poppler and by replaying the page's recording
+    plain, recorded = open_doc(0), open_doc(1 << 40)
+    sizes = [(ww, wh), (ww * 3 // 4, wh * 3 // 4), (ww // 2, wh // 2)]
+    record_times, render_times, replay_times, differences = [], [], [], []
+    for number in range(nb_pages):
+        page = recorded.page(number)
+        page.get_annotations()
+        record_times.append(timed(recorded.get_recording, page))
+        for w, h in sizes:
+            rendered = cairo.ImageSurface(cairo.FORMAT_RGB24, w, h)
+            render_times.append(timed(plain.page(number).render_cairo, cairo.Context(rendered), w, h, dtype))
+            replayed = cairo.ImageSurface(cairo.FORMAT_RGB24, w, h)
+            replay_times.append(timed(page.render_cairo, cairo.Context(replayed), w, h, dtype))
+            differences.append(max_difference(rendered, replayed))
+    del plain, recorded
+    results += [
+        ('recording', 'record', sum(record_times) / len(record_times), 'ms'),
+        ('recording', 'render', sum(render_times) / len(render_times), 'ms'),
+        ('recording', 'replay', sum(replay_times) / len(replay_times), 'ms'),
+        ('recording', 'speedup', sum(render_times) / max(1e-6, sum(replay_times)), 'ratio'),
+        ('recording', 'max_difference', max(differences), 'levels'),
+        ('recording', 'mismatches', sum(1 for difference in differences if difference), 'renders'),
+    ]
+    if max(differences):
+        print('Replayed recordings differ from direct renders of {} by up to {} levels'.format(path, max(differences)),
+              file=sys.stderr)
+
+    # Warm cache hits
+    cache = surfacecache.SurfaceCache(doc, 1 << 40, 0, 0)
+    widget = OffscreenWidget('bench')
+    cache.add_widget(widget, dtype)
+    cache.resize_widget('bench', ww, wh)
+    for number in range(nb_pages):
+        cache.renderer('bench', number)
+
+    lookups = 100000
+    start = time.time()
+    for n in range(lookups):
+        cache.get('bench', n % nb_pages)
+    results.append(('warm_hit', 'mean', (time.time() - start) * 1e6 / lookups, 'us'))
+
+    # Navigation sweep: step forward through the deck, with occasional jumps back, prerendering like the GUI
+    doc = open_doc()
+    cache = surfacecache.SurfaceCache(doc, 512 << 20, 0, 0)
+    widget = OffscreenWidget('bench')
+    cache.add_widget(widget, dtype)
+    cache.resize_widget('bench', ww, wh)
+
+    times = []
+    for step in range(2 * nb_pages):
+        number = step // 2 if step % 10 != 9 else max(0, step // 2 - 5)
+        start = time.time()
+        doc.goto(number)
+        if cache.get('bench', number) is None:
+            cache.renderer('bench', number)
+        times.append((time.time() - start) * 1000)
+        cache.prerender(doc.prefetch_pages(number))
+        drain(cache)
+
+    stats = cache.get_stats()
+    results += [
+        ('navigation', 'mean', sum(times) / len(times), 'ms'),
+        ('navigation', 'max', max(times), 'ms'),
+        ('navigation', 'hit_rate', stats['hits'] / float(max(1, stats['hits'] + stats['misses'])), 'ratio'),
+    ]
+
+    # Resize storm: shrink and grow the widget, and display the current page after each resize
+    times = []
+    for step in range(50):
+        scale = 1. - 0.5 * abs((step % 20) - 10) / 10.
+        start = time.time()
+        cache.resize_widget('bench', int(ww * scale), int(wh * scale))
+        if cache.get('bench', 0) is None:
+            cache.renderer('bench', 0)
+        times.append((time.time() - start) * 1000)
+        drain(cache)
+
+    results += [
+        ('resize_storm', 'mean', sum(times) / len(times), 'ms'),
+        ('resize_storm', 'max', max(times), 'ms'),
+    ]
+
+    cache.shutdown()
+    results.append(('process', 'peak_rss', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, 'KiB'))
+    return results
+
+
+def bench_scribbles(width, height, count = 50, samples = 2000):
+    """ Run the benchmarks on scribbles: a long session of strokes drawn with a pen sending a sample per pixel.
+
+    Args:
+        width (`int`):  the width of the slide
+        height (`int`):  the height of the slide
+        count (`int`):  the number of strokes
+        samples (`int`):  the number of samples of the pen in each stroke
+
+    Returns:
+        `list` of `tuple`: the benchmark, metric, value and unit of each result
+    """
+    import cairo
+    from pympress import strokes
+
+    # Smooth random walks, as fractions of the slide's size, generated beforehand to time only the strokes
+    rng = random.Random(0)
+    walks = []
+    for _ in range(count):
+        x, y, angle = rng.random(), rng.random(), rng.uniform(0, 2 * math.pi)
+        walk = []
+        for _ in range(samples):
+            angle += rng.gauss(0, 0.05)
+            x = min(1., max(0., x + math.cos(angle) / width))
+            y = min(1., max(0., y + math.sin(angle) / height))
+            walk.append((x, y))
+        walks.append(walk)
+
+    session = []
+    start = time.time()
+    for walk in walks:
+        stroke = strokes.Stroke((rng.random(), rng.random(), rng.random(), 1.), 3)
+        for x, y in walk:
+            stroke.add_point(x, y)
+        session.append(stroke)
+    add_time = (time.time() - start) * 1e6 / (count * samples)
+
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    times = []
+    for _ in range(5):
+        context = cairo.Context(surface)
+        context.set_line_cap(cairo.LINE_CAP_ROUND)
+        context.set_line_join(cairo.LINE_JOIN_ROUND)
+        start = time.time()
+        for stroke in session:
+            stroke.draw(context, width, height)
+        surface.flush()
+        times.append((time.time() - start) * 1000)
+        del context
+
+    return [
+        ('scribbles', 'samples', sum(stroke.samples for stroke in session), 'points'),
+        ('scribbles', 'points', sum(len(stroke) for stroke in session), 'points'),
+        ('scribbles', 'bytes', sum(stroke.get_bytes() for stroke in session), 'B'),
+        ('scribbles', 'add_point', add_time, 'us'),
+        ('scribbles', 'draw', sum(times) / len(times), 'ms'),
+    ]
+
+
+def get_commit():
+    """ Get the commit of the source tree, to identify the results.
+
+    Returns:
+        `str`: the commit hash, or `None` if it is unknown
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd = os.path.dirname(os.path.abspath(__file__)),
+                                       stderr = subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv = sys.argv[1:]):
+    """ Generate the decks if needed, and run the benchmarks on each of them in a new process.
+    """
+    opts, args = getopt.getopt(argv, 'p:d:s:o:', ['pages=', 'decks=', 'size=', 'output=', 'deck-file=', 'scribbles'])
+    opts = dict(opts)
+
+    width, height = map(int, opts.get('-s', opts.get('--size', '1920x1080')).split('x'))
+
+    if '--deck-file' in opts:
+        # In the child process: run the benchmarks on a single deck and print the results
+        print(json.dumps(bench_deck(opts['--deck-file'], width, height)))
+        return
+    elif '--scribbles' in opts:
+        print(json.dumps(bench_scribbles(width, height)))
+        return
+
+    pages = int(opts.get('-p', opts.get('--pages', 30)))
+    names = opts.get('-d', opts.get('--decks'))
+    directory = args[0] if args else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'decks')
+    decks = synthetic.generate_all(directory, pages, names.split(',') if names else None)
+
+    output = opts.get('-o', opts.get('--output'))
+    out = open(output, 'w') if output else sys.stdout
+    commit = get_commit()
+
+    try:
+        for name, bench_args in [(name, ['--deck-file', path]) for name, path in decks] + [('scribbles', ['--scribbles'])]:
+            result = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                              '--size', '{}x{}'.format(width, height)] + bench_args)
+            for benchmark, metric, value, unit in json.loads(result.decode('utf-8').strip().splitlines()[-1]):
+                print(json.dumps({'commit': commit, 'deck': name, 'size': [width, height], 'benchmark': benchmark,
+                                  'metric': metric, 'value': value, 'unit': unit}, sort_keys = True), file = out)
+            out.flush()
+    finally:
+        if output:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
+
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       synthetic.py
+#
+#       Copyright 2018 Cimbali <me@cimba.li>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+""" Generate synthetic PDF decks to benchmark pympress, using only cairo.
+
+Each deck stresses a different part of the rendering: lots of text, lots of vector paths,
+large embedded images, beamer-style overlays (successive pages adding items to the same
+slide) and pages with notes on their right half.
+
+The generated files are deterministic, so that benchmarks can be compared between commits.
+
+Usage: python benchmarks/synthetic.py [--pages N] output_directory
+"""
+
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+import math
+import random
+import getopt
+
+import cairo
+
+
+#: Size of slides in points, 16:9 as beamer's aspectratio=169
+SLIDE_SIZE = (640., 360.)
+
+#: Size of the side of the random tile from which images are built, in pixels. Prime, so that repetitions don't align.
+NOISE_TILE = 509
+
+
+def draw_title(cr, title, width):
+    """ Draw a slide title bar.
+
+    Args:
+        cr (:class:`~cairo.Context`):  context of the PDF page
+        title (`str`):  the title text
+        width (`float`):  width of the slide
+    """
+    cr.set_source_rgb(0.1, 0.2, 0.5)
+    cr.rectangle(0, 0, width, 40)
+    cr.fill()
+
+    cr.set_source_rgb(1, 1, 1)
+    cr.select_font_face('Sans', cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_BOLD)
+    cr.set_font_size(22)
+    cr.move_to(20, 28)
+    cr.show_text(title)
+
+
+def draw_text(cr, rng, x, y, width, height, size):
+    """ Fill an area with lines of random words.
+
+    Args:
+        cr (:class:`~cairo.Context`):  context of the PDF page
+        rng (:class:`~random.Random`):  the random generator
+        x (`float`):  left of the area
+        y (`float`):  top of the area
+        width (`float`):  width of the area
+        height (`float`):  height of the area
+        size (`float`):  font size
+    """
+    cr.set_source_rgb(0, 0, 0)
+    cr.select_font_face('Serif', cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
+    cr.set_font_size(size)
+
+    chars_per_line = int(width / (size * 0.5))
+    line = y + size
+    while line < y + height:
+        words = []
+        while sum(len(w) + 1 for w in words) < chars_per_line:
+            words.append(''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 10))))
+        cr.move_to(x, line)
+        cr.show_text(' '.join(words)[:chars_per_line])
+        line += size * 1.2
+
+
+def text_page(cr, rng, number, width, height):
+    """ A slide full of small text.
+    """
+    draw_title(cr, 'Text slide {}'.format(number + 1), width)
+    draw_text(cr, rng, 20, 50, width - 40, height - 60, 7)
+
+
+def vector_page(cr, rng, number, width, height):
+    """ A slide with thousands of filled and stroked curves.
+    """
+    draw_title(cr, 'Vector slide {}'.format(number + 1), width)
+    cr.rectangle(0, 40, width, height - 40)
+    cr.clip()
+
+    for _ in range(3000):
+        cr.set_source_rgba(rng.random(), rng.random(), rng.random(), 0.5)
+        cr.move_to(rng.uniform(0, width), rng.uniform(40, height))
+        for _ in range(3):
+            cr.curve_to(*[rng.uniform(0, width) if i % 2 == 0 else rng.uniform(40, height) for i in range(6)])
+        cr.set_line_width(rng.uniform(0.2, 2))
+        if rng.random() < 0.5:
+            cr.fill()
+        else:
+            cr.stroke()
+    cr.reset_clip()
+
+
+def noise_image(rng, width, height):
+    """ Build a large image that does not compress well, by tiling random pixels with random tints.
+
+    Returns:
+        :class:`~cairo.ImageSurface`: the image
+    """
+    tile = cairo.ImageSurface(cairo.FORMAT_RGB24, NOISE_TILE, NOISE_TILE)
+    data = tile.get_data()
+    noise = bytearray(rng.getrandbits(8) for _ in range(len(data)))
+    data[:] = bytes(noise)
+    tile.mark_dirty()
+
+    image = cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+    cr = cairo.Context(image)
+    for x in range(0, width, NOISE_TILE):
+        for y in range(0, height, NOISE_TILE):
+            cr.set_source_surface(tile, x, y)
+            cr.paint()
+            cr.set_source_rgba(rng.random(), rng.random(), rng.random(), 0.3)
+            cr.rectangle(x, y, NOISE_TILE, NOISE_TILE)
+            cr.fill()
+    del cr
+    image.flush()
+    return image
+
+
+def image_page(cr, rng, number, width, height):
+    """ A slide with a large image, of 2400x1350 pixels.
+    """
+    draw_title(cr, 'Image slide {}'.format(number + 1), width)
+
+    image = noise_image(rng, 2400, 1350)
+    cr.save()
+    cr.translate(20, 50)
+    cr.scale((width - 40) / image.get_width(), (height - 60) / image.get_height())
+    cr.set_source_surface(image, 0, 0)
+    cr.paint()
+    cr.restore()
+
+
+def overlay_page(cr, rng, number, width, height):
+    """ A beamer-style slide, successive pages uncover one more item of the same list.
+    """
+    items = 6
+    slide, shown = divmod(number, items)
+    rng = random.Random(slide)
+
+    draw_title(cr, 'Overlay slide {}'.format(slide + 1), width)
+    cr.select_font_face('Sans', cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
+    cr.set_font_size(16)
+
+    for item in range(items):
+        text = ' '.join(''.join(rng.choice('abcdefghij') for _ in range(6)) for _ in range(5))
+        # Covered items are shown in light grey, as with \setbeamercovered{transparent}
+        cr.set_source_rgb(*((0, 0, 0) if item <= shown else (0.85, 0.85, 0.85)))
+        cr.arc(40, 75 + item * 45, 4, 0, 2 * math.pi)
+        cr.fill()
+        cr.move_to(55, 80 + item * 45)
+        cr.show_text(text)
+
+
+def notes_page(cr, rng, number, width, height):
+    """ A slide with notes on its right half, as produced by beamer's show notes on second screen=right.
+    """
+    half = width / 2
+
+    draw_title(cr, 'Slide with notes {}'.format(number + 1), half)
+    for _ in range(200):
+        cr.set_source_rgba(rng.random(), rng.random(), rng.random(), 0.6)
+        cr.rectangle(rng.uniform(20, half - 60), rng.uniform(50, height - 60), rng.uniform(5, 40), rng.uniform(5, 40))
+        cr.fill()
+
+    cr.set_source_rgb(1, 1, 0.9)
+    cr.rectangle(half, 0, half, height)
+    cr.fill()
+    draw_text(cr, rng, half + 20, 20, half - 40, height - 40, 10)
+
+
+#: The decks that can be generated: name, function drawing a page, whether pages have notes,
+#: and maximum number of pages (images take about 10MB per page)
+DECKS = [
+    ('text', text_page, False, None),
+    ('vector', vector_page, False, None),
+    ('images', image_page, False, 8),
+    ('overlays', overlay_page, False, None),
+    ('notes', notes_page, True, None),
+]
+
+
+def generate(path, draw_page, pages, notes = False):
+    """ Generate a PDF deck.
+
+    Args:
+        path (`str`):  the path of the PDF file to write
+        draw_page (`function`):  the function drawing each page
+        pages (`int`):  the number of pages in the deck
+        notes (`bool`):  whether pages are twice as wide, with notes on the right half
+    """
+    width, height = SLIDE_SIZE
+    if notes:
+        width *= 2
+
+    surface = cairo.PDFSurface(path, width, height)
+    cr = cairo.Context(surface)
+    for number in range(pages):
+        rng = random.Random(number)
+        cr.save()
+        cr.set_source_rgb(1, 1, 1)
+        cr.paint()
+        draw_page(cr, rng, number, width, height)
+        cr.restore()
+        cr.show_page()
+
+    del cr
+    surface.finish()
+
+
+def generate_all(directory, pages = 30, names = None):
+    """ Generate the synthetic decks that do not exist yet.
+
+    Args:
+        directory (`str`):  where to write the PDF files
+        pages (`int`):  the number of pages in each deck
+        names (`list` of `str`):  the decks to generate, all of them if `None`
+
+    Returns:
+        `list` of `tuple`: the names and paths of the decks
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    decks = []
+    for name, draw_page, notes, max_pages in DECKS:
+        if names is not None and name not in names:
+            continue
+
+        count = min(pages, max_pages) if max_pages else pages
+        path = os.path.join(directory, '{}-{}.pdf'.format(name, count))
+        if not os.path.exists(path):
+            generate(path, draw_page, count, notes)
+        decks.append((name, path))
+
+    return decks
+
+
+def main(argv = sys.argv[1:]):
+    """ Generate all the decks in the given directory.
+    """
+    opts, args = getopt.getopt(argv, 'p:', ['pages='])
+    opts = dict(opts)
+    pages = int(opts.get('-p', opts.get('--pages', 30)))
+
+    for name, path in generate_all(args[0] if args else 'decks', pages):
+        print(name, path)
+
+
+if __name__ == '__main__':
+    main()
+
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
@@ -30,4 +30,4 @@ __copyright__= """2009, 2010 Thomas Jost <thomas.jost@gmail.com>
 2016 Epithumia <endless@airelle.info>
 """
 
-__all__ = ['builder', 'config', 'document', 'editable_label', 'extras', 'media_overlay', 'pointer', 'scribble', 'surfacecache', 'talk_time', 'ui', 'util']
+__all__ = ['builder', 'config', 'diskcache', 'document', 'editable_label', 'export', 'extras', 'media_overlay', 'pointer', 'prefetch', 'render_pool', 'scribble', 'strokes', 'surfacecache', 'talk_time', 'tilecache', 'ui', 'util']
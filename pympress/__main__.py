@@ -35,6 +35,7 @@ import locale
 import gettext
 import ctypes
 import tempfile
+import multiprocessing
 
 from pympress import util
 
@@ -115,6 +116,8 @@ def main(argv = sys.argv[1:]):
 
 
 if __name__ == "__main__":
+    # Required by the render workers when pympress is frozen into an executable
+    multiprocessing.freeze_support()
     main()
 
 ##
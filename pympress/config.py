@@ -125,8 +125,41 @@ class Config(configparser.ConfigParser, object): # python 2 fix
 
         config.read(config.path_to_config())
 
-        if not config.has_option('cache', 'maxpages'):
-            config.set('cache', 'maxpages', '200')
+        if config.has_option('cache', 'maxpages'):
+            # Obsolete: the cache was bounded by a number of pages per widget, 200 by default
+            if not config.has_option('cache', 'maxmemory'):
+                try:
+                    maxmemory = max(64, config.getint('cache', 'maxpages') * 512 // 200)
+                    config.set('cache', 'maxmemory', str(maxmemory))
+                    logger.warning('Replaced obsolete option maxpages of the [cache] section by maxmemory = {} (MiB)'
+                                   .format(maxmemory))
+                except ValueError:
+                    logger.warning('Ignoring invalid obsolete option maxpages of the [cache] section')
+            config.remove_option('cache', 'maxpages')
+
+        if not config.has_option('cache', 'maxmemory'):
+            config.set('cache', 'maxmemory', '512')
+
+        if not config.has_option('cache', 'workers'):
+            config.set('cache', 'workers', '2')
+
+        if not config.has_option('cache', 'maxdisk'):
+            config.set('cache', 'maxdisk', '1024')
+
+        if not config.has_option('cache', 'diskformat'):
+            config.set('cache', 'diskformat', 'raw')
+
+        if not config.has_option('cache', 'loadedpages'):
+            config.set('cache', 'loadedpages', '64')
+
+        if not config.has_option('cache', 'maxtiles'):
+            config.set('cache', 'maxtiles', '128')
+
+        if not config.has_option('cache', 'maxrecordings'):
+            config.set('cache', 'maxrecordings', '64')
+
+        if not config.has_option('cache', 'maxcompressed'):
+            config.set('cache', 'maxcompressed', '256')
 
         if not config.has_option('content', 'xalign'):
             config.set('content', 'xalign', '0.50')
@@ -173,6 +206,9 @@ class Config(configparser.ConfigParser, object): # python 2 fix
         if not config.has_option('scribble', 'width'):
             config.set('scribble', 'width', '8')
 
+        if not config.has_option('scribble', 'save_to_file'):
+            config.set('scribble', 'save_to_file', 'off')
+
         config.load_window_layouts()
 
 
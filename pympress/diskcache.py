@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+#
+#       diskcache.py
+#
+#       Copyright 2018 Cimbali <me@cimba.li>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+"""
+:mod:`pympress.diskcache` -- rendered pages stored on disk
+----------------------------------------------------------
+
+This module is a second-level cache for the :class:`~pympress.surfacecache.SurfaceCache`:
+rendered pages are saved in the user's cache directory, so that they do not have to be
+rendered again when the same document is opened later, or when a widget gets back to a
+size it had before.
+
+Pages are identified by a hash of the path, size and modification time of the PDF file,
+so that a modified file does not use outdated pages, and by the page number, the size of the rendered page and
+the type of page (regular, content or notes). The least recently used files are removed
+when the cache grows beyond its size limit.
+
+Pixels are stored either raw or compressed. Raw files are memory-mapped and wrapped in a
+:class:`~cairo.ImageSurface` without copying or decoding: the pixels are only read from disk
+(or from the page cache of the OS) when the page is painted. Compressed files use less disk
+space, but have to be decompressed entirely when loaded.
+
+Files are written by a background thread, so that compressing pages does not slow the GUI.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import mmap
+import zlib
+import struct
+import hashlib
+import threading
+
+try:
+    from queue import Queue, Full
+except ImportError:
+    from Queue import Queue, Full
+
+try:
+    from urllib.request import url2pathname
+except ImportError:
+    from urllib import url2pathname
+
+import cairo
+
+from pympress.util import IS_MAC_OS, IS_WINDOWS
+
+
+#: Header of the cached files: magic string, width, height and stride of the pixels
+HEADER = struct.Struct(str('<4sIII'))
+
+#: Magic string identifying zlib-compressed pixels in :const:`~cairo.FORMAT_RGB24`
+MAGIC_ZLIB = b'PMZ1'
+
+#: Magic string identifying raw pixels in :const:`~cairo.FORMAT_RGB24`, starting at offset :const:`RAW_OFFSET`
+MAGIC_RAW = b'PMR1'
+
+#: Offset of the pixels in raw files, so that they can be memory-mapped on their own
+RAW_OFFSET = mmap.ALLOCATIONGRANULARITY
+
+#: Magic strings of the formats in which pages can be stored, by name
+FORMATS = {'zlib': MAGIC_ZLIB, 'raw': MAGIC_RAW}
+
+#: Pixel format of the cached pages
+PIXEL_FORMAT = cairo.FORMAT_RGB24
+
+
+def to_image_surface(surface, width, height):
+    """ Get an image surface with the content of a surface, to be able to access its pixels.
+
+    Args:
+        surface (:class:`~cairo.Surface`):  the surface, e.g. created similar to a window
+        width (`int`):  the width of the surface
+        height (`int`):  the height of the surface
+
+    Returns:
+        :class:`~cairo.ImageSurface`: the surface itself if it was an image surface, or a copy
+    """
+    if isinstance(surface, cairo.ImageSurface) and surface.get_format() == PIXEL_FORMAT:
+        return surface
+
+    image = cairo.ImageSurface(PIXEL_FORMAT, width, height)
+    context = cairo.Context(image)
+    context.set_source_surface(surface, 0, 0)
+    context.paint()
+    del context
+    image.flush()
+    return image
+
+
+class DiskCache(object):
+    """ Rendered pages cache, stored on disk and shared between runs of pympress.
+
+    Args:
+        max_bytes (`int`): The maximum size of all the files in the cache, in bytes
+        file_format (`str`): The format in which pages are stored, one of the keys of :const:`FORMATS`
+    """
+    #: `int` maximum size of all the files in the cache, in bytes
+    max_bytes = 1 << 30
+    #: `bytes` magic string of the format in which new pages are stored
+    magic = MAGIC_RAW
+    #: `str` the directory where all the pages are cached
+    cache_dir = None
+    #: `str` the directory where the pages of the current document are cached, or `None`
+    doc_dir = None
+    #: `dict` mapping all the cached files' paths to their sizes
+    file_sizes = {}
+    #: `int` size of all the files in the cache, in bytes
+    total_bytes = 0
+    #: :class:`~threading.Lock` protecting :attr:`file_sizes` and :attr:`total_bytes`
+    lock = None
+    #: :class:`~Queue.Queue` of files to be written by the writer thread
+    write_queue = None
+    #: `int` maximum number of pages waiting to be written, further pages are not saved
+    max_queued_writes = 16
+    #: `int` number of pages that were not saved because too many pages were waiting to be written
+    dropped_writes = 0
+
+    #: `int` number of pages loaded from the disk
+    hits = 0
+    #: `int` number of pages that were looked for but not found on disk
+    misses = 0
+
+    @staticmethod
+    def path_to_cache():
+        """ Return the OS-specific path to the cache directory.
+        """
+        if IS_WINDOWS:
+            return os.path.join(os.environ.get('LOCALAPPDATA', os.environ['APPDATA']), 'pympress', 'cache')
+        elif IS_MAC_OS:
+            return os.path.expanduser('~/Library/Caches/pympress')
+        else:
+            return os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'pympress')
+
+
+    def __init__(self, max_bytes, file_format = 'raw'):
+        self.max_bytes = max_bytes
+        try:
+            self.magic = FORMATS[file_format]
+        except KeyError:
+            logger.warning('Unknown disk cache format {}, using raw'.format(file_format))
+            self.magic = MAGIC_RAW
+        self.cache_dir = self.path_to_cache()
+        self.lock = threading.Lock()
+        self.file_sizes = {}
+        self.total_bytes = 0
+
+        for dirpath, dirnames, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                self.file_sizes[path] = os.path.getsize(path)
+        self.total_bytes = sum(self.file_sizes.values())
+
+        self.write_queue = Queue(self.max_queued_writes)
+        writer = threading.Thread(target = self.writer, name = 'pympress disk cache writer')
+        writer.daemon = True
+        writer.start()
+
+
+    @staticmethod
+    def hash_file(path):
+        """ Compute the hash identifying a version of a file, by which its pages are stored.
+
+        The content of the file is not read, as it would take too long for large documents:
+        the file is identified by its path, size and modification time.
+
+        Args:
+            path (`str`):  path to the file
+
+        Returns:
+            `str`: The hexadecimal hash of the file
+        """
+        stat = os.stat(path)
+        key = '{}\0{}\0{}'.format(os.path.realpath(path), stat.st_size, stat.st_mtime)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+    def set_document(self, path):
+        """ Select the document for which pages are cached.
+
+        Args:
+            path (`str`):  the path or URI to the PDF file, or `None` if there is no document
+        """
+        self.doc_dir = None
+        if path is None:
+            return
+
+        if path.startswith('file://'):
+            path = url2pathname(path[len('file://'):])
+
+        try:
+            self.doc_dir = os.path.join(self.cache_dir, self.hash_file(path))
+            if not os.path.isdir(self.doc_dir):
+                os.makedirs(self.doc_dir)
+        except (IOError, OSError):
+            logger.warning('Can not cache pages of {} on disk'.format(path), exc_info = True)
+            self.doc_dir = None
+
+
+    def get_path(self, page_nb, ww, wh, wtype):
+        """ Get the path of the file caching a page.
+
+        Args:
+            page_nb (`int`):  number of the page
+            ww (`int`):  width of the rendered page
+            wh (`int`):  height of the rendered page
+            wtype (`int`):  type of the page, see :attr:`~pympress.surfacecache.SurfaceCache.surface_type`
+
+        Returns:
+            `str`: the path to the file
+        """
+        return os.path.join(self.doc_dir, '{}-{}-{}x{}.page'.format(page_nb, wtype, ww, wh))
+
+
+    def load(self, page_nb, ww, wh, wtype):
+        """ Get a cached page from disk.
+
+        Args:
+            page_nb (`int`):  number of the page
+            ww (`int`):  width of the rendered page
+            wh (`int`):  height of the rendered page
+            wtype (`int`):  type of the page, see :attr:`~pympress.surfacecache.SurfaceCache.surface_type`
+
+        Returns:
+            :class:`~cairo.ImageSurface`: the page if it was cached, `None` otherwise
+        """
+        if self.doc_dir is None:
+            return None
+
+        path = self.get_path(page_nb, ww, wh, wtype)
+        try:
+            with open(path, 'rb') as f:
+                magic, width, height, stride = HEADER.unpack(f.read(HEADER.size))
+                if magic not in FORMATS.values() or (width, height) != (ww, wh):
+                    raise ValueError('Invalid cached page header')
+
+                if magic == MAGIC_RAW:
+                    if os.fstat(f.fileno()).st_size != RAW_OFFSET + stride * height:
+                        raise ValueError('Invalid cached page size')
+                    # Copy-on-write mapping: pages are read lazily, and the file is never modified
+                    data = mmap.mmap(f.fileno(), stride * height, access = mmap.ACCESS_COPY, offset = RAW_OFFSET)
+                else:
+                    data = bytearray(zlib.decompress(f.read()))
+                    if len(data) != stride * height:
+                        raise ValueError('Invalid cached page size')
+
+            # Mark as recently used
+            os.utime(path, None)
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        except (ValueError, struct.error, zlib.error):
+            logger.warning('Removing invalid cached page {}'.format(path), exc_info = True)
+            self.remove(path)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return cairo.ImageSurface.create_for_data(data, PIXEL_FORMAT, width, height, stride)
+
+
+    def store(self, page_nb, ww, wh, wtype, surface):
+        """ Queue a rendered page to be saved on disk.
+
+        The page is dropped if the writer thread is too far behind, rather than keeping many pages in memory.
+
+        Args:
+            page_nb (`int`):  number of the page
+            ww (`int`):  width of the rendered page
+            wh (`int`):  height of the rendered page
+            wtype (`int`):  type of the page, see :attr:`~pympress.surfacecache.SurfaceCache.surface_type`
+            surface (:class:`~cairo.Surface`):  the rendered page, which must not be modified afterwards
+        """
+        if self.doc_dir is None or self.max_bytes <= 0:
+            return
+        elif self.write_queue.full():
+            self.dropped_writes += 1
+            return
+
+        path = self.get_path(page_nb, ww, wh, wtype)
+        with self.lock:
+            if path in self.file_sizes:
+                return
+
+        # Image surfaces are read by the writer thread, but other surfaces, e.g. Xlib surfaces, only on the main thread
+        image = to_image_surface(surface, ww, wh)
+        header = HEADER.pack(self.magic, ww, wh, image.get_stride())
+        try:
+            self.write_queue.put_nowait((path, header, image))
+        except Full:
+            self.dropped_writes += 1
+
+
+    def writer(self):
+        """ Write the queued pages to disk, runs forever in a background thread.
+        """
+        while True:
+            path, header, image = self.write_queue.get()
+            tmp_path = path + '.tmp'
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(header)
+                    if header.startswith(MAGIC_RAW):
+                        f.seek(RAW_OFFSET)
+                        f.write(image.get_data())
+                    else:
+                        f.write(zlib.compress(image.get_data(), 1))
+
+                if os.path.exists(path):
+                    os.remove(path)
+                os.rename(tmp_path, path)
+
+                with self.lock:
+                    # The file may replace one that was already counted
+                    self.total_bytes -= self.file_sizes.get(path, 0)
+                    self.file_sizes[path] = os.path.getsize(path)
+                    self.total_bytes += self.file_sizes[path]
+            except (IOError, OSError):
+                logger.warning('Can not write cached page {}'.format(path), exc_info = True)
+                continue
+
+            self.evict()
+
+
+    def remove(self, path):
+        """ Remove a file from the cache.
+
+        Args:
+            path (`str`):  path of the file to remove
+        """
+        try:
+            os.remove(path)
+        except OSError:
+            if os.path.exists(path):
+                logger.warning('Can not remove cached page {}'.format(path), exc_info = True)
+                return
+
+        with self.lock:
+            self.total_bytes -= self.file_sizes.pop(path, 0)
+
+
+    def evict(self):
+        """ Remove the least recently used files until the cache is within :attr:`max_bytes`.
+        """
+        with self.lock:
+            if self.total_bytes <= self.max_bytes:
+                return
+            paths = list(self.file_sizes)
+
+        def last_use(path):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return 0
+
+        for path in sorted(paths, key = last_use):
+            if self.total_bytes <= self.max_bytes:
+                break
+            self.remove(path)
+
+
+    def get_stats(self):
+        """ Get statistics about the disk cache usage.
+
+        Returns:
+            `dict`: the hits, misses and dropped writes counts, the number of cached files and the bytes they use
+        """
+        with self.lock:
+            return {
+                'format': [name for name, magic in FORMATS.items() if magic == self.magic][0],
+                'hits': self.hits,
+                'misses': self.misses,
+                'dropped_writes': self.dropped_writes,
+                'files': len(self.file_sizes),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
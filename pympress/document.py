@@ -31,7 +31,18 @@ future).
 An important point is that this module is *completely* independant from the GUI:
 there should not be any GUI-related code here, except for page rendering (and
 only rendering itself: the preparation of the target surface must be done
-elsewhere).
+elsewhere). It only needs Poppler and cairo, not Gtk, so that it can be used
+without a display, e.g. by the prerendering workers or in batch scripts.
+
+The drawing operations of the most recently rendered pages are kept in recording surfaces,
+within a memory budget, so that rendering them again at another size, e.g. when a widget is
+resized or when zooming, replays these operations instead of parsing the PDF content and
+decoding images again.
+
+Pages can be fingerprinted from a low resolution rendering and their text, so that
+pages that probably look identical (e.g. repeated slides) are recognized, and so that
+the regions that probably differ between successive pages (e.g. overlays uncovering
+one more item) are known.
 """
 
 from __future__ import print_function, unicode_literals
@@ -40,11 +51,17 @@ import logging
 logger = logging.getLogger(__name__)
 
 import os
+import math
+import zlib
+import array
+import hashlib
 import tempfile
+import collections
 import mimetypes
 import webbrowser
 
 import gi
+import cairo
 gi.require_version('Poppler', '0.18')
 from gi.repository import Poppler
 
@@ -56,8 +73,25 @@ except ImportError:
     from urllib import pathname2url
 
 
-from pympress.ui import PDF_REGULAR, PDF_CONTENT_PAGE, PDF_NOTES_PAGE
 from pympress.util import fileopen
+from pympress.prefetch import NavigationPredictor, NAV_JUMP, NAV_LINK, NAV_HISTORY
+
+
+#: "Regular" PDF file (without notes)
+PDF_REGULAR      = 0
+#: Content page (left side) of a PDF file with notes
+PDF_CONTENT_PAGE = 1
+#: Notes page (right side) of a PDF file with notes
+PDF_NOTES_PAGE   = 2
+
+#: Width in pixels of the low resolution rendering from which pages are fingerprinted
+FINGERPRINT_WIDTH = 256
+#: Size in pixels of the square cells of the fingerprint rendering, compared to find the regions that differ between pages
+FINGERPRINT_CELL = 8
+#: Estimated size in bytes of the drawing operations of a recorded page, besides its images
+RECORDING_OVERHEAD = 64 << 10
+#: Estimated resolution of the images of recorded pages, in pixels per point (i.e. 144 dpi)
+RECORDING_IMAGE_SCALE = 2
 
 
 def get_extension(mime_type):
@@ -76,6 +110,177 @@ def get_extension(mime_type):
             return ext
 
 
+def record_poppler_page(page):
+    """ Record the drawing operations of a Poppler page, so that it can be rendered again at any size without Poppler.
+
+    Args:
+        page (:class:`~Poppler.Page`):  the page to record
+
+    Returns:
+        :class:`~cairo.RecordingSurface`: the drawing of the whole page, in points
+    """
+    pw, ph = page.get_size()
+    recording = cairo.RecordingSurface(cairo.CONTENT_COLOR_ALPHA, (0, 0, pw, ph))
+    context = cairo.Context(recording)
+    page.render(context)
+    del context
+    return recording
+
+
+def recording_bytes(page):
+    """ Estimate the memory used by the recording of a Poppler page, see :func:`record_poppler_page`.
+
+    Recordings keep a copy of the decoded images of the page, which make up most of their size.
+    Decoding the images to measure them would cost about as much as recording the page, so their
+    size is estimated from the area they cover, at :const:`RECORDING_IMAGE_SCALE` pixels per point
+    and 4 bytes per pixel.
+
+    Args:
+        page (:class:`~Poppler.Page`):  the page to record
+
+    Returns:
+        `int`: the estimated size of the recording, in bytes
+    """
+    size = RECORDING_OVERHEAD
+    for mapping in page.get_image_mapping():
+        area = mapping.area
+        width, height = abs(area.x2 - area.x1) * RECORDING_IMAGE_SCALE, abs(area.y2 - area.y1) * RECORDING_IMAGE_SCALE
+        size += 4 * int(math.ceil(width)) * int(math.ceil(height))
+    return size
+
+
+def render_poppler_page(page, cr, ww, wh, dtype=PDF_REGULAR, recording=None):
+    """ Render a Poppler page on a Cairo surface.
+
+    This only needs the :class:`~Poppler.Page`, so that it can be used in processes that
+    do not build a full :class:`~pympress.document.Page` (e.g. the prerendering workers).
+
+    Args:
+        page (:class:`~Poppler.Page`):  the page to render
+        cr (:class:`~Gdk.CairoContext`):  target surface
+        ww (`int`):  target width in pixels
+        wh (`int`):  target height in pixels
+        dtype (`int`):  the type of document that should be rendered
+        recording (:class:`~cairo.RecordingSurface`):  the page recorded by :func:`record_poppler_page`, replayed
+                                                       instead of rendering the page with Poppler if it is not `None`
+    """
+    pw, ph = page.get_size()
+    if dtype != PDF_REGULAR:
+        pw /= 2.
+
+    cr.set_source_rgb(1, 1, 1)
+
+    # Scale
+    scale = min(ww/pw, wh/ph)
+    cr.scale(scale, scale)
+
+    # Clip to the rendered (half) page, so that Poppler skips drawing what is outside
+    cr.rectangle(0, 0, pw, ph)
+    cr.clip()
+    cr.paint()
+
+    # For "regular" pages, there is no problem: just render them.
+    # For "content" or "notes" pages (i.e. left or right half of a page),
+    # the widget already has correct dimensions so we don't need to deal
+    # with that. But for right halfs we must translate the output in order
+    # to only show the right half.
+    if dtype == PDF_NOTES_PAGE:
+        cr.translate(-pw, 0)
+
+    if recording is not None:
+        cr.set_source_surface(recording, 0, 0)
+        cr.paint()
+    else:
+        page.render(cr)
+
+
+def fingerprint_poppler_page(page, dtype=PDF_REGULAR):
+    """ Compute the fingerprint of a Poppler page, from a low resolution rendering and its text.
+
+    Like :func:`render_poppler_page`, this only needs the :class:`~Poppler.Page`, so that pages can
+    be fingerprinted by the prerendering workers. Pages with the same fingerprint are only likely to
+    look the same: their renderings must still be compared before being used in place of one another.
+
+    Args:
+        page (:class:`~Poppler.Page`):  the page to fingerprint
+        dtype (`int`):  the type of document that should be rendered
+
+    Returns:
+        `tuple`: a `str` digest of what the page looks like, the `array` of checksums of the
+        :const:`FINGERPRINT_CELL` pixels wide cells of the rendering, row by row, and the size of the rendering
+    """
+    pw, ph = page.get_size()
+    area = Poppler.Rectangle()
+    area.x1, area.y1, area.x2, area.y2 = (pw / 2. if dtype == PDF_NOTES_PAGE else 0), 0, \
+                                         (pw / 2. if dtype == PDF_CONTENT_PAGE else pw), ph
+    if dtype != PDF_REGULAR:
+        pw /= 2.
+
+    fw, fh = FINGERPRINT_WIDTH, max(1, int(round(FINGERPRINT_WIDTH * ph / pw)))
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, fw, fh)
+    context = cairo.Context(surface)
+    render_poppler_page(page, context, fw, fh, dtype)
+    del context
+    surface.flush()
+
+    data, stride = bytes(surface.get_data()), surface.get_stride()
+    cols, rows = -(-fw // FINGERPRINT_CELL), -(-fh // FINGERPRINT_CELL)
+    line_bytes = 4 * FINGERPRINT_CELL
+
+    cells = array.array(str('I'), [0] * (cols * rows))
+    for y in range(fh):
+        line = data[y * stride:y * stride + 4 * fw]
+        for col in range(cols):
+            cell = (y // FINGERPRINT_CELL) * cols + col
+            cells[cell] = zlib.crc32(line[col * line_bytes:(col + 1) * line_bytes], cells[cell]) & 0xffffffff
+
+    digest = hashlib.sha1(data)
+    digest.update((page.get_text_for_area(area) or '').encode('utf-8'))
+    return digest.hexdigest(), cells, (fw, fh)
+
+
+def read_annotations(page):
+    """ Read the text of the annotations of a Poppler page, and remove the text-only annotations so they are not rendered.
+
+    Args:
+        page (:class:`~Poppler.Page`):  the page whose annotations are read
+
+    Returns:
+        `tuple`: the `list` of the annotations' texts, and the `list` of :class:`~Poppler.AnnotMapping`
+        for the annotations that may need an action (media, attachments)
+    """
+    contents, action_annots = [], []
+
+    for annotation in page.get_annot_mapping():
+        content = annotation.annot.get_contents()
+        if content:
+            contents.append(content)
+
+        annot_type = annotation.annot.get_annot_type()
+        if annot_type == Poppler.AnnotType.LINK:
+            # just an Annot, not subclassed -- probably redundant with links
+            continue
+        elif annot_type in {Poppler.AnnotType.MOVIE, Poppler.AnnotType.SCREEN, Poppler.AnnotType.FILE_ATTACHMENT}:
+            action_annots.append(annotation)
+        elif annot_type in {Poppler.AnnotType.TEXT, Poppler.AnnotType.POPUP,
+                            Poppler.AnnotType.FREE_TEXT}:
+            # text-only annotations, hide them from screen
+            page.remove_annot(annotation.annot)
+        elif annot_type in {Poppler.AnnotType.STRIKE_OUT, Poppler.AnnotType.HIGHLIGHT,
+                            Poppler.AnnotType.UNDERLINE, Poppler.AnnotType.SQUIGGLY,
+                            Poppler.AnnotType.POLYGON, Poppler.AnnotType.POLY_LINE,
+                            Poppler.AnnotType.SQUARE, Poppler.AnnotType.CIRCLE,
+                            Poppler.AnnotType.CARET, Poppler.AnnotType.LINE,
+                            Poppler.AnnotType.STAMP, Poppler.AnnotType.INK}:
+            # Poppler already renders annotation of these types, nothing more can be done
+            # even though the rendering isn't always perfect.
+            continue
+        else:
+            logger.warning(_("Pympress can not interpret annotation of type:") + " {} ".format(annot_type))
+
+    return contents, action_annots
+
+
 class Link(object):
     """ This class encapsulates one hyperlink of the document.
 
@@ -85,6 +290,7 @@ class Link(object):
         x2 (`float`):  second x coordinate of the link rectangle
         y2 (`float`):  second y coordinate of the link rectangle
         action (`function`):  action to perform when the link is clicked
+        dest (`int`):  number of the page to which the link leads, if it is a link inside the document
     """
 
     #: `float`, first x coordinate of the link rectangle
@@ -97,10 +303,13 @@ class Link(object):
     y2 = None
     #: `function`, action to be perform to follow this link
     follow = lambda *args: logger.error(_("no action defined for this link!"))
+    #: `int`, number of the page to which the link leads, or `None` if it does not lead to a page of the document
+    dest = None
 
-    def __init__(self, x1, y1, x2, y2, action):
+    def __init__(self, x1, y1, x2, y2, action, dest = None):
         self.x1, self.y1, self.x2, self.y2 = x1, y1, x2, y2
         self.follow = action
+        self.dest = dest
 
 
     def is_over(self, x, y):
@@ -152,47 +361,95 @@ class Page(object):
     page = None
     #: `int`, number of the current page (starting from 0)
     page_nb = -1
-    #: All the links in the page, as a `list` of :class:`~pympress.document.Link` instances
-    links = []
-    #: All the media in the page, as a `list` of tuples of (area, filename)
-    medias = []
     #: `float`, page width
     pw = 0.
     #: `float`, page height
     ph = 0.
-    #: All text annotations
-    annotations = []
     #: Instance of :class:`~pympress.document.Document` that contains this page.
     parent = None
 
+    #: The links of the page's link mapping, as a `list` of :class:`~pympress.document.Link`, or `None` until read
+    _links = None
+    #: The links built from annotations (media, attachments), as a `list` of :class:`~pympress.document.Link`,
+    #: or `None` until read
+    _annot_links = None
+    #: The media in the page, as a `list` of tuples of (area, filename, show controls), or `None` until read
+    _medias = None
+    #: The text of the annotations, as a `list` of `str`, or `None` until read
+    _annotations = None
+    #: The :class:`~Poppler.AnnotMapping` that may need an action, e.g. media, read along with :attr:`_annotations`
+    _action_annots = None
+
     def __init__(self, page, number, parent):
         self.page = page
         self.page_nb = number
         self.parent = parent
-        self.links = []
-        self.medias = []
-        self.annotations = []
 
-        # Read page size
+        # Read page size, everything else is read when first needed
         self.pw, self.ph = self.page.get_size()
 
-        # Read links on the page
-        for link in self.page.get_link_mapping():
-            action = self.get_link_action(link.action.type, link.action)
-            my_link = Link(link.area.x1, link.area.y1, link.area.x2, link.area.y2, action)
-            self.links.append(my_link)
 
-        # Read annotations, in particular those that indicate media
-        for annotation in self.page.get_annot_mapping():
-            content = annotation.annot.get_contents()
-            if content:
-                self.annotations.append(content)
+    @property
+    def links(self):
+        """ All the links in the page, as a `list` of :class:`~pympress.document.Link` instances
+        """
+        if self._annot_links is None:
+            self._read_annotation_actions()
+        return self._read_links() + self._annot_links
+
+
+    @property
+    def medias(self):
+        """ All the media in the page, as a `list` of tuples of (area, filename, show controls)
+        """
+        if self._annot_links is None:
+            self._read_annotation_actions()
+        return self._medias
+
+
+    @property
+    def annotations(self):
+        """ All text annotations, as a `list` of `str`
+        """
+        self._read_annotations()
+        return self._annotations
+
+
+    def _read_links(self):
+        """ Read the links of the page, resolving their destinations.
+
+        Returns:
+            `list` of :class:`~pympress.document.Link`: the links of the page's link mapping
+        """
+        if self._links is None:
+            self._links = []
+            for link in self.page.get_link_mapping():
+                action = self.get_link_action(link.action.type, link.action)
+                dest = self.get_link_dest(link.action.type, link.action)
+                self._links.append(Link(link.area.x1, link.area.y1, link.area.x2, link.area.y2, action, dest))
+
+        return self._links
+
+
+    def _read_annotations(self):
+        """ Read the text of the annotations, and hide the text-only annotations, which must happen before rendering.
+        """
+        if self._annotations is None:
+            contents, self._action_annots = read_annotations(self.page)
+            # Text-only annotations are removed when first read, so their text must outlive this Page
+            self._annotations = self.parent.page_annotations.setdefault(self.page_nb, contents)
+
 
+    def _read_annotation_actions(self):
+        """ Read the annotations that indicate media or attachments, extracting files if needed.
+        """
+        self._read_annotations()
+        self._annot_links = []
+        self._medias = []
+
+        for index, annotation in enumerate(self._action_annots):
             annot_type = annotation.annot.get_annot_type()
-            if annot_type == Poppler.AnnotType.LINK:
-                # just an Annot, not subclassed -- probably redundant with links
-                continue
-            elif annot_type == Poppler.AnnotType.MOVIE:
+            if annot_type == Poppler.AnnotType.MOVIE:
                 movie = annotation.annot.get_movie()
                 filepath = self.parent.get_full_path(movie.get_filename())
                 if filepath:
@@ -203,47 +460,54 @@ class Page(object):
                     relative_margins.y1 = annotation.area.y1 / self.ph       # bottom
                     relative_margins.y2 = 1.0 - annotation.area.y2 / self.ph # top
                     media = (relative_margins, filepath, movie.show_controls())
-                    self.medias.append(media)
+                    self._medias.append(media)
                     action = Link.build_closure(self.parent.play_media, hash(media))
                 else:
                     logger.error(_("Pympress can not find file ") + movie.get_filename())
                     continue
             elif annot_type == Poppler.AnnotType.SCREEN:
                 action_obj = annotation.annot.get_action()
-                action = self.get_annot_action(action_obj.any.type, action_obj, annotation.area)
+                action = self.get_annot_action(action_obj.any.type, action_obj, annotation.area, index)
                 if not action:
                     continue
             elif annot_type == Poppler.AnnotType.FILE_ATTACHMENT:
                 attachment = annotation.annot.get_attachment()
                 prefix, ext = os.path.splitext(attachment.name)
-                with tempfile.NamedTemporaryFile('wb', suffix=ext, prefix=prefix, delete=False) as f:
-                    # now the file name is shotgunned
-                    filename=f.name
-                    self.parent.remove_on_exit(filename)
-                if not attachment.save(filename):
+                filename = self.parent.extract_file((self.page_nb, index), attachment.save, prefix, ext)
+                if filename is None:
                     logger.error(_("Pympress can not extract attached file"))
                     continue
                 action = Link.build_closure(fileopen, filename)
-            elif annot_type in {Poppler.AnnotType.TEXT, Poppler.AnnotType.POPUP,
-                                Poppler.AnnotType.FREE_TEXT}:
-                # text-only annotations, hide them from screen
-                self.page.remove_annot(annotation.annot)
-                continue
-            elif annot_type in {Poppler.AnnotType.STRIKE_OUT, Poppler.AnnotType.HIGHLIGHT,
-                                Poppler.AnnotType.UNDERLINE, Poppler.AnnotType.SQUIGGLY,
-                                Poppler.AnnotType.POLYGON, Poppler.AnnotType.POLY_LINE,
-                                Poppler.AnnotType.SQUARE, Poppler.AnnotType.CIRCLE,
-                                Poppler.AnnotType.CARET, Poppler.AnnotType.LINE,
-                                Poppler.AnnotType.STAMP, Poppler.AnnotType.INK}:
-                # Poppler already renders annotation of these types, nothing more can be done
-                # even though the rendering isn't always perfect.
-                continue
-            else:
-                logger.warning(_("Pympress can not interpret annotation of type:") + " {} ".format(annot_type))
-                continue
 
             my_annotation = Link(annotation.area.x1, annotation.area.y1, annotation.area.x2, annotation.area.y2, action)
-            self.links.append(my_annotation)
+            self._annot_links.append(my_annotation)
+
+
+    def get_link_dest(self, link_type, action):
+        """ Get the page to which a link leads, for links inside the document.
+
+        Args:
+            link_type (:class:`~Poppler.ActionType`): The type of action to be performed
+            action (:class:`~Poppler.Action`): The atcion to be performed
+
+        Returns:
+            `int`: The number of the destination page, or `None` if the link does not lead to a page of the document
+        """
+        if link_type == Poppler.ActionType.GOTO_DEST:
+            dest_type = action.goto_dest.dest.type
+            if dest_type == Poppler.DestType.NAMED:
+                dest = self.parent.find_dest(action.goto_dest.dest.named_dest)
+                if dest:
+                    return dest.page_num - 1
+            elif dest_type != Poppler.DestType.UNKNOWN:
+                return action.goto_dest.dest.page_num - 1
+
+        elif link_type == Poppler.ActionType.NAMED:
+            dest = self.parent.find_dest(action.named.named_dest)
+            if dest:
+                return dest.page_num
+
+        return None
 
 
     def get_link_action(self, link_type, action):
@@ -265,19 +529,16 @@ class Page(object):
             fun = None
 
         elif link_type == Poppler.ActionType.GOTO_DEST:
-            dest_type = action.goto_dest.dest.type
-            if dest_type == Poppler.DestType.NAMED:
-                dest = self.parent.doc.find_dest(action.goto_dest.dest.named_dest)
-                fun = Link.build_closure(self.parent.goto, dest.page_num - 1)
-            elif dest_type != Poppler.DestType.UNKNOWN:
-                fun = Link.build_closure(self.parent.goto, action.goto_dest.dest.page_num - 1)
+            dest = self.get_link_dest(link_type, action)
+            if dest is not None:
+                fun = Link.build_closure(self.parent.goto, dest, NAV_LINK)
 
         elif link_type == Poppler.ActionType.NAMED:
             dest_name = action.named.named_dest
-            dest = self.parent.doc.find_dest(dest_name)
+            dest = self.get_link_dest(link_type, action)
 
-            if dest:
-                fun = Link.build_closure(self.parent.goto, dest.page_num)
+            if dest is not None:
+                fun = Link.build_closure(self.parent.goto, dest, NAV_LINK)
             elif dest_name == "GoBack":
                 fun = self.parent.hist_prev
             elif dest_name == "GoForward":
@@ -333,13 +594,14 @@ class Page(object):
         return fun
 
 
-    def get_annot_action(self, link_type, action, rect):
+    def get_annot_action(self, link_type, action, rect, index = None):
         """ Get the function to be called when the link is followed.
 
         Args:
             link_type (:class:`~Poppler.ActionType`): The link type
             action (:class:`~Poppler.Action`): The action to be performed when the link is clicked
             rect (:class:`~Poppler.Rectangle`): The region of the page where the link is
+            index (`int`): The index of the annotation in the page, identifying the media it embeds
 
         Returns:
             `function`: The function to be called to follow the link
@@ -348,11 +610,8 @@ class Page(object):
             media = action.rendition.media
             if media.is_embedded():
                 ext = get_extension(media.get_mime_type())
-                with tempfile.NamedTemporaryFile('wb', suffix=ext, prefix='pdf_embed_', delete=False) as f:
-                    # now the file name is shotgunned
-                    filename=f.name
-                    self.parent.remove_on_exit(filename)
-                if not media.save(filename):
+                filename = self.parent.extract_file((self.page_nb, index), media.save, 'pdf_embed_', ext)
+                if filename is None:
                     logger.error(_("Pympress can not extract embedded media"))
                     return None
             else:
@@ -369,7 +628,7 @@ class Page(object):
             relative_margins.y2 = 1.0 - rect.y2 / self.ph # top
 
             media = (relative_margins, filename, False)
-            self.medias.append(media)
+            self._medias.append(media)
             return Link.build_closure(self.parent.play_media, hash(media))
 
         else:
@@ -382,6 +641,15 @@ class Page(object):
         return self.page_nb
 
 
+    def get_link_destinations(self):
+        """ Get the pages to which the links of this page lead.
+
+        Returns:
+            `list` of `int`: the numbers of the pages reachable from a link on this page
+        """
+        return [link.dest for link in self._read_links() if link.dest is not None]
+
+
     def get_link_at(self, x, y):
         """ Get the :class:`~pympress.document.Link` corresponding to the given
         position, or `None` if there is no link at this position.
@@ -452,7 +720,7 @@ class Page(object):
         return self.medias
 
 
-    def render_cairo(self, cr, ww, wh, dtype=PDF_REGULAR):
+    def render_cairo(self, cr, ww, wh, dtype=PDF_REGULAR, record=True):
         """ Render the page on a Cairo surface.
 
         Args:
@@ -460,28 +728,11 @@ class Page(object):
             ww (`int`):  target width in pixels
             wh (`int`):  target height in pixels
             dtype (`int`):  the type of document that should be rendered
+            record (`bool`):  whether to record the page if it is not recorded yet, otherwise a recording is only
+                              replayed if there is one, e.g. for quick previews of pages that might not be rendered again
         """
-
-        pw, ph = self.get_size(dtype)
-
-        cr.set_source_rgb(1, 1, 1)
-
-        # Scale
-        scale = min(ww/pw, wh/ph)
-        cr.scale(scale, scale)
-
-        cr.rectangle(0, 0, pw, ph)
-        cr.fill()
-
-        # For "regular" pages, there is no problem: just render them.
-        # For "content" or "notes" pages (i.e. left or right half of a page),
-        # the widget already has correct dimensions so we don't need to deal
-        # with that. But for right halfs we must translate the output in order
-        # to only show the right half.
-        if dtype == PDF_NOTES_PAGE:
-            cr.translate(-pw, 0)
-
-        self.page.render(cr)
+        self._read_annotations()
+        render_poppler_page(self.page, cr, ww, wh, dtype, self.parent.get_recording(self, record))
 
 
     def can_render(self):
@@ -515,16 +766,44 @@ class Document(object):
     cur_page = -1
     #: Document with notes or not
     notes = False
-    #: Pages cache (`dict` of :class:`~pympress.document.Page`). This makes
+    #: Pages cache (:class:`~collections.OrderedDict` of :class:`~pympress.document.Page`). This makes
     #: navigation in the document faster by avoiding calls to Poppler when loading
-    #: a page that has already been loaded.
+    #: a page that has already been loaded. Pages are ordered by Least Recently Used.
     pages_cache = {}
+    #: `int` maximum number of pages in :attr:`pages_cache`, not counting pinned pages
+    max_pages = 64
+    #: `set` of the numbers of pages that are never removed from :attr:`pages_cache`
+    pinned_pages = set()
+    #: `dict` of the text annotations of pages, kept when pages are released as they are
+    #: removed from the Poppler document when first read
+    page_annotations = {}
+    #: :class:`~collections.OrderedDict` of the :class:`~cairo.RecordingSurface` of the most recently rendered pages,
+    #: by page number, see :func:`~pympress.document.record_poppler_page`. Pages are ordered by Least Recently Used.
+    recordings = {}
+    #: `dict` of the estimated size in bytes of the recording of each page, see :func:`~pympress.document.recording_bytes`
+    recording_sizes = {}
+    #: `int` estimated memory used by :attr:`recordings`, in bytes
+    recordings_bytes = 0
+    #: `int` maximum memory used by :attr:`recordings`, in bytes, 0 disables recording pages
+    max_recording_bytes = 64 << 20
+    #: `dict` of the fingerprints of pages by (page number, type), computed in the background by the render workers,
+    #: see :func:`~pympress.document.fingerprint_poppler_page`
+    fingerprints = {}
+    #: `dict` of the number of the first fingerprinted page, by (digest, type)
+    identical_pages = {}
+    #: `dict` of the :class:`~Poppler.Dest` of named destinations, or `None` for unknown names, by name
+    named_dests = {}
     #: Files that are temporary and need to be removed
     temp_files = set()
+    #: `dict` of the paths of the files extracted from the document, by page number and index of the annotation
+    #: in the page, so that they are only extracted once even if the page is loaded again
+    extracted_files = {}
     #: History of pages we have visited
     history = []
     #: Our position in the history
     hist_pos = -1
+    #: :class:`~pympress.prefetch.NavigationPredictor` learning how we navigate in this document
+    predictor = None
 
     #: callback, to be connected to :func:`~pympress.ui.UI.on_page_change`
     page_change = lambda p: None
@@ -533,7 +812,7 @@ class Document(object):
     #: callback, to be connected to :func:`~pympress.editable_label.PageNumber.start_editing`
     start_editing_page_number = lambda: None
 
-    def __init__(self, pop_doc, path, page=0):
+    def __init__(self, pop_doc, path, page=0, max_pages=64, max_recording_bytes=64 << 20):
         self.path = path
 
         # Open PDF file
@@ -548,7 +827,23 @@ class Document(object):
         self.hist_pos = 0
 
         # Pages cache
-        self.pages_cache = {}
+        self.pages_cache = collections.OrderedDict()
+        self.max_pages = max_pages
+        self.pinned_pages = set()
+        self.page_annotations = {}
+        self.fingerprints = {}
+        self.identical_pages = {}
+        self.named_dests = {}
+        self.extracted_files = {}
+
+        # Recorded pages cache
+        self.recordings = collections.OrderedDict()
+        self.recording_sizes = {}
+        self.recordings_bytes = 0
+        self.max_recording_bytes = max_recording_bytes
+
+        # Learn how we navigate, to guess which pages to prerender
+        self.predictor = NavigationPredictor()
 
         # Guess if the document has notes
         page0 = self.page(page)
@@ -561,13 +856,15 @@ class Document(object):
 
 
     @staticmethod
-    def create(builder, path, page=0):
+    def create(builder, path, page=0, max_pages=64, max_recording_bytes=64 << 20):
         """ Initializes a Document by passing it a :class:`~Poppler.Document`
 
         Args:
             builder (:class:`pympress.builder.Builder`):  A builder to load callbacks
             path (`str`):  Absolute path to the PDF file to open
             page (`int`):  page number to which the file should be opened
+            max_pages (`int`):  maximum number of pages kept loaded, see :attr:`max_pages`
+            max_recording_bytes (`int`):  maximum memory used by recorded pages, see :attr:`max_recording_bytes`
 
         Returns:
             :class:`~pympress.document.Document`: The initialized document
@@ -575,14 +872,8 @@ class Document(object):
         if path is None:
             doc = EmptyDocument()
         else:
-            # Do not trust urlsplit, manually check we have an URI
-            pos = path.index(':') if ':' in path else -1
-            if path[pos:pos+3] == '://' or (pos > 1 and set(path[:pos]) <= scheme_chars):
-                uri = path
-            else:
-                uri = urljoin('file:', pathname2url(path))
-            poppler_doc = Poppler.Document.new_from_file(uri, None)
-            doc = Document(poppler_doc, path, page)
+            poppler_doc = Poppler.Document.new_from_file(Document.path_to_uri(path), None)
+            doc = Document(poppler_doc, path, page, max_pages, max_recording_bytes)
 
         # Connect callbacks
         doc.play_media                = builder.get_callback_handler('medias.play')
@@ -592,6 +883,24 @@ class Document(object):
         return doc
 
 
+    @staticmethod
+    def path_to_uri(path):
+        """ Get the URI from which Poppler can load the file at path.
+
+        Args:
+            path (`str`):  Absolute path to the PDF file, or an URI
+
+        Returns:
+            `str`: The URI of the file
+        """
+        # Do not trust urlsplit, manually check we have an URI
+        pos = path.index(':') if ':' in path else -1
+        if path[pos:pos+3] == '://' or (pos > 1 and set(path[:pos]) <= scheme_chars):
+            return path
+        else:
+            return urljoin('file:', pathname2url(path))
+
+
     def has_notes(self):
         """ Get the document mode.
 
@@ -613,9 +922,132 @@ class Document(object):
         if number >= self.nb_pages or number < 0:
             return None
 
-        if not number in self.pages_cache:
-            self.pages_cache[number] = Page(self.doc.get_page(number), number, self)
-        return self.pages_cache[number]
+        if number in self.pages_cache:
+            # Mark as most recently used
+            self.pages_cache[number] = self.pages_cache.pop(number)
+            return self.pages_cache[number]
+
+        page = self.pages_cache[number] = Page(self.doc.get_page(number), number, self)
+        self.release_pages()
+        return page
+
+
+    def pin(self, numbers):
+        """ Keep the given pages loaded, e.g. because they are displayed. Previously pinned pages are unpinned.
+
+        Args:
+            numbers (`list` of `int`):  numbers of the pages to keep loaded
+        """
+        self.pinned_pages = set(numbers)
+        self.release_pages()
+
+
+    def release_pages(self):
+        """ Remove the least recently used pages that are not pinned, until there are at most :attr:`max_pages`
+        unpinned pages in :attr:`pages_cache`. This releases the Poppler pages along with their links and annotations.
+        """
+        unpinned = [number for number in self.pages_cache if number not in self.pinned_pages]
+        for number in unpinned[:max(0, len(unpinned) - self.max_pages)]:
+            del self.pages_cache[number]
+
+
+    def get_recording(self, page, record=True):
+        """ Get the recorded drawing of a page, recording it if needed.
+
+        Pages whose recording would not fit in :attr:`max_recording_bytes` are not recorded,
+        and the least recently used recordings are dropped to stay within it.
+
+        Args:
+            page (:class:`~pympress.document.Page`):  the page to render, whose text annotations were already hidden
+            record (`bool`):  whether to record the page if it is not recorded yet
+
+        Returns:
+            :class:`~cairo.RecordingSurface`: the recorded page, or `None` if it is not recorded
+        """
+        number = page.number()
+        if number in self.recordings:
+            # Mark as most recently used
+            self.recordings[number] = self.recordings.pop(number)
+            return self.recordings[number]
+
+        if not record or self.max_recording_bytes <= 0:
+            return None
+
+        if number not in self.recording_sizes:
+            self.recording_sizes[number] = recording_bytes(page.page)
+        size = self.recording_sizes[number]
+        if size > self.max_recording_bytes:
+            return None
+
+        while self.recordings and self.recordings_bytes + size > self.max_recording_bytes:
+            self.recordings_bytes -= self.recording_sizes[self.recordings.popitem(False)[0]]
+
+        recording = self.recordings[number] = record_poppler_page(page.page)
+        self.recordings_bytes += size
+        return recording
+
+
+    def set_fingerprint(self, page_nb, dtype, fingerprint):
+        """ Store the fingerprint of a page, e.g. when it was computed by a worker process.
+
+        Args:
+            page_nb (`int`):  number of the page
+            dtype (`int`):  the type of document for which the page was fingerprinted
+            fingerprint (`tuple`):  the digest, cells checksums and size of the rendering
+        """
+        self.fingerprints[(page_nb, dtype)] = fingerprint
+        self.identical_pages.setdefault((fingerprint[0], dtype), page_nb)
+
+
+    def identical_page(self, page_nb, dtype):
+        """ Get the first page that probably looks the same as a page, if their fingerprints are known.
+
+        Args:
+            page_nb (`int`):  number of the page
+            dtype (`int`):  the type of document for which the pages are compared
+
+        Returns:
+            `int`: the number of the first page with the same fingerprint, or `page_nb` if there is none or it is unknown
+        """
+        try:
+            return self.identical_pages[(self.fingerprints[(page_nb, dtype)][0], dtype)]
+        except KeyError:
+            return page_nb
+
+
+    def changed_region(self, page_nb, other_nb, dtype):
+        """ Get the region of a page that probably differs from another page, e.g. what is uncovered by a beamer overlay.
+
+        The region is a bounding box of the fingerprint cells that differ, and is only known if both pages
+        were fingerprinted. Differences too small to change the low resolution renderings are missed, so
+        a page built from this region must still be checked against a full rendering.
+
+        Args:
+            page_nb (`int`):  number of the page
+            other_nb (`int`):  number of the page to compare with
+            dtype (`int`):  the type of document for which the pages are compared
+
+        Returns:
+            `tuple`: the left, top, right and bottom of the region as fractions of the page size,
+            or `None` if it is unknown or the pages can not be compared
+        """
+        try:
+            _digest, cells, (fw, fh) = self.fingerprints[(page_nb, dtype)]
+            _other_digest, other_cells, other_size = self.fingerprints[(other_nb, dtype)]
+        except KeyError:
+            return None
+
+        if (fw, fh) != other_size:
+            return None
+
+        changed = [n for n in range(len(cells)) if cells[n] != other_cells[n]]
+        if not changed:
+            return 0., 0., 0., 0.
+
+        cols = -(-fw // FINGERPRINT_CELL)
+        xs, ys = [n % cols for n in changed], [n // cols for n in changed]
+        return (float(min(xs) * FINGERPRINT_CELL) / fw, float(min(ys) * FINGERPRINT_CELL) / fh,
+                min(1., float((max(xs) + 1) * FINGERPRINT_CELL) / fw), min(1., float((max(ys) + 1) * FINGERPRINT_CELL) / fh))
 
 
     def current_page(self):
@@ -636,6 +1068,24 @@ class Document(object):
         return self.page(self.cur_page + 1)
 
 
+    def prefetch_pages(self, number, preview = False):
+        """ Get the pages that are likely to be displayed soon, e.g. to prerender them.
+
+        Args:
+            number (`int`):  number of the page currently displayed
+            preview (`bool`):  whether the page is only previewed, and is not the current page
+
+        Returns:
+            `list` of `int`: numbers of the pages, most likely first
+        """
+        page = self.page(number)
+        if page is None:
+            return []
+
+        history_targets = [self.history[pos] for pos in (self.hist_pos - 1, self.hist_pos + 1) if 0 <= pos < len(self.history)]
+        return self.predictor.predict(number, self.nb_pages, page.get_link_destinations(), history_targets, preview)
+
+
     def pages_number(self):
         """ Get the number of pages in the document.
 
@@ -645,23 +1095,40 @@ class Document(object):
         return self.nb_pages
 
 
-    def _do_page_change(self, number):
+    def _do_page_change(self, number, nav):
         """ Perform the actual change of page and UI notification.
 
         The page number is **not** checked here, so it must be within bounds already.
 
         Args:
             number (`int`):  number of the destination page
+            nav (`int`):  how the page change was triggered, one of the NAV_* constants of :mod:`pympress.prefetch`
         """
+        self.predictor.record(self.cur_page, number, nav)
         self.cur_page = number
         self.page_change()
 
 
-    def goto(self, number):
+    def find_dest(self, name):
+        """ Find a named destination of the document, looking each name up only once.
+
+        Args:
+            name (`str`):  the name of the destination
+
+        Returns:
+            :class:`~Poppler.Dest`: the destination, or `None` if the document has no destination with this name
+        """
+        if name not in self.named_dests:
+            self.named_dests[name] = self.doc.find_dest(name)
+        return self.named_dests[name]
+
+
+    def goto(self, number, nav = NAV_JUMP):
         """ Switch to another page.
 
         Args:
             number (`int`):  number of the destination page
+            nav (`int`):  how the page change was triggered, one of the NAV_* constants of :mod:`pympress.prefetch`
         """
         if number < 0:
             number = 0
@@ -669,7 +1136,7 @@ class Document(object):
             number = self.nb_pages - 1
 
         if number != self.cur_page:
-            self._do_page_change(number)
+            self._do_page_change(number, nav)
 
             # chop off history where we were and go to end
             self.hist_pos += 1
@@ -709,7 +1176,7 @@ class Document(object):
             return
 
         self.hist_pos += 1
-        self._do_page_change(self.history[self.hist_pos])
+        self._do_page_change(self.history[self.hist_pos], NAV_HISTORY)
 
 
     def hist_prev(self, *args):
@@ -719,7 +1186,7 @@ class Document(object):
             return
 
         self.hist_pos -= 1
-        self._do_page_change(self.history[self.hist_pos])
+        self._do_page_change(self.history[self.hist_pos], NAV_HISTORY)
 
 
     def get_full_path(self, filename):
@@ -751,12 +1218,37 @@ class Document(object):
         self.temp_files.add(filename)
 
 
+    def extract_file(self, key, save, prefix, suffix):
+        """ Get the path to a file embedded in the document, extracting it to a temporary file the first time.
+
+        Args:
+            key (`tuple`): The page number and the index of the annotation in the page, identifying the file
+            save (`function`): Saves the embedded file to the path it is given, and returns whether it succeeded
+            prefix (`str`): The start of the name of the temporary file
+            suffix (`str`): The end of the name of the temporary file, e.g. its extension
+
+        Returns:
+            `str`: the path to the extracted file, or `None` if it could not be extracted
+        """
+        if key not in self.extracted_files:
+            with tempfile.NamedTemporaryFile('wb', suffix=suffix, prefix=prefix, delete=False) as f:
+                # now the file name is shotgunned
+                filename=f.name
+                self.remove_on_exit(filename)
+            if not save(filename):
+                return None
+            self.extracted_files[key] = filename
+
+        return self.extracted_files[key]
+
+
     def cleanup_media_files(self):
         """ Removes all files that were extracted from the pdf into the filesystem
         """
         for f in self.temp_files:
             os.remove(f)
         self.temp_files.clear()
+        self.extracted_files.clear()
 
 
 class EmptyPage(Page):
@@ -770,15 +1262,17 @@ class EmptyPage(Page):
         self.page = None
         self.page_nb = -1
         self.parent = None
-        self.links = []
-        self.medias = []
-        self.annotations = []
+        self._links = []
+        self._annot_links = []
+        self._medias = []
+        self._annotations = []
+        self._action_annots = []
 
         # by default, anything that will have a 1.3 asapect ratio
         self.pw, self.ph = 1.3, 1.0
 
 
-    def render_cairo(self, cr, ww, wh, dtype=PDF_REGULAR):
+    def render_cairo(self, cr, ww, wh, dtype=PDF_REGULAR, record=True):
         """ Overriding this purely for safety: make sure we do not accidentally try to render
 
         Args:
@@ -786,6 +1280,7 @@ class EmptyPage(Page):
             ww (`int`):  target width in pixels
             wh (`int`):  target height in pixels
             dtype (`int`):  the type of document that should be rendered
+            record (`bool`):  whether to record the page if it is not recorded yet
         """
         pass
 
@@ -809,7 +1304,17 @@ class EmptyDocument(Document):
         self.nb_pages = 0
         self.cur_page = -1
         self.pages_cache = {-1: EmptyPage()}
+        self.pinned_pages = set()
+        self.page_annotations = {}
+        self.fingerprints = {}
+        self.identical_pages = {}
+        self.named_dests = {}
+        self.recordings = {}
+        self.recording_sizes = {}
+        self.recordings_bytes = 0
+        self.max_recording_bytes = 0
         self.notes = False
+        self.predictor = NavigationPredictor()
 
 
     def page(self, number):
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+#
+#       export.py
+#
+#       Copyright 2018 Cimbali <me@cimba.li>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+"""
+:mod:`pympress.export` -- exporting pages to images
+---------------------------------------------------
+
+This module renders the pages of a document to image files, without a display,
+e.g. for handouts, streaming overlays or archives. It is installed as the
+``pympress-export`` command.
+
+Pages are rendered in parallel by a pool of worker processes, each with its own
+:class:`~Poppler.Document` (see :mod:`pympress.render_pool`), and files are written
+by the workers as soon as each page is rendered.
+
+Pages are exported as PNG, or as raw pixels in the format of the
+:class:`~pympress.diskcache.DiskCache`.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import sys
+import time
+import getopt
+import signal
+import locale
+import gettext
+import multiprocessing
+
+import gi
+import cairo
+gi.require_version('Poppler', '0.18')
+from gi.repository import Poppler, GLib
+
+from pympress import util, document, render_pool, diskcache
+
+locale.setlocale(locale.LC_ALL, '')
+gettext.install('pympress', util.get_locale_dir())
+
+
+#: Names of the page types that can be exported, as accepted on the command line
+PAGE_TYPES = {
+    'regular': document.PDF_REGULAR,
+    'content': document.PDF_CONTENT_PAGE,
+    'notes': document.PDF_NOTES_PAGE,
+}
+
+#: Extensions of the exported files, by format
+EXTENSIONS = {'png': '.png', 'raw': '.page'}
+
+
+def usage():
+    """ Print the command line options of the exporter.
+    """
+    print(_("Usage: {} [options] <presentation_file>").format(sys.argv[0]))
+    print("")
+    print(_("Options:"))
+    print("    -h, --help                       " + _("This help"))
+    print("    -o dir, --output=dir             " + _("The directory where images are written (default: current directory)"))
+    print("    -p pages, --pages=pages          " + _("The pages to export, e.g. 1-5,8 (default: all pages)"))
+    print("    -t types, --types=types          " + _("The types of pages to export, among {}, {} and {}").format('regular', 'content', 'notes'))
+    print("                                       " + _("(default: content and notes for documents with notes, regular otherwise)"))
+    print("    -s WxH, --size=WxH               " + _("Maximum sizes of the exported images, e.g. 1920x1080,640x480 (default: 1920x1080)"))
+    print("    -f format, --format=format       " + _("The format of the exported images, {} or {} (default: {})").format('png', 'raw', 'png'))
+    print("    -j N, --jobs=N                   " + _("The number of rendering processes (default: number of CPUs)"))
+    print("    --log=level:                     " + _("Set level of verbosity:"))
+    print("                                       " + _("{}, {}, {}, {}, or {}").format("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"))
+    print("")
+
+
+def parse_pages(spec, nb_pages):
+    """ Get the page numbers from a specification on the command line.
+
+    Args:
+        spec (`str`):  comma-separated page numbers or ranges of page numbers, starting from 1
+        nb_pages (`int`):  number of pages in the document
+
+    Returns:
+        `list` of `int`: the page numbers, starting from 0
+
+    Raises:
+        `ValueError`: if a page number is not in the document, or a range is reversed
+    """
+    pages = []
+    for part in spec.split(','):
+        first, _sep, last = part.partition('-')
+        first = int(first) if first.strip() else 1
+        last = int(last) if last.strip() else (nb_pages if _sep else first)
+        if not 1 <= first <= nb_pages or not 1 <= last <= nb_pages:
+            raise ValueError(_("{}: the document has pages 1 to {}").format(part, nb_pages))
+        elif first > last:
+            raise ValueError(_("{}: reversed range of pages").format(part))
+        pages.extend(range(first - 1, last))
+    return pages
+
+
+def fit_size(pw, ph, max_width, max_height):
+    """ Get the largest size with the aspect ratio of a page that fits in the given size.
+
+    Args:
+        pw (`float`):  width of the page
+        ph (`float`):  height of the page
+        max_width (`int`):  maximum width in pixels
+        max_height (`int`):  maximum height in pixels
+
+    Returns:
+        `tuple` of `int`: the width and height in pixels
+    """
+    scale = min(max_width / pw, max_height / ph)
+    return max(1, int(round(pw * scale))), max(1, int(round(ph * scale)))
+
+
+def export_page(page_nb, ww, wh, dtype, path, file_format):
+    """ Render a page and write it to a file. This is called in the worker processes.
+
+    Args:
+        page_nb (`int`):  number of the page to render
+        ww (`int`):  width in pixels
+        wh (`int`):  height in pixels
+        dtype (`int`):  the type of page to render
+        path (`str`):  the file to write
+        file_format (`str`):  the format of the file, one of the keys of :const:`EXTENSIONS`
+
+    Returns:
+        `tuple`: the path of the file, or `None` if the page could not be exported, and the page number
+    """
+    try:
+        surface = cairo.ImageSurface(diskcache.PIXEL_FORMAT, ww, wh)
+        context = cairo.Context(surface)
+        document.render_poppler_page(render_pool.get_worker_page(page_nb), context, ww, wh, dtype)
+        del context
+        surface.flush()
+
+        if file_format == 'png':
+            surface.write_to_png(path)
+        else:
+            with open(path, 'wb') as f:
+                f.write(diskcache.HEADER.pack(diskcache.MAGIC_RAW, ww, wh, surface.get_stride()))
+                f.seek(diskcache.RAW_OFFSET)
+                f.write(bytes(surface.get_data()))
+    except Exception:
+        logger.exception('Exporting page {} failed'.format(page_nb + 1))
+        return None, page_nb
+
+    return path, page_nb
+
+
+def export_page_star(args):
+    """ Unpack arguments for :func:`~pympress.export.export_page`, to be used with :meth:`~multiprocessing.pool.Pool.imap_unordered`.
+    """
+    return export_page(*args)
+
+
+def main(argv = sys.argv[1:]):
+    """ Parse the command line, then render the requested pages in parallel and write them to files.
+
+    Args:
+        argv (`list` of `str`):  the command line arguments, without the program name
+    """
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        opts, args = getopt.getopt(argv, "ho:p:t:s:f:j:", ["help", "output=", "pages=", "types=", "size=", "format=", "jobs=", "log="])
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+
+    output, pages, types, file_format = '.', None, None, 'png'
+    sizes = [(1920, 1080)]
+    jobs = multiprocessing.cpu_count()
+    log_level = logging.WARNING
+
+    try:
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                usage()
+                sys.exit()
+            elif opt in ("-o", "--output"):
+                output = arg
+            elif opt in ("-p", "--pages"):
+                pages = arg
+            elif opt in ("-t", "--types"):
+                types = [PAGE_TYPES[t.strip()] for t in arg.split(',')]
+            elif opt in ("-s", "--size"):
+                sizes = [tuple(int(n) for n in size.split('x')) for size in arg.split(',')]
+            elif opt in ("-f", "--format"):
+                if arg not in EXTENSIONS:
+                    raise ValueError(arg)
+                file_format = arg
+            elif opt in ("-j", "--jobs"):
+                jobs = max(1, int(arg))
+            elif opt == "--log":
+                log_level = getattr(logging, arg.upper(), log_level)
+    except (ValueError, KeyError) as e:
+        print(_("Invalid option value: {}").format(e))
+        usage()
+        sys.exit(2)
+
+    if len(args) != 1:
+        usage()
+        sys.exit(2)
+
+    logging.basicConfig(level=log_level)
+
+    uri = document.Document.path_to_uri(os.path.abspath(args[0]))
+    try:
+        poppler_doc = Poppler.Document.new_from_file(uri, None)
+    except GLib.Error as e:
+        print(_("Could not open the file {}: {}").format(args[0], e))
+        sys.exit(1)
+
+    nb_pages = poppler_doc.get_n_pages()
+    try:
+        pages = parse_pages(pages, nb_pages) if pages else range(nb_pages)
+    except ValueError as e:
+        print(_("Invalid option value: {}").format(e))
+        usage()
+        sys.exit(2)
+
+    if types is None:
+        pw, ph = poppler_doc.get_page(0).get_size()
+        # Same guess as pympress.document.Document
+        has_notes = pw / ph >= 2
+        types = [document.PDF_CONTENT_PAGE, document.PDF_NOTES_PAGE] if has_notes else [document.PDF_REGULAR]
+
+    if not os.path.isdir(output):
+        os.makedirs(output)
+
+    # All the pages to export, in order
+    type_names = {dtype: name for name, dtype in PAGE_TYPES.items()}
+    stem = os.path.splitext(os.path.basename(args[0]))[0]
+    tasks = []
+    for page_nb in pages:
+        pw, ph = poppler_doc.get_page(page_nb).get_size()
+        for dtype in types:
+            for max_width, max_height in sizes:
+                ww, wh = fit_size(pw / 2. if dtype != document.PDF_REGULAR else pw, ph, max_width, max_height)
+                filename = '{}-{:03}-{}-{}x{}{}'.format(stem, page_nb + 1, type_names[dtype], ww, wh, EXTENSIONS[file_format])
+                tasks.append((page_nb, ww, wh, dtype, os.path.join(output, filename), file_format))
+    del poppler_doc
+
+    try:
+        # Same as the render workers, do not fork: it would not be safe with Gtk in the process
+        context = multiprocessing.get_context('spawn')
+    except AttributeError:
+        context = multiprocessing
+
+    start = time.time()
+    done = failed = 0
+    done_pages = set()
+    pool = context.Pool(min(jobs, len(tasks)) or 1, render_pool.init_worker, (uri,))
+    try:
+        for path, page_nb in pool.imap_unordered(export_page_star, tasks):
+            if path is None:
+                failed += 1
+                print(_("Could not export page {}").format(page_nb + 1), file=sys.stderr)
+            else:
+                done += 1
+                done_pages.add(page_nb)
+                print(path)
+    finally:
+        pool.terminate()
+
+    elapsed = time.time() - start
+    print(_("Exported {} images of {} pages in {:.2f}s ({:.1f} pages/second, {:.1f} images/second)").format(
+          done, len(done_pages), elapsed, len(done_pages) / elapsed if elapsed else 0., done / elapsed if elapsed else 0.),
+          file=sys.stderr)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
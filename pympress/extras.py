@@ -38,7 +38,7 @@ from gi.repository import Gtk, Gdk, GLib, Pango
 import mimetypes
 
 from pympress import media_overlay
-from pympress.ui import PDF_REGULAR, PDF_CONTENT_PAGE, PDF_NOTES_PAGE
+from pympress.document import PDF_REGULAR, PDF_CONTENT_PAGE, PDF_NOTES_PAGE
 
 
 class Annotations(object):
@@ -310,6 +310,135 @@ class Cursor(object):
         widget.get_window().set_cursor(cls._cursors[cursor_name])
 
 
+class FrameCoalescer(object):
+    """ Coalesce motion events and redraws of widgets, so that they are handled at most once per frame.
+
+    Mice and tablets may send several motion events between two frames, and handling each of them can
+    trigger several redraws. Instead, only the latest motion event of each widget is kept, and handled
+    along with the redraws when the widget's :class:`~Gdk.FrameClock` starts a new frame.
+
+    Args:
+        handle_motion (`function`): called with the widget and the latest motion event at each frame
+    """
+    #: `dict` mapping widgets to the latest motion event they received that is not handled yet
+    motions = {}
+    #: `dict` mapping widgets to the `list` of areas to redraw at the next frame, or `None` to redraw them entirely
+    damage = {}
+    #: `set` of the widgets that have a tick callback pending
+    ticking = set()
+    #: callback handling a motion event, see :meth:`~pympress.ui.UI.handle_motion`
+    handle_motion = lambda widget, event: None
+
+    #: `int` maximum number of areas to redraw in a widget before redrawing it entirely
+    max_areas = 16
+
+    #: `int` number of motion events received
+    events = 0
+    #: `int` number of motion events handled, at most one per widget per frame
+    handled = 0
+    #: `int` number of redraws requested
+    redraws = 0
+    #: `int` number of frames in which widgets were redrawn
+    frames = 0
+
+    def __init__(self, handle_motion):
+        self.handle_motion = handle_motion
+        self.motions = {}
+        self.damage = {}
+        self.ticking = set()
+
+
+    def add_motion(self, widget, event):
+        """ Keep a motion event, to be handled at the next frame of the widget instead of the previous one.
+
+        Args:
+            widget (:class:`~Gtk.Widget`):  the widget that received the event
+            event (:class:`~Gdk.Event`):  the motion event
+        """
+        self.events += 1
+        self.motions[widget] = event.copy()
+        self.schedule(widget)
+
+
+    def queue_draw(self, widget, areas = None):
+        """ Request to redraw a widget at its next frame.
+
+        Args:
+            widget (:class:`~Gtk.Widget`):  the widget to redraw
+            areas (`list`): the areas (left, top, width, height) to redraw, or `None` to redraw the whole widget
+        """
+        self.redraws += 1
+
+        # Unmapped widgets have no frames, and are drawn entirely when they are mapped
+        if not widget.get_mapped():
+            return
+
+        if areas is None:
+            self.damage[widget] = None
+        elif self.damage.get(widget, []) is not None:
+            damage = self.damage.setdefault(widget, [])
+            damage.extend(areas)
+            if len(damage) > self.max_areas:
+                self.damage[widget] = None
+
+        self.schedule(widget)
+
+
+    def schedule(self, widget):
+        """ Make sure the widget's pending motion and redraws are handled when its next frame starts.
+
+        Args:
+            widget (:class:`~Gtk.Widget`):  the widget
+        """
+        if widget not in self.ticking:
+            self.ticking.add(widget)
+            widget.add_tick_callback(self.on_tick)
+
+
+    def on_tick(self, widget, frame_clock):
+        """ Handle the pending motion event of a widget, and queue its redraws, at the start of a frame.
+
+        Args:
+            widget (:class:`~Gtk.Widget`):  the widget
+            frame_clock (:class:`~Gdk.FrameClock`):  the frame clock of the widget
+
+        Returns:
+            `bool`: `False`, to remove the tick callback until more events or redraws arrive
+        """
+        event = self.motions.pop(widget, None)
+        if event is not None:
+            self.handled += 1
+            # Redraws of this widget requested while handling the event are issued below, in this frame
+            self.handle_motion(widget, event)
+
+        self.ticking.discard(widget)
+
+        if widget in self.damage:
+            self.frames += 1
+            areas = self.damage.pop(widget)
+            if areas is None:
+                widget.queue_draw()
+            else:
+                for area in areas:
+                    widget.queue_draw_area(*area)
+
+        return False
+
+
+    def get_stats(self):
+        """ Get statistics about the coalescing of motion events and redraws.
+
+        Returns:
+            `dict`: the numbers of motion events received and handled, of redraws requested and of frames drawn
+        """
+        return {
+            'events': self.events,
+            'handled': self.handled,
+            'redraws': self.redraws,
+            'frames': self.frames,
+        }
+
+
 class Zoom(object):
     #: Whether we are displaying the interface to scribble on screen and the overlays containing said scribbles
     zoom_selecting = False
@@ -326,8 +455,6 @@ class Zoom(object):
 
     #: callback, to be connected to :func:`~pympress.ui.UI.redraw_current_slide`
     redraw_current_slide = lambda: None
-    #: callback, to be connected to :func:`~pympress.ui.UI.clear_cache`
-    clear_cache = lambda: None
 
     def __init__(self, builder):
         """ Setup all the necessary for zooming
@@ -339,7 +466,6 @@ class Zoom(object):
         builder.load_widgets(self)
 
         self.redraw_current_slide = builder.get_callback_handler('redraw_current_slide')
-        self.clear_cache = builder.get_callback_handler('clear_zoom_cache')
 
 
     def delayed_callback_connection(self, scribble_builder):
@@ -379,7 +505,6 @@ class Zoom(object):
         self.menu_zoom_out.set_sensitive(False)
 
         self.redraw_current_slide()
-        self.clear_cache()
 
         return True
 
@@ -486,7 +611,6 @@ class Zoom(object):
             Cursor.set_cursor(self.p_central)
 
             self.zoom_selecting = False
-            self.clear_cache()
             self.redraw_current_slide()
             self.set_scribble_zoomout_sensitive(True)
             self.menu_zoom_out.set_sensitive(True)
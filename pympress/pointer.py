@@ -22,6 +22,9 @@
 """
 :mod:`pympress.pointer` -- Manage when and where to draw a software-emulated laser pointer on screen
 ----------------------------------------------------------------------------------------------------
+
+When the pointer moves, only the areas of the slides covered by the pointer at its previous
+and new positions are redrawn, rather than whole slides.
 """
 
 from __future__ import print_function, unicode_literals
@@ -30,6 +33,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 import gi
+import cairo
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gdk, GdkPixbuf
 
@@ -47,6 +51,8 @@ POINTER_SHOW = 1
 class Pointer(object):
     #: :class:`~GdkPixbuf.Pixbuf` to read XML descriptions of GUIs and load them.
     pointer = GdkPixbuf.Pixbuf()
+    #: :class:`~cairo.ImageSurface` with the pixels of :attr:`pointer`, so that it is not converted at each drawing
+    pointer_surface = None
     #: `(float, float)` of position relative to slide, where the pointer should appear
     pointer_pos = (.5, .5)
     #: `bool` indicating whether we should show the pointer
@@ -55,7 +61,7 @@ class Pointer(object):
     config = None
 
     #: callback, to be connected to :func:`~pympress.ui.UI.redraw_current_slide`
-    redraw_current_slide = lambda: None
+    redraw_current_slide = lambda damage = None: None
 
     def __init__(self, config, builder):
         """ Setup the pointer management, and load the default pointer
@@ -88,6 +94,12 @@ class Pointer(object):
         if name in ['pointer_red', 'pointer_green', 'pointer_blue']:
             self.show_pointer = POINTER_HIDE
             self.pointer = util.get_icon_pixbuf(name + '.png')
+
+            self.pointer_surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.pointer.get_width(), self.pointer.get_height())
+            context = cairo.Context(self.pointer_surface)
+            Gdk.cairo_set_source_pixbuf(context, self.pointer, 0, 0)
+            context.paint()
+            del context
         else:
             self.show_pointer = POINTER_OFF
 
@@ -104,6 +116,21 @@ class Pointer(object):
             self.config.set('presenter', 'pointer', widget.get_name()[len('pointer_'):])
 
 
+    def pointer_area(self, pos, ww, wh):
+        """ Get the area covered by the pointer in a widget.
+
+        Args:
+            pos (`(float, float)`): The position of the pointer relative to the slide
+            ww (`int`): The widget width
+            wh (`int`): The widget height
+
+        Returns:
+            `tuple` of `int`: the left, top, width and height of the area, in pixels
+        """
+        pw, ph = self.pointer.get_width(), self.pointer.get_height()
+        return int(round(ww * pos[0] - pw / 2.)), int(round(wh * pos[1] - ph / 2.)), pw, ph
+
+
     def render_pointer(self, cairo_context, ww, wh):
         """ Draw the laser pointer on screen
 
@@ -113,10 +140,10 @@ class Pointer(object):
             wh (`int`): The widget height
         """
         if self.show_pointer == POINTER_SHOW:
-            x = ww * self.pointer_pos[0] - self.pointer.get_width() / 2
-            y = wh * self.pointer_pos[1] - self.pointer.get_height() / 2
-            Gdk.cairo_set_source_pixbuf(cairo_context, self.pointer, x, y)
-            cairo_context.paint()
+            x, y, pw, ph = self.pointer_area(self.pointer_pos, ww, wh)
+            cairo_context.set_source_surface(self.pointer_surface, x, y)
+            cairo_context.rectangle(x, y, pw, ph)
+            cairo_context.fill()
 
 
     def track_pointer(self, widget, event):
@@ -132,8 +159,11 @@ class Pointer(object):
         if self.show_pointer == POINTER_SHOW:
             ww, wh = widget.get_allocated_width(), widget.get_allocated_height()
             ex, ey = event.get_coords()
-            self.pointer_pos = (ex / ww, ey / wh)
-            self.redraw_current_slide()
+            prev_pos, self.pointer_pos = self.pointer_pos, (ex / ww, ey / wh)
+
+            # Only redraw where the pointer was and where it is now
+            self.redraw_current_slide(lambda ww, wh: [self.pointer_area(prev_pos, ww, wh),
+                                                      self.pointer_area(self.pointer_pos, ww, wh)])
             return True
 
         else:
@@ -165,7 +195,7 @@ class Pointer(object):
         elif self.show_pointer == POINTER_SHOW and event.type == Gdk.EventType.BUTTON_RELEASE:
             self.show_pointer = POINTER_HIDE
             extras.Cursor.set_cursor(widget, 'parent')
-            self.redraw_current_slide()
+            self.redraw_current_slide(lambda ww, wh: [self.pointer_area(self.pointer_pos, ww, wh)])
             return True
 
         else:
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+#
+#       prefetch.py
+#
+#       Copyright 2018 Cimbali <me@cimba.li>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+"""
+:mod:`pympress.prefetch` -- predicting which pages to prerender
+---------------------------------------------------------------
+
+This module guesses which pages are going to be displayed next, from the way the
+user has been navigating the document so far. During a normal talk, slides only
+move forward one by one; during questions, one jumps around using links, the page
+number or the history. The :class:`~pympress.prefetch.NavigationPredictor` adapts
+the window of prerendered pages to both situations.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import logging
+logger = logging.getLogger(__name__)
+
+from collections import deque, Counter
+
+
+#: Navigation to an arbitrary page, e.g. by typing its number
+NAV_JUMP    = 0
+#: Navigation to the next or previous page
+NAV_STEP    = 1
+#: Navigation by following a link in the document
+NAV_LINK    = 2
+#: Navigation backward or forward in the history of visited pages
+NAV_HISTORY = 3
+
+#: Names of the navigation types, for statistics
+NAV_NAMES = {NAV_JUMP: 'jump', NAV_STEP: 'step', NAV_LINK: 'link', NAV_HISTORY: 'history'}
+
+
+class NavigationPredictor(object):
+    """ Predict the next pages to be displayed from the recent page changes.
+
+    Args:
+        window (`int`): The number of pages around the current page to prerender
+        memory (`int`): The number of recent page changes taken into account
+    """
+    #: `int` the number of pages around the current page to prerender, not counting link targets
+    window = 6
+    #: `int` maximum number of link targets and history neighbours to prerender
+    max_targets = 8
+    #: :class:`~collections.deque` of the recent page changes, as tuples of step size and navigation type
+    moves = deque()
+    #: `set` of pages that were returned by the last prediction
+    predicted = set()
+
+    #: `int` number of page changes for which a prediction had been made
+    predictions = 0
+    #: `int` number of page changes to a page that was predicted
+    hits = 0
+    #: :class:`~collections.Counter` of the page changes by navigation type
+    nav_counts = Counter()
+
+    def __init__(self, window = 6, memory = 16):
+        self.window = window
+        self.moves = deque(maxlen = memory)
+        self.predicted = set()
+        self.nav_counts = Counter()
+
+
+    def record(self, from_page, to_page, nav):
+        """ Take a page change into account for future predictions.
+
+        Args:
+            from_page (`int`):  number of the page we are leaving
+            to_page (`int`):  number of the destination page
+            nav (`int`):  how the page change was triggered, one of the NAV_* constants
+        """
+        if self.predicted:
+            self.predictions += 1
+            if to_page in self.predicted:
+                self.hits += 1
+
+        step = to_page - from_page
+        if nav == NAV_JUMP and abs(step) == 1:
+            nav = NAV_STEP
+
+        self.moves.append((step, nav))
+        self.nav_counts[nav] += 1
+
+
+    def predict(self, current, nb_pages, link_targets = (), history_targets = (), preview = False):
+        """ Get the pages that are likely to be displayed soon, most likely first.
+
+        The window of pages around the current page is skewed in the direction in which we
+        usually step through pages, and when the navigation is not only by steps, pages reached
+        by links, by history or by a repeated jump size from the current page are included.
+
+        Args:
+            current (`int`):  number of the current page
+            nb_pages (`int`):  number of pages in the document
+            link_targets (`list` of `int`):  the pages targeted by links in the current page
+            history_targets (`list` of `int`):  the pages previous and next to the current page in the history
+            preview (`bool`):  whether `current` is only previewed, e.g. while typing a page number, in which case
+                               the prediction is not the one the next page change is scored against
+
+        Returns:
+            `list` of `int`: the numbers of the pages to prerender, starting with the current page
+        """
+        steps = [step for step, nav in self.moves if nav == NAV_STEP]
+        forward = sum(1 for step in steps if step > 0)
+
+        # Prior of 2 forward for 1 backward, with a window of 6 that is 4 pages ahead and 2 behind
+        after = int(round(self.window * (forward + 2.) / (len(steps) + 3.)))
+        after = min(self.window - 1, max(1, after))
+        before = self.window - after
+
+        pages = [current]
+        for distance in range(1, max(after, before) + 1):
+            if distance <= after:
+                pages.append(current + distance)
+            if distance <= before:
+                pages.append(current - distance)
+
+        # Targets of links, history moves, and of jumps of a repeated size
+        jump_sizes = Counter(step for step, nav in self.moves if nav != NAV_STEP and step)
+        targets = list(history_targets) + list(link_targets)
+        targets += [current + size for size, count in jump_sizes.most_common(2) if count > 1]
+
+        seen = set()
+        targets = [p for p in targets if not (p in seen or seen.add(p))][:self.max_targets]
+
+        # If we are jumping around, jump targets are as likely as the next page
+        if len(steps) < len(self.moves) / 2.:
+            pages[2:2] = targets
+        else:
+            pages.extend(targets)
+
+        seen = set()
+        pages = [p for p in pages if 0 <= p < nb_pages and not (p in seen or seen.add(p))]
+
+        if not preview:
+            self.predicted = set(pages)
+        return pages
+
+
+    def hit_rate(self):
+        """ Get the proportion of page changes to pages that had been predicted.
+
+        Returns:
+            `float`: the hit rate, between 0 and 1, or `None` if no prediction was made yet
+        """
+        return float(self.hits) / self.predictions if self.predictions else None
+
+
+    def get_stats(self):
+        """ Get statistics about the predictions, useful to tune the prefetching.
+
+        Returns:
+            `dict`: the number of predictions, of hits, the hit rate, and the number of page changes by navigation type
+        """
+        return {
+            'predictions': self.predictions,
+            'hits': self.hits,
+            'hit_rate': self.hit_rate(),
+            'navigation': {NAV_NAMES[nav]: count for nav, count in self.nav_counts.items()},
+        }
+
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
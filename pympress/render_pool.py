@@ -0,0 +1,507 @@
+# -*- coding: utf-8 -*-
+#
+#       render_pool.py
+#
+#       Copyright 2018 Cimbali <me@cimba.li>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+"""
+:mod:`pympress.render_pool` -- rendering pages in worker processes
+------------------------------------------------------------------
+
+Poppler is not thread-safe, so pages can not be rendered in parallel threads of
+the main process. Instead, this module manages a pool of worker processes, each
+of which opens its own :class:`~Poppler.Document`.
+
+Workers render pages directly into raw pixel buffers in shared memory: memory-mapped
+files, created in a RAM-backed directory when the system has one. The main process
+then only has to map these buffers and wrap them in a :class:`~cairo.ImageSurface`,
+without any decoding or copying.
+
+Like the main process, workers keep the drawings of the pages they rendered most recently
+in recording surfaces (see :func:`~pympress.document.record_poppler_page`), within the same
+memory budget in each worker, so that rendering the same page for another widget or at
+another size does not need Poppler.
+
+Workers also fingerprint pages in the background (see :func:`~pympress.document.fingerprint_poppler_page`),
+and can render only a region of a page, e.g. a tile of a zoomed page.
+
+A worker that dies, e.g. if Poppler crashes on a page, loses its job without reporting it:
+jobs that do not complete within :attr:`~pympress.render_pool.RenderPool.job_timeout` are
+reported as failed with a :class:`~multiprocessing.TimeoutError`, and their results are
+discarded if they arrive later. The buffers of a pool are named with a prefix of their own,
+so that those still in flight when the pool is closed can be removed.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import mmap
+import time
+import errno
+import gettext
+import tempfile
+import itertools
+import threading
+import collections
+import multiprocessing
+
+import gi
+import cairo
+gi.require_version('Poppler', '0.18')
+from gi.repository import Poppler, GLib
+
+from pympress import document, util
+
+
+#: Pixel format of the buffers rendered by the workers: pages are opaque, so no alpha channel is needed
+PIXEL_FORMAT = cairo.FORMAT_RGB24
+
+#: In a worker process, the :class:`~Poppler.Document` from which pages are rendered
+worker_doc = None
+
+#: In a worker process, the prefix of the names of the buffers in which pages are rendered
+worker_prefix = 'pympress-'
+
+#: In a worker process, the `set` of pages whose text-only annotations were hidden
+worker_read_pages = set()
+
+#: In a worker process, the :class:`~collections.OrderedDict` of the most recently rendered pages' recordings
+worker_recordings = collections.OrderedDict()
+
+#: In a worker process, the estimated size in bytes of the recording of each page
+worker_recording_sizes = {}
+
+#: In a worker process, the estimated memory used by :data:`worker_recordings`, in bytes
+worker_recordings_bytes = 0
+
+#: In a worker process, the maximum memory used by :data:`worker_recordings`, in bytes
+worker_max_recording_bytes = 0
+
+
+def get_shared_dir():
+    """ Get the directory where the pixel buffers are exchanged between processes.
+
+    Returns:
+        `str`: :file:`/dev/shm` if it exists, as it is backed by RAM, and the temporary directory otherwise
+    """
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    else:
+        return tempfile.gettempdir()
+
+
+def init_worker(uri, max_recording_bytes = 0, prefix = 'pympress-'):
+    """ Initialize a worker process, by opening its own copy of the document.
+
+    Args:
+        uri (`str`): The URI of the document from which pages will be rendered
+        max_recording_bytes (`int`): The maximum memory used by the recorded drawings of pages, in bytes
+        prefix (`str`): The prefix of the names of the buffers in which pages are rendered
+    """
+    global worker_doc, worker_prefix, worker_recordings_bytes, worker_max_recording_bytes
+    worker_prefix = prefix
+
+    # Spawned processes do not run pympress.__main__, and the document module logs translated messages
+    gettext.install('pympress', util.get_locale_dir())
+
+    worker_doc = Poppler.Document.new_from_file(uri, None)
+    worker_read_pages.clear()
+    worker_recordings.clear()
+    worker_recording_sizes.clear()
+    worker_recordings_bytes = 0
+    worker_max_recording_bytes = max_recording_bytes
+
+
+def get_worker_page(page_nb):
+    """ Get a page of the worker's document, ready to be rendered. This is called in the worker processes.
+
+    Args:
+        page_nb (`int`):  number of the page
+
+    Returns:
+        :class:`~Poppler.Page`: the page, with text-only annotations hidden as in the main process
+    """
+    page = worker_doc.get_page(page_nb)
+    if page_nb not in worker_read_pages:
+        document.read_annotations(page)
+        worker_read_pages.add(page_nb)
+    return page
+
+
+def get_worker_recording(page_nb):
+    """ Get the recorded drawing of a page of the worker's document, recording it if needed. This is called in the worker processes.
+
+    As in :meth:`~pympress.document.Document.get_recording`, pages are only recorded within :data:`worker_max_recording_bytes`.
+
+    Args:
+        page_nb (`int`):  number of the page
+
+    Returns:
+        :class:`~cairo.RecordingSurface`: the recorded page, or `None` if it is not recorded
+    """
+    global worker_recordings_bytes
+
+    if page_nb in worker_recordings:
+        worker_recordings[page_nb] = worker_recordings.pop(page_nb)
+        return worker_recordings[page_nb]
+
+    if worker_max_recording_bytes <= 0:
+        return None
+
+    page = get_worker_page(page_nb)
+    if page_nb not in worker_recording_sizes:
+        worker_recording_sizes[page_nb] = document.recording_bytes(page)
+    size = worker_recording_sizes[page_nb]
+    if size > worker_max_recording_bytes:
+        return None
+
+    while worker_recordings and worker_recordings_bytes + size > worker_max_recording_bytes:
+        worker_recordings_bytes -= worker_recording_sizes[worker_recordings.popitem(False)[0]]
+
+    recording = worker_recordings[page_nb] = document.record_poppler_page(page)
+    worker_recordings_bytes += size
+    return recording
+
+
+def fingerprint_pages(pages, dtypes):
+    """ Compute the fingerprints of pages. This is called in the worker processes.
+
+    Args:
+        pages (`list` of `int`):  numbers of the pages to fingerprint
+        dtypes (`list` of `int`):  the types of document for which to fingerprint each page
+
+    Returns:
+        `list` of `tuple`: the page number, type and fingerprint of each page
+    """
+    fingerprints = []
+    for page_nb in pages:
+        for dtype in dtypes:
+            try:
+                fingerprints.append((page_nb, dtype, document.fingerprint_poppler_page(get_worker_page(page_nb), dtype)))
+            except Exception:
+                logger.exception('Fingerprinting page {} failed in worker process'.format(page_nb))
+    return fingerprints
+
+
+def render_to_buffer(page_nb, ww, wh, dtype, region = None):
+    """ Render a page in a new shared buffer. This is called in the worker processes.
+
+    Args:
+        page_nb (`int`):  number of the page to render
+        ww (`int`):  target width in pixels
+        wh (`int`):  target height in pixels
+        dtype (`int`):  the type of document that should be rendered
+        region (`tuple`):  the left, top, width and height in pixels of the only part of the page to render, or `None`
+
+    Returns:
+        `tuple`: the path to the buffer, its width, height and stride, or `None` if the rendering failed
+    """
+    x, y, bw, bh = region if region is not None else (0, 0, ww, wh)
+    stride = cairo.ImageSurface.format_stride_for_width(PIXEL_FORMAT, bw)
+    fd, path = tempfile.mkstemp(prefix=worker_prefix, suffix='.raw', dir=get_shared_dir())
+    try:
+        os.ftruncate(fd, stride * bh)
+        buf = mmap.mmap(fd, stride * bh)
+    except (OSError, ValueError, EnvironmentError):
+        logger.exception('Can not allocate a shared buffer to render page {}'.format(page_nb))
+        os.remove(path)
+        return None
+    finally:
+        os.close(fd)
+
+    try:
+        page = get_worker_page(page_nb)
+        surface = cairo.ImageSurface.create_for_data(buf, PIXEL_FORMAT, bw, bh, stride)
+        context = cairo.Context(surface)
+        context.translate(-x, -y)
+        # Regions, e.g. the tiles of a zoomed page, replay the same recording as the whole page
+        document.render_poppler_page(page, context, ww, wh, dtype, get_worker_recording(page_nb))
+        del context
+
+        surface.flush()
+        surface.finish()
+        del surface
+    except Exception:
+        logger.exception('Rendering page {} failed in worker process'.format(page_nb))
+        del buf
+        os.remove(path)
+        return None
+
+    del buf
+    return path, bw, bh, stride
+
+
+def call_safely(function, *args):
+    """ Call a function in a worker process, logging the exception if it fails. This is called in the worker processes.
+
+    Args:
+        function (`function`):  the function to call
+        args (`tuple`):  the arguments of the function
+
+    Returns:
+        the result of the function, or `None` if it raised an exception
+    """
+    try:
+        return function(*args)
+    except Exception:
+        logger.exception('Job failed in worker process')
+        return None
+
+
+def load_buffer(path, width, height, stride):
+    """ Wrap a buffer rendered by a worker in a :class:`~cairo.ImageSurface`, without copying it.
+
+    The file backing the buffer is removed once it is mapped, so that the memory is released
+    as soon as the surface is no longer used.
+
+    Args:
+        path (`str`): the path to the buffer
+        width (`int`): width of the rendered page in pixels
+        height (`int`): height of the rendered page in pixels
+        stride (`int`): the number of bytes of each line of pixels in the buffer
+
+    Returns:
+        :class:`~cairo.ImageSurface`: the rendered page
+    """
+    with open(path, 'r+b') as f:
+        buf = mmap.mmap(f.fileno(), stride * height)
+
+    try:
+        os.remove(path)
+    except OSError:
+        # Windows does not allow to remove a mapped file, copy it to memory instead
+        data = bytearray(buf)
+        buf.close()
+        os.remove(path)
+        buf = data
+
+    return cairo.ImageSurface.create_for_data(buf, PIXEL_FORMAT, width, height, stride)
+
+
+def discard_buffer(result):
+    """ Release a buffer rendered by a worker that is not needed anymore.
+
+    Args:
+        result (`tuple`): the value returned by :func:`~pympress.render_pool.render_to_buffer`
+    """
+    if result is None:
+        return
+
+    try:
+        os.remove(result[0])
+    except OSError as e:
+        # Buffers still in flight are removed when their pool is closed
+        if e.errno != errno.ENOENT:
+            logger.warning('Can not remove rendering buffer {}'.format(result[0]))
+
+
+class RenderPool(object):
+    """ A pool of processes rendering pages of a document in parallel.
+
+    Args:
+        workers (`int`): The number of worker processes to start, 0 disables the pool
+    """
+    #: Number of worker processes
+    workers = 0
+    #: The :class:`~multiprocessing.pool.Pool` of workers, or `None` if there is no document or no workers
+    pool = None
+    #: `str` prefix of the names of the buffers rendered by the current :attr:`pool`
+    prefix = 'pympress-'
+    #: :class:`~itertools.count` numbering the pools and the jobs
+    counter = None
+
+    #: `int` number of seconds after which a job that did not complete is considered lost, e.g. because its worker died
+    job_timeout = 30
+    #: `dict` of the time each running job started and its error callback, by job number
+    jobs = {}
+    #: :class:`~threading.Lock` protecting :attr:`jobs`, which are completed from the helper threads of the pool
+    jobs_lock = None
+    #: `int` the GLib source ID of :meth:`check_jobs`, or 0 if it is not scheduled
+    watchdog = 0
+
+    def __init__(self, workers):
+        self.workers = max(0, workers)
+        self.counter = itertools.count()
+        self.jobs = {}
+        self.jobs_lock = threading.Lock()
+
+
+    def is_active(self):
+        """ Whether pages can be rendered by this pool.
+
+        Returns:
+            `bool`: `True` if there are workers with an open document, `False` otherwise
+        """
+        return self.pool is not None
+
+
+    def open_document(self, uri, max_recording_bytes = 0):
+        """ Restart the workers so that they render pages from a new document.
+
+        Args:
+            uri (`str`): the URI of the new document, or `None` if no document is open
+            max_recording_bytes (`int`): the maximum memory used by the recorded drawings of pages in each worker, in bytes
+        """
+        self.close()
+
+        if uri is None or not self.workers:
+            return
+
+        try:
+            # Avoid forking a process that runs a Gtk main loop in other threads
+            context = multiprocessing.get_context('spawn')
+        except AttributeError:
+            context = multiprocessing
+
+        self.prefix = 'pympress-{}-{}-'.format(os.getpid(), next(self.counter))
+        try:
+            self.pool = context.Pool(self.workers, init_worker, (uri, max_recording_bytes, self.prefix))
+        except (OSError, ValueError, EnvironmentError):
+            logger.exception('Can not start render workers, rendering on the main thread')
+            self.pool = None
+
+
+    def apply_async(self, function, args, callback, error_callback, discard = None):
+        """ Run a function in a worker, calling back with its result or with the exception it raised.
+
+        Only one of the callbacks is called for each job. Called on the main thread.
+
+        Args:
+            function (`function`):  the function to run in a worker process
+            args (`tuple`):  the arguments of the function
+            callback (`function`): called with the result of the function, from a helper thread of the pool
+            error_callback (`function`): called with the exception if the function failed, from a helper thread
+                                         of the pool, or with a :class:`~multiprocessing.TimeoutError` from the main
+                                         thread if the job was lost
+            discard (`function`): called with the result of the function if it arrives after the job was considered lost
+        """
+        job = next(self.counter)
+        with self.jobs_lock:
+            self.jobs[job] = (time.time(), error_callback)
+
+        def done(result):
+            with self.jobs_lock:
+                running = self.jobs.pop(job, None) is not None
+            if running:
+                callback(result)
+            elif discard is not None:
+                discard(result)
+
+        def failed(error):
+            with self.jobs_lock:
+                running = self.jobs.pop(job, None) is not None
+            if running and error_callback is not None:
+                error_callback(error)
+
+        try:
+            self.pool.apply_async(function, args, callback = done, error_callback = failed)
+        except TypeError:
+            # python 2 has no error callbacks: failures are reported as a result of None
+            self.pool.apply_async(call_safely, (function,) + tuple(args), callback = done)
+
+        if not self.watchdog:
+            self.watchdog = GLib.timeout_add_seconds(5, self.check_jobs)
+
+
+    def check_jobs(self):
+        """ Report the jobs that did not complete within :attr:`job_timeout` as failed. Called periodically on the main thread.
+
+        The workers of a :class:`~multiprocessing.pool.Pool` are replaced when they die, but their jobs are never completed.
+
+        Returns:
+            `bool`: whether there are still jobs running, and thus whether this function should be called again
+        """
+        now = time.time()
+        with self.jobs_lock:
+            lost = [job for job, (started, error_callback) in self.jobs.items() if now - started > self.job_timeout]
+            callbacks = [self.jobs.pop(job)[1] for job in lost]
+            running = bool(self.jobs)
+
+        for error_callback in callbacks:
+            if error_callback is not None:
+                error_callback(multiprocessing.TimeoutError('job did not complete in {}s, its worker might have died'
+                                                            .format(self.job_timeout)))
+
+        if not running:
+            self.watchdog = 0
+        return running
+
+
+    def submit(self, page_nb, ww, wh, dtype, callback, region = None, error_callback = None):
+        """ Queue a page to be rendered by the workers.
+
+        Args:
+            page_nb (`int`):  number of the page to render
+            ww (`int`):  target width in pixels
+            wh (`int`):  target height in pixels
+            dtype (`int`):  the type of document that should be rendered
+            callback (`function`): called with the result of :func:`~pympress.render_pool.render_to_buffer`,
+                                   from a helper thread of the pool (not from the main thread)
+            region (`tuple`):  the left, top, width and height in pixels of the only part of the page to render, or `None`
+            error_callback (`function`): called with the exception if the rendering failed, or if it did not complete
+                                         because its worker died, see :meth:`apply_async`
+        """
+        self.apply_async(render_to_buffer, (page_nb, ww, wh, dtype, region), callback, error_callback, discard_buffer)
+
+
+    def fingerprint(self, pages, dtypes, callback, error_callback = None):
+        """ Queue pages to be fingerprinted by the workers.
+
+        Args:
+            pages (`list` of `int`):  numbers of the pages to fingerprint
+            dtypes (`list` of `int`):  the types of document for which to fingerprint each page
+            callback (`function`): called with the result of :func:`~pympress.render_pool.fingerprint_pages`,
+                                   from a helper thread of the pool (not from the main thread)
+            error_callback (`function`): called with the exception if fingerprinting failed or did not complete,
+                                         see :meth:`apply_async`
+        """
+        self.apply_async(fingerprint_pages, (pages, dtypes), callback, error_callback)
+
+
+    def close(self):
+        """ Stop all the workers, and remove the buffers they rendered that were not delivered.
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+            shared_dir = get_shared_dir()
+            for name in os.listdir(shared_dir):
+                if name.startswith(self.prefix):
+                    try:
+                        os.remove(os.path.join(shared_dir, name))
+                    except OSError:
+                        logger.warning('Can not remove rendering buffer {}'.format(name))
+
+        with self.jobs_lock:
+            self.jobs.clear()
+        if self.watchdog:
+            GLib.Source.remove(self.watchdog)
+            self.watchdog = 0
+
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
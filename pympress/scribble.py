@@ -34,21 +34,30 @@ import cairo
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, Gdk
 
-from pympress import builder, surfacecache, document, extras
-from pympress.ui import PDF_REGULAR, PDF_CONTENT_PAGE, PDF_NOTES_PAGE
+from pympress import builder, surfacecache, document, extras, strokes
+from pympress.document import PDF_REGULAR, PDF_CONTENT_PAGE, PDF_NOTES_PAGE
 
 
 class Scribbler(builder.Builder):
     #: Whether we are displaying the interface to scribble on screen and the overlays containing said scribbles
     scribbling_mode = False
-    #: `list` of scribbles to be drawn, as tuples of color :class:`~Gdk.RGBA`, width `int`, and a `list` of points.
+    #: `list` of scribbles to be drawn on the current page, as :class:`~pympress.strokes.Stroke`s
     scribble_list = []
+    #: :class:`~pympress.strokes.ScribbleStore` with the scribbles of all pages of the document
+    scribbles = None
     #: Whether the current mouse movements are drawing strokes or should be ignored
     scribble_drawing = False
+    #: :class:`~Gdk.Window` whose motion events are not compressed while drawing a stroke, or `None`
+    scribble_window = None
     #: :class:`~Gdk.RGBA` current color of the scribbling tool
     scribble_color = Gdk.RGBA()
     #: `int` current stroke width of the scribbling tool
     scribble_width = 1
+    #: `dict` mapping widgets to their layer of drawn scribbles: the :class:`~cairo.Surface`, the size and zoom
+    #: it was drawn for, the number of strokes entirely drawn and the number of points drawn of the next stroke
+    scribble_layers = {}
+    #: `int` number of times a layer was drawn again from scratch
+    layer_redraws = 0
 
     #: :class:`~Gtk.HBox` that is replaces normal panes when scribbling is toggled, contains buttons and scribble drawing area
     scribble_overlay = None
@@ -122,6 +131,9 @@ class Scribbler(builder.Builder):
         self.scribble_width = config.getint('scribble', 'width')
 
         self.config = config
+        self.scribble_layers = {}
+        self.scribbles = strokes.ScribbleStore()
+        self.scribble_list = self.scribbles.get(0)
 
         # Presenter-size setup
         self.get_object("scribble_color").set_rgba(self.scribble_color)
@@ -160,7 +172,7 @@ class Scribbler(builder.Builder):
             `bool`: whether the event was consumed
         """
         if self.scribble_drawing:
-            self.scribble_list[-1][2].append(self.get_slide_point(widget, event))
+            self.scribble_list[-1].add_point(*self.get_slide_point(widget, event))
 
             self.redraw_current_slide()
             return True
@@ -182,38 +194,118 @@ class Scribbler(builder.Builder):
             return False
 
         if event.get_event_type() == Gdk.EventType.BUTTON_PRESS:
-            self.scribble_list.append( (self.scribble_color, self.scribble_width, []) )
-            self.scribble_drawing = True
+            color = self.scribble_color
+            self.scribble_list.append(strokes.Stroke((color.red, color.green, color.blue, color.alpha), self.scribble_width))
+            self.scribbles.modified = True
+            self.start_drawing(widget.get_window())
 
             return self.track_scribble(widget, event)
         elif event.get_event_type() == Gdk.EventType.BUTTON_RELEASE:
-            self.scribble_drawing = False
+            self.stop_drawing()
             return True
 
         return False
 
 
-    def draw_scribble(self, widget, cairo_context):
-        """ Perform the drawings by user.
+    def start_drawing(self, window):
+        """ Start drawing a stroke, receiving every motion event of its window until :meth:`stop_drawing` is called.
 
         Args:
-            widget (:class:`~Gtk.DrawingArea`): The widget where to draw the scribbles.
-            cairo_context (:class:`~cairo.Context`): The canvas on which to render the drawings
+            window (:class:`~Gdk.Window`):  the window on which the stroke is drawn
         """
-        ww, wh = widget.get_allocated_width(), widget.get_allocated_height()
+        self.stop_drawing()
+        self.scribble_drawing = True
+
+        # Receive every motion of the pen while drawing, redraws are still done once per frame
+        self.scribble_window = window
+        window.set_event_compression(False)
+
 
-        cairo_context.set_line_cap(cairo.LINE_CAP_ROUND)
+    def stop_drawing(self):
+        """ End the stroke being drawn, if any, and compress the motion events of its window again.
 
-        for color, width, points in self.scribble_list:
-            points = [(p[0] * ww, p[1] * wh) for p in points]
+        This is called when the button is released, when the pointer leaves the slide, or when the page changes.
+        """
+        self.scribble_drawing = False
+        if self.scribble_window is not None:
+            self.scribble_window.set_event_compression(True)
+            self.scribble_window = None
+
+
+    def leave_scribble(self, widget, event):
+        """ End the stroke being drawn when the pointer leaves the slide.
+
+        Args:
+            widget (:class:`~Gtk.Widget`):  the widget which has received the event.
+            event (:class:`~Gdk.Event`):  the GTK event.
+
+        Returns:
+            `bool`: whether the event was consumed
+        """
+        if event.mode == Gdk.CrossingMode.NORMAL:
+            self.stop_drawing()
+        return False
+
+
+    def draw_scribble(self, widget, cairo_context, zoom_matrix):
+        """ Perform the drawings by user.
 
-            cairo_context.set_source_rgba(*color)
-            cairo_context.set_line_width(width)
-            cairo_context.move_to(*points[0])
+        Strokes are drawn once in a layer surface kept for each widget, to which only the new segments are added.
+        The layer is drawn again entirely when the widget is resized or zoomed, or when scribbles are removed.
 
-            for p in points[1:]:
-                cairo_context.line_to(*p)
-            cairo_context.stroke()
+        Args:
+            widget (:class:`~Gtk.DrawingArea`): The widget where to draw the scribbles.
+            cairo_context (:class:`~cairo.Context`): The canvas on which to render the drawings
+            zoom_matrix (:class:`~cairo.Matrix`): The transformation from the slide to the widget, when zoomed
+        """
+        ww, wh = widget.get_allocated_width(), widget.get_allocated_height()
+        key = (ww, wh) + tuple(zoom_matrix)
+
+        layer = self.scribble_layers.get(widget)
+        if layer is None or layer[1] != key:
+            surface = widget.get_window().create_similar_surface(cairo.CONTENT_COLOR_ALPHA, ww, wh)
+            layer = self.scribble_layers[widget] = [surface, key, 0, 0]
+            self.layer_redraws += 1
+
+        surface, key, done_strokes, done_points = layer
+        layer_context = cairo.Context(surface)
+        layer_context.transform(zoom_matrix)
+        layer_context.set_line_cap(cairo.LINE_CAP_ROUND)
+        layer_context.set_line_join(cairo.LINE_JOIN_ROUND)
+
+        live = None
+        for n in range(done_strokes, len(self.scribble_list)):
+            stroke = self.scribble_list[n]
+            first = done_points if n == done_strokes else 0
+
+            if not self.scribble_drawing or n < len(self.scribble_list) - 1:
+                stroke.draw(layer_context, ww, wh, max(0, first - 1))
+                layer[2:] = [n + 1, 0]
+            elif stroke.color[3] < 1:
+                # Overlapping segments of translucent strokes would blend twice: draw the stroke being drawn
+                # on top of the layer until it is finished
+                live = stroke, 0
+            else:
+                # Only the last point moves with the pen: add the segments up to the previous point to the layer,
+                # and draw the last segment on top of it
+                fixed = max(0, len(stroke) - 1)
+                stroke.draw(layer_context, ww, wh, max(0, first - 1), fixed)
+                layer[2:] = [n, fixed]
+                live = stroke, max(0, fixed - 1)
+
+        del layer_context
+
+        cairo_context.set_source_surface(surface, 0, 0)
+        cairo_context.paint()
+
+        if live is not None:
+            stroke, first = live
+            cairo_context.save()
+            cairo_context.transform(zoom_matrix)
+            cairo_context.set_line_cap(cairo.LINE_CAP_ROUND)
+            cairo_context.set_line_join(cairo.LINE_JOIN_ROUND)
+            stroke.draw(cairo_context, ww, wh, first)
+            cairo_context.restore()
 
 
     def update_color(self, widget):
@@ -241,7 +333,10 @@ class Scribbler(builder.Builder):
     def clear_scribble(self, *args):
         """ Callback for the scribble clear button, to remove all scribbles
         """
-        del self.scribble_list[:]
+        if self.scribble_list:
+            del self.scribble_list[:]
+            self.scribbles.modified = True
+        self.scribble_layers.clear()
 
         self.redraw_current_slide()
 
@@ -251,6 +346,37 @@ class Scribbler(builder.Builder):
         """
         if self.scribble_list:
             self.scribble_list.pop()
+            self.scribbles.modified = True
+            self.scribble_layers.clear()
+
+        self.redraw_current_slide()
+
+
+    def set_document(self, path):
+        """ Save the scribbles of the previous document, and use the ones of a new document.
+
+        Args:
+            path (`str`): the path or URI to the new document, or `None` if there is no document
+        """
+        self.scribbles.save()
+
+        if path is not None and self.config.getboolean('scribble', 'save_to_file'):
+            self.scribbles = strokes.ScribbleStore(strokes.ScribbleStore.sidecar_path(path))
+        else:
+            self.scribbles = strokes.ScribbleStore()
+
+        self.set_page(0)
+
+
+    def set_page(self, page_nb):
+        """ Display the scribbles of a page, which are kept since the page was last displayed.
+
+        Args:
+            page_nb (`int`): the number of the page
+        """
+        self.stop_drawing()
+        self.scribble_list = self.scribbles.get(page_nb)
+        self.scribble_layers.clear()
 
         self.redraw_current_slide()
 
@@ -336,6 +462,7 @@ class Scribbler(builder.Builder):
         if not self.scribbling_mode:
             return False
 
+        self.stop_drawing()
         self.swap_layout('highlight', None)
         p_layout = self.p_central.get_children()[0]
 
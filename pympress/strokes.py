@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+#
+#       strokes.py
+#
+#       Copyright 2018 Cimbali <me@cimba.li>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+"""
+:mod:`pympress.strokes` -- storage of the scribbles' strokes
+------------------------------------------------------------
+
+This module stores the strokes drawn by the :class:`~pympress.scribble.Scribbler`, without
+depending on Gtk, so that it can be used and benchmarked without a display.
+
+The points of a stroke are stored as fractions of the slide's width and height, in a compact
+:class:`~array.array` of single precision floats, and simplified as they are added: samples
+that are too close to the previous point, or that continue the current segment in the same
+direction, move the end of the stroke instead of adding a point.
+
+The strokes of all the pages of a document are kept by a :class:`ScribbleStore`, and can be
+saved in a small binary file next to the document. Only the index of the file is read when
+it is opened, the strokes of each page are read the first time the page is displayed.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import sys
+import math
+import array
+import struct
+
+try:
+    from urllib.request import url2pathname
+except ImportError:
+    from urllib import url2pathname
+
+import cairo
+
+
+#: Minimum distance between two points of a stroke, as a fraction of the slide's size (about 2 pixels on a full HD screen)
+MIN_DISTANCE = 1e-3
+
+#: Maximum angle, in degrees, by which a segment can change direction before a new point is added
+MAX_ANGLE = 2.
+
+#: Extension added to the document's path to get the path of the file where its scribbles are saved
+SIDECAR_EXTENSION = '.scribbles'
+
+#: Magic string identifying files of scribbles
+MAGIC = b'PSB1'
+
+#: Header of the files of scribbles: magic string and number of pages, followed by the index
+HEADER = struct.Struct(str('<4sI'))
+
+#: Entry of the index, for each page: page number, offset and size of the page's strokes in the file
+INDEX_ENTRY = struct.Struct(str('<IQI'))
+
+#: Header of the strokes of a page: number of strokes
+PAGE_HEADER = struct.Struct(str('<I'))
+
+#: Header of a stroke: red, green, blue, alpha, width and number of points, followed by the points
+STROKE_HEADER = struct.Struct(str('<5fI'))
+
+
+def points_to_bytes(points):
+    """ Get the little-endian binary representation of the points of a stroke.
+
+    Args:
+        points (:class:`~array.array`): the coordinates of the points
+
+    Returns:
+        `bytes`: the coordinates, as little-endian single precision floats
+    """
+    if sys.byteorder == 'big':
+        points = array.array('f', points)
+        points.byteswap()
+
+    try:
+        return points.tobytes()
+    except AttributeError:
+        return points.tostring()
+
+
+def points_from_bytes(data):
+    """ Read the points of a stroke from their binary representation, see :func:`points_to_bytes`.
+
+    Args:
+        data (`bytes`): the coordinates, as little-endian single precision floats
+
+    Returns:
+        :class:`~array.array`: the coordinates of the points
+    """
+    points = array.array('f')
+    try:
+        points.frombytes(data)
+    except AttributeError:
+        points.fromstring(data)
+
+    if sys.byteorder == 'big':
+        points.byteswap()
+    return points
+
+
+class Stroke(object):
+    """ A stroke drawn on a slide, i.e. a line through points with a color and a width.
+
+    The last point of the stroke is the latest position of the pen. It is moved rather than kept when the next
+    sample does not change the shape of the stroke, so all points except the last one are final.
+
+    Args:
+        color (`tuple`): the red, green, blue and alpha components of the stroke's color, between 0 and 1
+        width (`int`): the width of the stroke, in pixels
+    """
+    #: `tuple` of the red, green, blue and alpha components of the stroke's color
+    color = (0., 0., 0., 1.)
+    #: `int` width of the stroke, in pixels
+    width = 1
+    #: :class:`~array.array` of the x and y coordinates of the points, interleaved, as fractions of the slide's size
+    points = None
+    #: `int` number of samples added to the stroke, before simplification
+    samples = 0
+    #: `tuple` unit vector of the direction of the last segment, or `None` if it is not known yet
+    direction = None
+
+    #: `float` minimum distance between points, see :const:`MIN_DISTANCE`
+    min_distance = MIN_DISTANCE
+    #: `float` cosine of the maximum change of direction in a segment, see :const:`MAX_ANGLE`
+    min_cosine = math.cos(math.radians(MAX_ANGLE))
+
+    def __init__(self, color, width):
+        self.color = tuple(color)
+        self.width = width
+        self.points = array.array('f')
+        self.samples = 0
+        self.direction = None
+
+
+    def __len__(self):
+        """ Get the number of points in the stroke.
+
+        Returns:
+            `int`: the number of points
+        """
+        return len(self.points) // 2
+
+
+    def add_point(self, x, y):
+        """ Add a sample of the pen's position to the stroke, simplifying the stroke on the way.
+
+        Args:
+            x (`float`): horizontal position, as a fraction of the slide's width
+            y (`float`): vertical position, as a fraction of the slide's height
+
+        Returns:
+            `bool`: `True` if a point was added, `False` if the last point was moved
+        """
+        self.samples += 1
+        points = self.points
+
+        if len(points) < 4:
+            points.extend((x, y))
+            return True
+
+        dx, dy = x - points[-4], y - points[-3]
+        distance = math.hypot(dx, dy)
+
+        if distance < self.min_distance:
+            # Too close to the previous point to change the shape: move the end of the stroke
+            pass
+        elif self.direction is None:
+            self.direction = (dx / distance, dy / distance)
+        elif (dx * self.direction[0] + dy * self.direction[1]) / distance >= self.min_cosine:
+            # Still in the same direction as the segment: extend it
+            pass
+        else:
+            # The stroke turns: keep the previous end as a point, and start a new segment
+            points.extend((x, y))
+            self.direction = None
+            return True
+
+        points[-2], points[-1] = x, y
+        return False
+
+
+    def draw(self, cairo_context, ww, wh, first = 0, last = None):
+        """ Draw the segments of the stroke between two of its points.
+
+        Args:
+            cairo_context (:class:`~cairo.Context`): The canvas on which to draw
+            ww (`int`): The width of the slide on the canvas
+            wh (`int`): The height of the slide on the canvas
+            first (`int`): The index of the first point to draw
+            last (`int`): The index after the last point to draw, or `None` to draw up to the end of the stroke
+        """
+        points = self.points
+        last = len(self) if last is None else min(last, len(self))
+        if first >= last:
+            return
+
+        # Build the path in slide coordinates, and let cairo scale all points to the canvas.
+        # The line width is set after restoring, so that it is not scaled.
+        cairo_context.save()
+        cairo_context.scale(ww, wh)
+        cairo_context.move_to(points[2 * first], points[2 * first + 1])
+        for n in range(2 * first + 2, 2 * last, 2):
+            cairo_context.line_to(points[n], points[n + 1])
+        cairo_context.restore()
+
+        cairo_context.set_source_rgba(*self.color)
+        cairo_context.set_line_width(self.width)
+        cairo_context.stroke()
+
+
+    def get_bytes(self):
+        """ Get the memory used by the points of the stroke.
+
+        Returns:
+            `int`: the size of the points, in bytes
+        """
+        return len(self.points) * self.points.itemsize
+
+
+class ScribbleStore(object):
+    """ The strokes drawn on each page of a document, optionally saved in a file.
+
+    Args:
+        path (`str`): the path to the file where strokes are saved, or `None` to keep them only in memory
+    """
+    #: `str` path to the file where the strokes are saved, or `None`
+    path = None
+    #: `dict` mapping page numbers to the `list` of :class:`Stroke`s of the page, for the pages that were displayed
+    pages = {}
+    #: `dict` mapping page numbers to the offset and size of their strokes in the file, for pages not read yet
+    index = {}
+    #: `bool` whether strokes were changed since the file was last saved
+    modified = False
+
+    def __init__(self, path = None):
+        self.path = path
+        self.pages = {}
+        self.index = {}
+        self.modified = False
+
+        if path is not None and os.path.exists(path):
+            self.read_index()
+
+
+    @staticmethod
+    def sidecar_path(doc_path):
+        """ Get the path of the file where the strokes of a document are saved.
+
+        Args:
+            doc_path (`str`): the path or URI to the document
+
+        Returns:
+            `str`: the path to the file of strokes
+        """
+        if doc_path.startswith('file://'):
+            doc_path = url2pathname(doc_path[len('file://'):])
+        return doc_path + SIDECAR_EXTENSION
+
+
+    def read_index(self):
+        """ Read which pages have strokes in the file, and where they are.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                magic, count = HEADER.unpack(f.read(HEADER.size))
+                if magic != MAGIC:
+                    raise ValueError('Invalid scribbles file header')
+
+                for _ in range(count):
+                    page_nb, offset, size = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+                    self.index[page_nb] = (offset, size)
+        except (IOError, OSError, ValueError, struct.error):
+            logger.warning('Can not read scribbles from {}'.format(self.path), exc_info = True)
+            self.index = {}
+
+
+    def read_page(self, page_nb):
+        """ Read the strokes of a page from the file.
+
+        Args:
+            page_nb (`int`): the number of the page
+
+        Returns:
+            `list` of :class:`Stroke`: the strokes of the page
+        """
+        offset, size = self.index.pop(page_nb)
+        strokes = []
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(size)
+
+            count, = PAGE_HEADER.unpack_from(data, 0)
+            pos = PAGE_HEADER.size
+            for _ in range(count):
+                red, green, blue, alpha, width, length = STROKE_HEADER.unpack_from(data, pos)
+                pos += STROKE_HEADER.size
+
+                stroke = Stroke((red, green, blue, alpha), width)
+                stroke.points = points_from_bytes(data[pos:pos + 8 * length])
+                stroke.samples = len(stroke)
+                pos += 8 * length
+
+                if len(stroke) != length:
+                    raise ValueError('Truncated scribbles')
+                strokes.append(stroke)
+        except (IOError, OSError, ValueError, struct.error):
+            logger.warning('Can not read scribbles of page {} from {}'.format(page_nb + 1, self.path), exc_info = True)
+
+        return strokes
+
+
+    def get(self, page_nb):
+        """ Get the strokes of a page, reading them from the file the first time.
+
+        Args:
+            page_nb (`int`): the number of the page
+
+        Returns:
+            `list` of :class:`Stroke`: the strokes of the page, which can be modified in place
+        """
+        if page_nb not in self.pages:
+            self.pages[page_nb] = self.read_page(page_nb) if page_nb in self.index else []
+        return self.pages[page_nb]
+
+
+    def save(self):
+        """ Write the strokes of all pages to the file, if they changed.
+
+        Pages that were never read are copied from the previous file without being decoded.
+        """
+        if self.path is None or not self.modified:
+            return
+
+        blocks = {}
+        try:
+            if self.index:
+                with open(self.path, 'rb') as f:
+                    for page_nb, (offset, size) in self.index.items():
+                        f.seek(offset)
+                        blocks[page_nb] = f.read(size)
+
+            for page_nb, strokes in self.pages.items():
+                if not strokes or page_nb < 0:
+                    continue
+                data = [PAGE_HEADER.pack(len(strokes))]
+                for stroke in strokes:
+                    data.append(STROKE_HEADER.pack(*stroke.color + (stroke.width, len(stroke))))
+                    data.append(points_to_bytes(stroke.points))
+                blocks[page_nb] = b''.join(data)
+
+            if not blocks:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                self.index = {}
+                self.modified = False
+                return
+
+            # Write to a temporary file, so that scribbles are not lost if writing fails
+            tmp_path = self.path + '.tmp'
+            index = {}
+            offset = HEADER.size + INDEX_ENTRY.size * len(blocks)
+            with open(tmp_path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, len(blocks)))
+                for page_nb in sorted(blocks):
+                    index[page_nb] = (offset, len(blocks[page_nb]))
+                    f.write(INDEX_ENTRY.pack(page_nb, offset, len(blocks[page_nb])))
+                    offset += len(blocks[page_nb])
+                for page_nb in sorted(blocks):
+                    f.write(blocks[page_nb])
+
+            try:
+                # Atomically, so that the previous scribbles are kept if anything fails
+                os.replace(tmp_path, self.path)
+            except AttributeError:
+                # python 2 has no os.replace, and its os.rename does not overwrite files on Windows
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                os.rename(tmp_path, self.path)
+        except (IOError, OSError):
+            logger.warning('Can not save scribbles to {}'.format(self.path), exc_info = True)
+            return
+
+        # Pages not read yet are now at new offsets
+        self.index = {page_nb: index[page_nb] for page_nb in self.index}
+        self.modified = False
+
+
+    def get_stats(self):
+        """ Get statistics about the stored strokes.
+
+        Returns:
+            `dict`: the numbers of pages read, pages not read yet, strokes and points in memory, and their size
+        """
+        strokes = [stroke for page in self.pages.values() for stroke in page]
+        return {
+            'pages': len(self.pages),
+            'unread_pages': len(self.index),
+            'strokes': len(strokes),
+            'points': sum(len(stroke) for stroke in strokes),
+            'bytes': sum(stroke.get_bytes() for stroke in strokes),
+        }
+
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
@@ -28,9 +28,51 @@ This modules contains stuff needed for caching pages and prerendering them. This
 is done by the :class:`~pympress.surfacecache.SurfaceCache` class, using several
 `dict` of :class:`~cairo.ImageSurface` for storing rendered pages.
 
+All these `dict` share a single memory budget: the size of each surface is accounted
+for, and the Least Recently Used pages of any widget are evicted when the budget is exceeded.
+
+Widgets that display the same page at the same size and with the same type (e.g. the
+current slide in the presenter window and in the scribbling view) share a single
+surface: surfaces are stored once by (page, width, height, type), with a count of the
+widgets that reference them, and are only rendered once. When a page is needed at a size
+smaller than one already rendered, e.g. for the next slide preview after the page was shown
+in the content window, it is downscaled from the larger surface instead of being rendered.
+
+In notes mode, when the content and notes halves of a page are displayed at the same scale,
+the whole page is rendered once and both halves are stored as sub-surfaces of that rendering.
+
+Pages are fingerprinted in the background by the render workers (see
+:func:`~pympress.document.fingerprint_poppler_page`). When a page is rendered and its fingerprint
+matches that of a page already rendered at the same size, both renderings are compared pixel by pixel,
+and if they are identical (e.g. repeated slides) the pages share a single surface from then on.
+
+When a page probably differs from a neighbouring page that is already rendered only by a small region
+(see :meth:`~pympress.document.Document.changed_region`), e.g. for beamer overlays, a worker only renders
+that region, which is painted over a copy of the neighbouring page. As fingerprints can miss small differences,
+such a page is rendered in full later, at the lowest priority, and replaced if the full rendering differs.
+
 The problem is, neither Gtk+ nor Poppler are particularly threadsafe.
 Hence the prerendering isn't really done in parallel in another thread, but
-scheduled on the main thread at idle times using GLib.idle_add().
+either delegated to worker processes of a :class:`~pympress.render_pool.RenderPool`,
+or, if there are no workers, scheduled on the main thread at idle times using GLib.idle_add().
+
+Prerendering jobs wait in a single priority queue, ordered by how likely the page is
+to be displayed soon (see :mod:`pympress.prefetch`) and by importance of the widget.
+Each time the current page changes, jobs for pages that are no longer expected are
+cancelled, and at most one job is started per iteration of the main loop.
+
+When a widget is resized, its cached pages are kept as stale placeholders: they can be
+painted scaled to the new size, until they are progressively replaced by pages rendered
+again in the background at the correct size.
+
+Pages evicted from the cache can be kept compressed in memory, in a second tier with its
+own memory budget: slides are mostly flat colours, and compress very well. Evicted pages
+are compressed in a background thread, with lz4 if it is installed or zlib otherwise,
+and are decompressed when they are needed again.
+
+Pages are also saved to a :class:`~pympress.diskcache.DiskCache`,
+from which they are loaded instead of being rendered again, e.g. when the same document
+is opened again or when a widget gets back to a previous size.
 """
 
 import logging
@@ -38,13 +80,29 @@ logger = logging.getLogger(__name__)
 
 import threading
 import time
+import math
+import zlib
+import heapq
 import collections
+import multiprocessing
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+try:
+    import lz4.block
+except ImportError:
+    lz4 = None
 
 import gi
 import cairo
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, Gdk, GLib
 
+from pympress import document, render_pool, diskcache
+
 
 class OrderedDict(collections.OrderedDict):
     """ OrderedDict for python2 compatibility, adding move_to_end().
@@ -58,22 +116,119 @@ class OrderedDict(collections.OrderedDict):
             self[key] = val
 
 
+def compress_pixels(data):
+    """ Compress the pixels of a page, with lz4 if it is available as it is faster, or with zlib.
+
+    Args:
+        data (`bytes`):  the pixels, or any object supporting the buffer protocol
+
+    Returns:
+        `tuple`: the name of the codec and the compressed pixels
+    """
+    if lz4 is not None:
+        return 'lz4', lz4.block.compress(data)
+    else:
+        return 'zlib', zlib.compress(data, 1)
+
+
+def decompress_pixels(codec, data):
+    """ Decompress the pixels of a page compressed by :func:`~pympress.surfacecache.compress_pixels`.
+
+    Args:
+        codec (`str`):  the name of the codec
+        data (`bytes`):  the compressed pixels
+
+    Returns:
+        `bytearray`: the pixels
+    """
+    if codec == 'lz4':
+        return bytearray(lz4.block.decompress(data))
+    else:
+        return bytearray(zlib.decompress(data))
+
+
+def downscale(source, sw, sh, target, ww, wh):
+    """ Paint a surface onto a smaller one, filtering for quality.
+
+    Args:
+        source (:class:`~cairo.Surface`):  the surface to downscale
+        sw (`int`):  the width of the source
+        sh (`int`):  the height of the source
+        target (:class:`~cairo.Surface`):  the surface to paint on
+        ww (`int`):  the width of the target
+        wh (`int`):  the height of the target
+    """
+    context = cairo.Context(target)
+    context.scale(float(ww) / sw, float(wh) / sh)
+
+    pattern = cairo.SurfacePattern(source)
+    pattern.set_filter(cairo.FILTER_BEST)
+    pattern.set_extend(cairo.EXTEND_PAD)
+    context.set_source(pattern)
+    context.paint()
+
+
+def surface_bytes(surface, width, height):
+    """ Get the memory used by the pixels of a surface.
+
+    Args:
+        surface (:class:`~cairo.Surface`):  the surface, usually a :class:`~cairo.ImageSurface`
+        width (`int`):  the width of the surface
+        height (`int`):  the height of the surface
+
+    Returns:
+        `int`: the number of bytes used by the surface's pixels
+    """
+    try:
+        return surface.get_stride() * surface.get_height()
+    except AttributeError:
+        # Surfaces similar to a window are not image surfaces, but are stored in the same format
+        return cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_RGB24, width) * height
+
+
 class SurfaceCache(object):
     """ Pages caching and prerendering made (almost) easy.
 
     Args:
         doc (:class:`~pympress.document.Document`):  the current document
-        max_pages (`int`): The maximum page number.
+        max_bytes (`int`): The maximum memory used by all the cached pages, in bytes
+        workers (`int`): The number of worker processes used to prerender pages, 0 to render on the main thread
+        max_disk_bytes (`int`): The maximum size of the pages cached on disk, in bytes, 0 to disable the disk cache
+        disk_format (`str`): The format of the pages cached on disk, see :const:`~pympress.diskcache.FORMATS`
     """
 
-    #: The actual cache. It is a `dict` of :class:`~pympress.surfacecache.Cache`:
-    #: its keys are widget names and its values are `dict` whose keys are page
-    #: numbers and values are instances of :class:`~cairo.ImageSurface`.
-    #: In each :class:`~pympress.surfacecache.Cache` keys are ordered by Least Recently
-    #: Used (get or set), when the size is beyond :attr:`max_pages`, pages are
-    #: popped from the start of the cache.
+    #: The actual cache. It is a `dict` whose keys are widget names and its values
+    #: are `dict` whose keys are page numbers and values are instances of
+    #: :class:`~cairo.ImageSurface`.
     surface_cache = {}
 
+    #: :class:`~pympress.surfacecache.OrderedDict` of the size in bytes of every surface in :attr:`surface_cache`,
+    #: indexed by (widget name, page number). Keys are ordered by Least Recently Used (get or set): when the
+    #: total size is beyond :attr:`max_bytes`, pages are popped from the start of the cache, whichever their widget.
+    lru = OrderedDict()
+
+    #: `dict` of the surfaces referenced by :attr:`surface_cache`, indexed by the key returned by
+    #: :meth:`~pympress.surfacecache.SurfaceCache._shared_key`, e.g. (page number, width, height, type)
+    shared = {}
+    #: :class:`~collections.Counter` of the number of (widget name, page number) referencing each key of :attr:`shared`
+    refcounts = collections.Counter()
+    #: `dict` of the size in bytes of each surface in :attr:`shared`
+    shared_bytes = {}
+    #: `dict` of the keys in :attr:`shared` of pages whose rendering is identical to that of another page,
+    #: e.g. (page number, width, height, type), to the key of the other page
+    aliases = {}
+    #: `dict` of the key in :attr:`shared` of each (widget name, page number) in :attr:`surface_cache`
+    entry_keys = {}
+
+    #: :class:`~pympress.surfacecache.OrderedDict` of pages rendered at a previous size of their widget, indexed by
+    #: (widget name, page number). Values are tuples of the surface, its width, height and size in bytes counted in
+    #: :attr:`cache_bytes`, which is 0 when the surface is also in :attr:`shared` or counted by another stale page.
+    #: These are evicted first when the memory budget is exceeded, and are removed when the page is rendered again.
+    stale = OrderedDict()
+
+    #: `dict` of the :class:`~Gtk.Widget` of each widget name, to redraw them when a stale page is replaced
+    widgets = {}
+
     #: `dict` containing functions that return a :class:`~cairo.Surface` given a :class:`~cairo.Context`, width `int` and height `int`
     #: see :meth:`~cairo.Surface.create_similar`
     surface_factory = {}
@@ -83,13 +238,13 @@ class SurfaceCache(object):
 
     #: Type of document handled by each widget. It is a `dict`: its keys are
     #: widget names and its values are document types
-    #: (:const:`~pympress.ui.PDF_REGULAR`, :const:`~pympress.ui.PDF_CONTENT_PAGE`
-    #: or :const:`~pympress.ui.PDF_NOTES_PAGE`).
+    #: (:const:`~pympress.document.PDF_REGULAR`, :const:`~pympress.document.PDF_CONTENT_PAGE`
+    #: or :const:`~pympress.document.PDF_NOTES_PAGE`).
     surface_type = {}
 
-    #: Dictionary of :class:`~threading.Lock` used for managing conccurent
-    #: accesses to :attr:`surface_cache` and :attr:`surface_size`
-    locks = {}
+    #: :class:`~threading.Lock` used for managing conccurent accesses to :attr:`surface_cache`,
+    #: :attr:`lru`, :attr:`surface_size` and :attr:`surface_type`
+    cache_lock = None
 
     #: The current :class:`~pympress.document.Document`.
     doc = None
@@ -100,16 +255,120 @@ class SurfaceCache(object):
     #: Set of active widgets
     active_widgets = set()
 
-    #: maximum number fo pages we keep in cache
-    max_pages = 200
-
-    def __init__(self, doc, max_pages):
-        self.max_pages = max_pages
+    #: maximum memory used by the cached pages, in bytes
+    max_bytes = 512 << 20
+    #: `int` current memory used by the cached pages, in bytes
+    cache_bytes = 0
+    #: `int` number of times a page was found in the cache
+    hits = 0
+    #: `int` number of times a page was not found in the cache
+    misses = 0
+    #: `int` number of pages removed from the cache to stay within :attr:`max_bytes`
+    evictions = 0
+    #: `int` number of pages that were not rendered as they were already rendered for another widget
+    shared_hits = 0
+    #: `int` number of pages that were downscaled from a larger rendering instead of being rendered
+    downscales = 0
+    #: `int` number of notes pages whose content and notes halves were rendered at once
+    split_renders = 0
+    #: `int` number of pages whose rendering was found identical to that of another page
+    identical_renders = 0
+    #: `int` number of pages of which only the region differing from a neighbouring page was rendered at first
+    partial_renders = 0
+    #: `int` number of pages built from a region that turned out to differ from their full rendering
+    partial_mismatches = 0
+    #: `set` of the keys in :attr:`shared` of pages built from a region, that are not yet checked against a full rendering
+    partial_keys = set()
+    #: `float` rank of the jobs rendering in full the pages in :attr:`partial_keys`, after all prerendering jobs
+    verify_rank = float('inf')
+    #: `list` of the numbers of the pages that remain to be fingerprinted by the :attr:`render_pool`
+    fingerprint_queue = []
+    #: `int` number of pages fingerprinted by each job of the :attr:`render_pool`
+    fingerprint_batch = 4
+
+    #: :class:`~pympress.render_pool.RenderPool` of processes that prerender pages
+    render_pool = None
+
+    #: `set` of (widget name, page number) that are being rendered by the :attr:`render_pool`
+    pending_renders = set()
+    #: `set` of the keys in :attr:`shared` of the :attr:`pending_renders`
+    pending_keys = set()
+    #: `int` number of fingerprinting jobs running in the :attr:`render_pool`, which also take a worker
+    pending_fingerprints = 0
+    #: :class:`~collections.Counter` of the renders by the :attr:`render_pool` that were lost, by (widget name, page number)
+    render_failures = collections.Counter()
+    #: `int` number of times a render lost by the :attr:`render_pool` is sent again to a worker, before giving up on it
+    max_render_retries = 1
+
+    #: `dict` of the importance of each widget, lower values are prerendered first
+    widget_priority = {}
+
+    #: `dict` of the prerendering jobs waiting to be started, mapping (widget name, page number) to their priority
+    jobs = {}
+    #: heap of (priority, widget name, page number) tuples, where entries that do not match :attr:`jobs` are stale
+    job_queue = []
+    #: `int` id of the GLib idle source processing :attr:`job_queue`, or 0 if there is none
+    job_source = 0
+    #: `float` time in seconds after which a main loop iteration stops skipping jobs that need no rendering
+    job_time_budget = 0.005
+    #: `list` of the pages last given to :meth:`~pympress.surfacecache.SurfaceCache.prerender`
+    prerender_pages = []
+
+    #: :class:`~pympress.diskcache.DiskCache` where rendered pages are saved, or `None` if disabled
+    disk_cache = None
+
+    #: :class:`~pympress.surfacecache.OrderedDict` of the pages evicted from :attr:`shared`, compressed, with
+    #: the same keys. Values are tuples of the codec, compressed pixels, width, height and stride.
+    compressed = OrderedDict()
+    #: `int` memory used by the :attr:`compressed` pages, in bytes
+    compressed_bytes = 0
+    #: `int` maximum memory used by the :attr:`compressed` pages, in bytes, 0 disables compressing evicted pages
+    max_compressed_bytes = 0
+    #: `int` number of times a page that was fetched was found in the :attr:`compressed` pages
+    compressed_hits = 0
+    #: `int` number of times a page that was fetched was not found in the :attr:`compressed` pages either
+    compressed_misses = 0
+    #: :class:`~Queue.Queue` of evicted pages, as :class:`~cairo.ImageSurface`, to be compressed by the compressing thread
+    compress_queue = None
+
+    def __init__(self, doc, max_bytes, workers = 0, max_disk_bytes = 0, disk_format = 'raw', max_compressed_bytes = 0):
+        self.max_bytes = max_bytes
         self.doc = doc
         self.doc_lock = threading.Lock()
-
-
-    def add_widget(self, widget, wtype, prerender_enabled = True, zoomed = False):
+        self.cache_lock = threading.Lock()
+        self.lru = OrderedDict()
+        self.shared = {}
+        self.refcounts = collections.Counter()
+        self.shared_bytes = {}
+        self.aliases = {}
+        self.partial_keys = set()
+        self.entry_keys = {}
+        self.stale = OrderedDict()
+        self.widgets = {}
+        self.prerender_pages = []
+        self.pending_renders = set()
+        self.pending_keys = set()
+        self.render_failures = collections.Counter()
+        self.render_pool = render_pool.RenderPool(workers)
+        self.widget_priority = {}
+        self.jobs = {}
+        self.job_queue = []
+        self.fingerprint_queue = []
+        self.compressed = OrderedDict()
+        self.max_compressed_bytes = max_compressed_bytes
+
+        if max_disk_bytes > 0:
+            self.disk_cache = diskcache.DiskCache(max_disk_bytes, disk_format)
+            self.disk_cache.set_document(doc.path)
+
+        if max_compressed_bytes > 0:
+            self.compress_queue = Queue()
+            compressor = threading.Thread(target = self.compressor, name = 'pympress page compressor')
+            compressor.daemon = True
+            compressor.start()
+
+
+    def add_widget(self, widget, wtype, prerender_enabled = True, priority = 0):
         """ Add a widget to the list of widgets that have to be managed (for caching and prerendering).
 
         This creates new entries for ``widget_name`` in the needed internal data
@@ -119,14 +378,17 @@ class SurfaceCache(object):
             widget (:class:`~Gtk.Widget`):  The widget for which we need to cache
             wtype (`int`):  type of document handled by the widget (see :attr:`surface_type`)
             prerender_enabled (`bool`):  whether this widget is initially in the list of widgets to prerender
+            priority (`int`):  importance of the widget when prerendering, lower values are rendered first
         """
-        widget_name = widget.get_name() + ('_zoomed' if zoomed else '')
-        with self.locks.setdefault(widget_name, threading.Lock()):
-            self.surface_cache[widget_name] = OrderedDict()
+        widget_name = widget.get_name()
+        with self.cache_lock:
+            self.surface_cache[widget_name] = {}
             self.surface_size[widget_name] = (-1, -1)
             self.surface_type[widget_name] = wtype
             self.surface_factory[widget_name] = lambda c, w, h: widget.get_window().create_similar_surface(c, w, h)
-            if prerender_enabled and not zoomed:
+            self.widget_priority[widget_name] = priority
+            self.widgets[widget_name] = widget
+            if prerender_enabled:
                 self.enable_prerender(widget_name)
 
 
@@ -141,10 +403,78 @@ class SurfaceCache(object):
 
         with self.doc_lock:
             self.doc = new_doc
+            self.pending_renders.clear()
+            self.pending_keys.clear()
+            self.pending_fingerprints = 0
+            self.render_failures.clear()
+            self.jobs.clear()
+            del self.job_queue[:]
+            self.render_pool.open_document(document.Document.path_to_uri(new_doc.path) if new_doc.path else None,
+                                           new_doc.max_recording_bytes)
+            if self.disk_cache is not None:
+                self.disk_cache.set_document(new_doc.path)
+            self.fingerprint_queue = list(range(new_doc.pages_number()))
+
+        with self.cache_lock:
+            for widget_name in self.surface_cache:
+                self._clear(widget_name)
+            self.compressed.clear()
+            self.compressed_bytes = 0
+            self.aliases.clear()
+            self.partial_keys.clear()
+
+        self.fingerprint_next(new_doc)
+
+
+    def fingerprint_next(self, doc):
+        """ Send the next pages to be fingerprinted by the :attr:`render_pool`, if it is active.
+
+        Only one batch of pages is fingerprinted at a time, so that rendering jobs do not wait for all the
+        pages to be fingerprinted.
+
+        Args:
+            doc (:class:`~pympress.document.Document`):  the document whose pages are fingerprinted
+        """
+        with self.doc_lock:
+            if doc is not self.doc or not self.fingerprint_queue or not self.render_pool.is_active():
+                return
+
+            pages = self.fingerprint_queue[:self.fingerprint_batch]
+            del self.fingerprint_queue[:self.fingerprint_batch]
+            self.pending_fingerprints += 1
+            dtypes = [document.PDF_CONTENT_PAGE, document.PDF_NOTES_PAGE] if doc.has_notes() else [document.PDF_REGULAR]
+            self.render_pool.fingerprint(pages, dtypes, lambda result:
+                GLib.idle_add(self.store_fingerprints, doc, result),
+                lambda error: GLib.idle_add(self.store_fingerprints, doc, None)
+            )
+
+
+    def store_fingerprints(self, doc, result):
+        """ Store the fingerprints computed by a worker process in the document. Called on the main thread.
+
+        Args:
+            doc (:class:`~pympress.document.Document`):  the document whose pages were fingerprinted
+            result (`list`): the fingerprints as returned by :func:`~pympress.render_pool.fingerprint_pages`,
+                             or `None` if fingerprinting failed
+        """
+        with self.doc_lock:
+            if doc is not self.doc:
+                return False
+            self.pending_fingerprints -= 1
+            for page_nb, dtype, fingerprint in result or []:
+                doc.set_fingerprint(page_nb, dtype, fingerprint)
+
+        # A worker is available for the next job
+        self.fingerprint_next(doc)
+        self.schedule_jobs()
+        return False
+
 
-        for widget_name in self.locks:
-            with self.locks[widget_name]:
-                self.surface_cache[widget_name].clear()
+    def shutdown(self):
+        """ Stop the rendering workers, to be called before exiting.
+        """
+        with self.doc_lock:
+            self.render_pool.close()
 
 
     def disable_prerender(self, widget_name):
@@ -172,10 +502,10 @@ class SurfaceCache(object):
             widget_name (`str`):  string used to identify a widget
             wtype (`int`):  type of document handled by the widget (see :attr:`surface_type`)
         """
-        with self.locks[widget_name]:
+        with self.cache_lock:
             if self.surface_type[widget_name] != wtype :
                 self.surface_type[widget_name] = wtype
-                self.surface_cache[widget_name].clear()
+                self._clear(widget_name)
 
 
     def get_widget_type(self, widget_name):
@@ -191,27 +521,597 @@ class SurfaceCache(object):
 
 
     def clear_cache(self, widget_name):
-        """ Remove all cached values for a given widget. Useful for zoomed views.
+        """ Remove all cached values for a given widget.
 
         Args:
             widget_name (`str`):  name of the widget that is resized
         """
-        with self.locks[widget_name]:
-            self.surface_cache[widget_name].clear()
+        with self.cache_lock:
+            self._clear(widget_name)
 
 
     def resize_widget(self, widget_name, width, height):
         """ Change the size of a registered widget, thus invalidating all the cached pages.
 
+        The cached pages become :attr:`stale`, and are rendered again at the new size in the background.
+
         Args:
             widget_name (`str`):  name of the widget that is resized
             width (`int`):  new width of the widget
             height (`int`):  new height of the widget
         """
-        with self.locks[widget_name]:
-            if (width, height) != self.surface_size[widget_name]:
-                self.surface_cache[widget_name].clear()
-                self.surface_size[widget_name] = (width, height)
+        with self.cache_lock:
+            if (width, height) == self.surface_size[widget_name]:
+                return
+
+            self._make_stale(widget_name)
+            self.surface_size[widget_name] = (width, height)
+
+        self.prerender(self.prerender_pages)
+
+
+    def _make_stale(self, widget_name):
+        """ Move all the cached pages of a widget to the :attr:`stale` pages. The caller must hold :attr:`cache_lock`.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+        """
+        ww, wh = self.surface_size[widget_name]
+        pc = self.surface_cache[widget_name]
+        for page_nb, surface in list(pc.items()):
+            # The bytes of the surface are counted by the stale page once no other widget references it
+            self._set_stale((widget_name, page_nb), surface, ww, wh)
+            self._unlink(widget_name, page_nb)
+
+
+    def _set_stale(self, key, surface, width, height):
+        """ Keep a surface as the stale page of a widget, counting its bytes unless they are already counted.
+        The caller must hold :attr:`cache_lock`.
+
+        Args:
+            key (`tuple`):  the widget name and page number
+            surface (:class:`~cairo.Surface`):  the placeholder
+            width (`int`):  the width of the placeholder
+            height (`int`):  the height of the placeholder
+        """
+        self._drop_stale(key)
+
+        counted = any(shared is surface for shared in self.shared.values()) \
+            or any(stale[0] is surface and stale[3] for stale in self.stale.values())
+        size = 0 if counted else surface_bytes(surface, width, height)
+
+        self.stale[key] = (surface, width, height, size)
+        self.cache_bytes += size
+
+
+    def _drop_stale(self, key):
+        """ Remove a stale page, if there is one. The caller must hold :attr:`cache_lock`.
+
+        Args:
+            key (`tuple`):  the widget name and page number
+        """
+        if key in self.stale:
+            surface, width, height, size = self.stale.pop(key)
+            self._release_bytes(surface, size)
+
+
+    def _release_bytes(self, surface, size):
+        """ Stop counting the bytes of a surface that is removed from the cache, or let another stale page that
+        uses the same surface count them. The caller must hold :attr:`cache_lock`.
+
+        Args:
+            surface (:class:`~cairo.Surface`):  the removed surface
+            size (`int`):  the bytes that were counted for the surface
+        """
+        if not size:
+            return
+
+        for key, stale in self.stale.items():
+            if stale[0] is surface:
+                self.stale[key] = stale[:3] + (size,)
+                return
+
+        self.cache_bytes -= size
+
+
+    def _clear(self, widget_name):
+        """ Remove all the cached pages of a widget, including stale ones. The caller must hold :attr:`cache_lock`.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+        """
+        for page_nb in list(self.surface_cache[widget_name]):
+            self._unlink(widget_name, page_nb)
+
+        for key in [key for key in self.stale if key[0] == widget_name]:
+            self._drop_stale(key)
+
+
+    def _shared_key(self, widget_name, page_nb):
+        """ Get the key identifying the content of a page rendered for a widget, in :attr:`shared`.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page
+
+        Returns:
+            `tuple`: (page number, width, height, type), where the page number is that of the first page whose
+            rendering was found identical
+        """
+        key = (page_nb,) + self.surface_size[widget_name] + (self.surface_type[widget_name],)
+        return self.aliases.get(key, key)
+
+
+    def _find_identical(self, key, surface):
+        """ Find a rendered page that is identical to a new rendering of a page. The caller must hold :attr:`cache_lock`.
+
+        Only the page that has the same fingerprint is compared, and only if both renderings are in memory,
+        since fingerprints are computed from low resolution renderings and can not tell small differences apart.
+
+        Args:
+            key (`tuple`):  the key of the page in :attr:`shared`, i.e. (page number, width, height, type)
+            surface (:class:`~cairo.Surface`):  the new rendering of the page
+
+        Returns:
+            `tuple`: the key in :attr:`shared` of the identical page, or `None` if there is none
+        """
+        page_nb, ww, wh, wtype = key
+        other = (self.doc.identical_page(page_nb, wtype), ww, wh, wtype)
+        other = self.aliases.get(other, other)
+        if other == key or other not in self.shared or other in self.partial_keys:
+            return None
+
+        rendered = self.shared[other]
+        if not isinstance(surface, cairo.ImageSurface) or not isinstance(rendered, cairo.ImageSurface):
+            return None
+
+        surface.flush()
+        rendered.flush()
+        if surface.get_stride() != rendered.get_stride() or surface.get_data() != rendered.get_data():
+            return None
+
+        return other
+
+
+    def _link(self, widget_name, page_nb, surface, size = None):
+        """ Reference a surface as the page of a widget. The caller must hold :attr:`cache_lock`.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page
+            surface (:class:`~cairo.Surface`):  content of the page, unless it is already in :attr:`shared`
+            size (`int`):  the bytes to count for the surface, or `None` to count its pixels
+
+        Returns:
+            :class:`~cairo.Surface`: the surface referenced for this page
+        """
+        key = self._shared_key(widget_name, page_nb)
+        if key not in self.shared and key not in self.partial_keys:
+            identical = self._find_identical(key, surface)
+            if identical is not None:
+                self.aliases[key] = identical
+                self.identical_renders += 1
+                key = identical
+
+        if key in self.shared:
+            surface = self.shared[key]
+        else:
+            ww, wh = self.surface_size[widget_name]
+            # A stale page might already count the bytes of this surface
+            for stale_key, stale in self.stale.items():
+                if stale[0] is surface and stale[3]:
+                    self.stale[stale_key] = stale[:3] + (0,)
+                    self.cache_bytes -= stale[3]
+
+            self.shared[key] = surface
+            self.shared_bytes[key] = surface_bytes(surface, ww, wh) if size is None else size
+            self.cache_bytes += self.shared_bytes[key]
+
+        self.refcounts[key] += 1
+        self.entry_keys[(widget_name, page_nb)] = key
+        self.surface_cache[widget_name][page_nb] = surface
+        self.lru[(widget_name, page_nb)] = self.shared_bytes[key]
+        self.lru.move_to_end((widget_name, page_nb))
+        return surface
+
+
+    def _unlink(self, widget_name, page_nb, evicted = False):
+        """ Remove the page of a widget, releasing the surface if no other widget references it.
+        The caller must hold :attr:`cache_lock`.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page
+            evicted (`bool`):  whether the page is removed to stay within the memory budget, in which case the
+                               surface is kept in the :attr:`compressed` pages when it is released
+        """
+        key = self.entry_keys.pop((widget_name, page_nb))
+        del self.surface_cache[widget_name][page_nb]
+        del self.lru[(widget_name, page_nb)]
+
+        self.refcounts[key] -= 1
+        if not self.refcounts[key]:
+            del self.refcounts[key]
+            surface = self.shared.pop(key)
+            self._release_bytes(surface, self.shared_bytes.pop(key))
+
+            if key in self.partial_keys:
+                # Never keep a page that was not checked against its full rendering
+                self.partial_keys.discard(key)
+            elif evicted and self.compress_queue is not None:
+                self._compress(key, surface)
+
+
+    def _compress(self, key, surface):
+        """ Queue an evicted page to be compressed and kept in the :attr:`compressed` pages.
+        The caller must hold :attr:`cache_lock`.
+
+        Args:
+            key (`tuple`):  the key of the page in :attr:`shared`, i.e. (page number, width, height, type)
+            surface (:class:`~cairo.Surface`):  the evicted page
+        """
+        if key in self.compressed:
+            # Compressed when it was evicted before
+            self.compressed.move_to_end(key)
+            return
+
+        # Reading image surfaces is left to the compressor: the queue keeps a reference to the surface until then.
+        # Other surfaces, e.g. Xlib surfaces similar to a window, can only be read back on the main thread.
+        _page_nb, ww, wh, _wtype = key
+        self.compress_queue.put((self.doc, key, diskcache.to_image_surface(surface, ww, wh), ww, wh))
+
+
+    def compressor(self):
+        """ Compress the evicted pages and store them in the :attr:`compressed` pages, runs forever in a background thread.
+        """
+        while True:
+            doc, key, image, ww, wh = self.compress_queue.get()
+            with self.cache_lock:
+                if doc is not self.doc or key in self.shared or key in self.compressed:
+                    continue
+
+            codec, data = compress_pixels(image.get_data())
+            stride = image.get_stride()
+            del image
+
+            with self.cache_lock:
+                if doc is not self.doc or key in self.shared:
+                    continue
+
+                self.compressed[key] = (codec, data, ww, wh, stride)
+                self.compressed_bytes += len(data)
+
+                while self.compressed_bytes > self.max_compressed_bytes and self.compressed:
+                    self.compressed_bytes -= len(self.compressed.popitem(False)[1][1])
+
+
+    def _find_compressed(self, widget_name, page_nb):
+        """ Reference the page for a widget if it was evicted and kept in the :attr:`compressed` pages.
+        The caller must hold :attr:`cache_lock`.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page
+
+        Returns:
+            :class:`~cairo.ImageSurface`: the decompressed page if it was found, `None` otherwise
+        """
+        if self.compress_queue is None:
+            return None
+
+        key = self._shared_key(widget_name, page_nb)
+        if key not in self.compressed:
+            return None
+
+        # Keep the compressed page, so that it does not need to be compressed again when it is evicted again
+        self.compressed.move_to_end(key)
+        codec, data, ww, wh, stride = self.compressed[key]
+
+        surface = cairo.ImageSurface.create_for_data(decompress_pixels(codec, data), diskcache.PIXEL_FORMAT, ww, wh, stride)
+        return self._store(widget_name, page_nb, surface)
+
+
+    def _find_shared(self, widget_name, page_nb):
+        """ Reference the page for a widget if it was already rendered for another widget.
+        The caller must hold :attr:`cache_lock`.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page
+
+        Returns:
+            :class:`~cairo.Surface`: the page if it was found, `None` otherwise
+        """
+        if self._shared_key(widget_name, page_nb) not in self.shared:
+            return None
+
+        self.shared_hits += 1
+        return self._store(widget_name, page_nb, None)
+
+
+    def _find_larger(self, widget_name, page_nb):
+        """ Find the smallest rendering of a page that is larger than needed for a widget.
+        The caller must hold :attr:`cache_lock`.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page
+
+        Returns:
+            `tuple`: the :class:`~cairo.Surface`, its width and height, or `None` if there is none
+        """
+        ww, wh = self.surface_size[widget_name]
+        wtype = self.surface_type[widget_name]
+
+        # Same page and type, larger in both dimensions, and with the same aspect ratio up to rounding
+        candidates = [(sw, sh) for nb, sw, sh, stype in self.shared
+                      if stype == wtype and sw >= ww and sh >= wh and (sw, sh) != (ww, wh)
+                      and abs(sw * wh - sh * ww) <= max(sw, sh)
+                      and self.aliases.get((page_nb, sw, sh, wtype), (page_nb,))[0] == nb
+                      and (nb, sw, sh, stype) not in self.partial_keys]
+        if not candidates:
+            return None
+
+        sw, sh = min(candidates)
+        key = (page_nb, sw, sh, wtype)
+        return self.shared[self.aliases.get(key, key)], sw, sh
+
+
+    def downscale_larger(self, widget_name, page_nb):
+        """ Get a page for a widget by downscaling a larger rendering of the page, if there is one.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page
+
+        Returns:
+            `bool`: whether the page was downscaled and stored in the cache
+        """
+        with self.cache_lock:
+            larger = self._find_larger(widget_name, page_nb)
+            ww, wh = self.surface_size[widget_name]
+
+        if larger is None:
+            return False
+
+        source, sw, sh = larger
+        try:
+            surface = self.surface_factory[widget_name](cairo.CONTENT_COLOR, ww, wh)
+        except AttributeError:
+            logger.warning('Widget {} was not mapped when downscaling'.format(widget_name), exc_info = True)
+            return False
+
+        downscale(source, sw, sh, surface, ww, wh)
+
+        with self.cache_lock:
+            if (ww, wh) != self.surface_size[widget_name] or page_nb in self.surface_cache[widget_name]:
+                return True
+            self.downscales += 1
+            self._store(widget_name, page_nb, surface)
+
+        self.save_to_disk(widget_name, page_nb, surface)
+        return True
+
+
+    def _split_halves(self, widget_name, page_nb, pw, ph):
+        """ Find a widget that needs the other half of a page with notes, at the same scale as this widget.
+        The caller must hold :attr:`cache_lock`.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page
+            pw (`float`):  width of the whole page, with its notes
+            ph (`float`):  height of the page
+
+        Returns:
+            `tuple`: the names of the content and notes widgets, the size of the whole rendered page and the
+            position of the notes half in it, or `None` if the halves can not be rendered together
+        """
+        halves = {document.PDF_CONTENT_PAGE: document.PDF_NOTES_PAGE, document.PDF_NOTES_PAGE: document.PDF_CONTENT_PAGE}
+        wtype = self.surface_type[widget_name]
+        if wtype not in halves:
+            return None
+
+        ww, wh = self.surface_size[widget_name]
+        half_width = pw / 2. * wh / ph
+        if wh <= 0 or abs(ww - half_width) > 1:
+            return None
+
+        for other in self.surface_cache:
+            ow, oh = self.surface_size[other]
+            if self.surface_type[other] != halves[wtype] or oh != wh or abs(ow - half_width) > 1:
+                continue
+            elif page_nb in self.surface_cache[other] or self._shared_key(other, page_nb) in self.shared \
+                    or self._shared_key(other, page_nb) in self.pending_keys:
+                continue
+
+            content, notes = (widget_name, other) if wtype == document.PDF_CONTENT_PAGE else (other, widget_name)
+            split = int(round(half_width))
+            width = max(int(math.ceil(pw * wh / ph)), split + self.surface_size[notes][0], self.surface_size[content][0])
+            return content, notes, width, wh, split
+
+        return None
+
+
+    def store_halves(self, page_nb, halves, surface):
+        """ Store both halves of a page rendered with its notes, as sub-surfaces of the rendered page.
+
+        The whole rendered page stays in memory as long as either half is cached, so its bytes are
+        counted once, shared between the halves by their width.
+
+        Args:
+            page_nb (`int`):  number of the page
+            halves (`tuple`):  the layout of the halves, as returned by :meth:`_split_halves`
+            surface (:class:`~cairo.Surface`):  the whole rendered page
+        """
+        content, notes, width, height, split = halves
+        stored = []
+        with self.cache_lock:
+            needed = []
+            for widget_name, x, wtype in [(content, 0, document.PDF_CONTENT_PAGE), (notes, split, document.PDF_NOTES_PAGE)]:
+                ww, wh = self.surface_size[widget_name]
+                if wh != height or x + ww > width or self.surface_type[widget_name] != wtype \
+                        or page_nb in self.surface_cache[widget_name]:
+                    continue
+                needed.append((widget_name, x, ww, wh))
+
+            total = surface_bytes(surface, width, height)
+            charged = 0
+            for n, (widget_name, x, ww, wh) in enumerate(needed):
+                # The last half is charged the rest, so that the halves add up to the whole page
+                size = total - charged if n == len(needed) - 1 else total * ww // width
+                charged += size
+                stored.append((widget_name, self._store(widget_name, page_nb, surface.create_for_rectangle(x, 0, ww, wh), size)))
+
+            if len(stored) == 2:
+                self.split_renders += 1
+
+        for widget_name, half in stored:
+            self.save_to_disk(widget_name, page_nb, half)
+
+
+    def _find_base(self, widget_name, page_nb):
+        """ Find a neighbouring page that is rendered and from which a page probably differs only by a small region.
+        The caller must hold :attr:`cache_lock`.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page
+
+        Returns:
+            `tuple`: the :class:`~cairo.Surface` of the neighbouring page, and the left, top, width and height in pixels
+            of the region that differs, or `None` if there is no such page
+        """
+        ww, wh = self.surface_size[widget_name]
+        wtype = self.surface_type[widget_name]
+        margin = 2
+        best = None
+
+        for other in (page_nb - 1, page_nb + 1):
+            key = self._shared_key(widget_name, other)
+            region = self.doc.changed_region(page_nb, other, wtype)
+            if key not in self.shared or key in self.partial_keys or region is None \
+                    or region[0] >= region[2] or region[1] >= region[3]:
+                continue
+
+            # Grow the region by a few pixels, for antialiasing around the cells that differ
+            x0, y0 = max(0, int(region[0] * ww) - margin), max(0, int(region[1] * wh) - margin)
+            x1, y1 = min(ww, int(math.ceil(region[2] * ww)) + margin), min(wh, int(math.ceil(region[3] * wh)) + margin)
+            area = (x1 - x0) * (y1 - y0)
+
+            # Only worth it if the region is small enough
+            if 2 * area < ww * wh and (best is None or area < best[2]):
+                best = (self.shared[key], (x0, y0, x1 - x0, y1 - y0), area)
+
+        return best[:2] if best is not None else None
+
+
+    def _replace_partial(self, key, surface, width, height):
+        """ Replace a page built from a region by its full rendering, for all the widgets that reference it.
+        The caller must hold :attr:`cache_lock`.
+
+        Args:
+            key (`tuple`):  the key of the page in :attr:`shared`, which is in :attr:`partial_keys`
+            surface (:class:`~cairo.ImageSurface`):  the full rendering of the page
+            width (`int`):  the width of the page
+            height (`int`):  the height of the page
+        """
+        self.partial_keys.discard(key)
+        built = self.shared[key]
+        if isinstance(built, cairo.ImageSurface) and built.get_stride() == surface.get_stride() \
+                and built.get_data() == surface.get_data():
+            return
+
+        self.partial_mismatches += 1
+        self.shared[key] = surface
+        self.cache_bytes -= self.shared_bytes[key]
+        self.shared_bytes[key] = surface_bytes(surface, width, height)
+        self.cache_bytes += self.shared_bytes[key]
+
+        for (widget_name, page_nb), entry_key in self.entry_keys.items():
+            if entry_key == key:
+                self.surface_cache[widget_name][page_nb] = surface
+                self.widgets[widget_name].queue_draw()
+
+
+    def _store(self, widget_name, page_nb, surface, size = None):
+        """ Add a page to the cache, then evict the least recently used pages until we are
+        within the memory budget. The caller must hold :attr:`cache_lock`.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page to store in the cache
+            surface (:class:`~cairo.ImageSurface`):  content to store in the cache,
+                                                     ignored if the same page is already in :attr:`shared`
+            size (`int`):  the bytes to count for the surface, or `None` to count its pixels
+
+        Returns:
+            :class:`~cairo.Surface`: the surface stored in the cache for this page
+        """
+        key = (widget_name, page_nb)
+        if key in self.entry_keys:
+            self._unlink(widget_name, page_nb)
+
+        surface = self._link(widget_name, page_nb, surface, size)
+
+        if key in self.stale:
+            # A placeholder might be displayed for this page: show the page at the correct size
+            self._drop_stale(key)
+            self.widgets[widget_name].queue_draw()
+
+        # Evict stale pages first, and never evict the page we just added, even if it is bigger than the budget
+        while self.cache_bytes > self.max_bytes and self.stale:
+            self._drop_stale(next(iter(self.stale)))
+            self.evictions += 1
+
+        # Evicting a page shared with other widgets only releases memory once all its references are evicted
+        while self.cache_bytes > self.max_bytes and len(self.lru) > 1:
+            evict_name, evict_nb = next(iter(self.lru))
+            self._unlink(evict_name, evict_nb, evicted = True)
+            self.evictions += 1
+
+        return surface
+
+
+    def get_stats(self):
+        """ Get statistics about the cache usage, useful to tune the memory budget.
+
+        Returns:
+            `dict`: the hits, misses and evictions counts, the number of cached pages, of distinct surfaces,
+            and the bytes they use, in total and per widget (shared surfaces count for every widget),
+            and the statistics of the compressed pages and of the disk cache
+        """
+        with self.cache_lock:
+            widget_bytes = {name: 0 for name in self.surface_cache}
+            for (name, page_nb), size in self.lru.items():
+                widget_bytes[name] += size
+
+            return {
+                'disk': self.disk_cache.get_stats() if self.disk_cache is not None else None,
+                'compressed': {
+                    'codec': 'lz4' if lz4 is not None else 'zlib',
+                    'hits': self.compressed_hits,
+                    'misses': self.compressed_misses,
+                    'pages': len(self.compressed),
+                    'bytes': self.compressed_bytes,
+                    'max_bytes': self.max_compressed_bytes,
+                } if self.compress_queue is not None else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'shared_hits': self.shared_hits,
+                'downscales': self.downscales,
+                'split_renders': self.split_renders,
+                'identical_renders': self.identical_renders,
+                'partial_renders': self.partial_renders,
+                'partial_mismatches': self.partial_mismatches,
+                'surfaces': len(self.shared),
+                'pages': len(self.lru),
+                'stale_pages': len(self.stale),
+                'bytes': self.cache_bytes,
+                'max_bytes': self.max_bytes,
+                'widget_bytes': widget_bytes,
+            }
 
 
     def get(self, widget_name, page_nb):
@@ -224,14 +1124,75 @@ class SurfaceCache(object):
         Returns:
             :class:`~cairo.ImageSurface`: the cached page if available, or `None` otherwise
         """
-        with self.locks[widget_name]:
+        with self.cache_lock:
             pc = self.surface_cache[widget_name]
             if page_nb in pc:
-                pc.move_to_end(page_nb)
+                self.hits += 1
+                self.lru.move_to_end((widget_name, page_nb))
                 return pc[page_nb]
-            else:
+
+            surface = self._find_shared(widget_name, page_nb)
+            if surface is not None:
+                self.hits += 1
+                return surface
+
+            self.misses += 1
+            surface = self._find_compressed(widget_name, page_nb)
+            if surface is not None:
+                self.compressed_hits += 1
+                return surface
+            elif self.compress_queue is not None:
+                self.compressed_misses += 1
+
+        return self.load_from_disk(widget_name, page_nb)
+
+
+    def get_placeholder(self, widget_name, page_nb):
+        """ Fetch a page rendered at another size, to be painted scaled until the page is rendered for the widget.
+
+        This is the stale page of the widget if there is one, or else the largest rendering of the page with the
+        same type for another widget, e.g. the next slide preview. The latter is kept as a stale page of the widget.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page to fetch
+
+        Returns:
+            `tuple`: the :class:`~cairo.Surface`, its width and height, or `None` if the page was not rendered
+        """
+        with self.cache_lock:
+            key = (widget_name, page_nb)
+            if key in self.stale:
+                return self.stale[key][:3]
+
+            wtype = self.surface_type[widget_name]
+            candidates = [(self.surface_size[name], self.surface_cache[name][page_nb])
+                          for name in self.surface_cache
+                          if self.surface_type[name] == wtype and page_nb in self.surface_cache[name]]
+            candidates += [((ww, wh), surface) for (name, nb), (surface, ww, wh, size) in self.stale.items()
+                           if nb == page_nb and self.surface_type[name] == wtype]
+            if not candidates:
                 return None
 
+            (ww, wh), surface = max(candidates, key = lambda candidate: candidate[0])
+            # The surface is still used by another widget or stale page, its bytes are not counted again
+            self._set_stale(key, surface, ww, wh)
+            return surface, ww, wh
+
+
+    def set_stale(self, widget_name, page_nb, surface, width, height):
+        """ Store a placeholder for a page of a widget, e.g. rendered at a lower resolution.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page
+            surface (:class:`~cairo.Surface`):  the placeholder
+            width (`int`):  the width of the placeholder
+            height (`int`):  the height of the placeholder
+        """
+        with self.cache_lock:
+            self._set_stale((widget_name, page_nb), surface, width, height)
+
 
     def set(self, widget_name, page_nb, val):
         """ Store a rendered page in the cache.
@@ -241,34 +1202,409 @@ class SurfaceCache(object):
             page_nb (`int`):  number of the page to store in the cache
             val (:class:`~cairo.ImageSurface`):  content to store in the cache
         """
-        with self.locks[widget_name]:
-            pc = self.surface_cache[widget_name]
-            pc[page_nb] = val
-            pc.move_to_end(page_nb)
+        with self.cache_lock:
+            self._store(widget_name, page_nb, val)
 
-            while len(pc) > self.max_pages:
-                pc.popitem(False)
+        self.save_to_disk(widget_name, page_nb, val)
 
 
-    def prerender(self, page_nb):
-        """ Queue a page for prerendering.
+    def load_from_disk(self, widget_name, page_nb):
+        """ Get a page from the :attr:`disk_cache` and store it in the cache, if it was rendered before.
 
-        The specified page will be prerendered for all the registered widgets.
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page to load
+
+        Returns:
+            :class:`~cairo.ImageSurface`: the page if it was on disk, or `None` otherwise
+        """
+        if self.disk_cache is None:
+            return None
+
+        with self.cache_lock:
+            ww, wh = self.surface_size[widget_name]
+            wtype = self.surface_type[widget_name]
+
+        if ww < 0 or wh < 0:
+            return None
+
+        surface = self.disk_cache.load(page_nb, ww, wh, wtype)
+        if surface is None:
+            return None
+
+        with self.cache_lock:
+            if (ww, wh) != self.surface_size[widget_name] or wtype != self.surface_type[widget_name]:
+                return None
+            self._store(widget_name, page_nb, surface)
+
+        return surface
+
+
+    def save_to_disk(self, widget_name, page_nb, surface):
+        """ Save a rendered page in the :attr:`disk_cache`, if the widget's pages are kept on disk.
 
         Args:
-            page_nb (`int`):  number of the page to be prerendered
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the rendered page
+            surface (:class:`~cairo.Surface`):  the rendered page
         """
+        if self.disk_cache is None:
+            return
+
+        with self.cache_lock:
+            ww, wh = self.surface_size[widget_name]
+            wtype = self.surface_type[widget_name]
+
+        self.disk_cache.store(page_nb, ww, wh, wtype, surface)
+
+
+    def prerender(self, pages):
+        """ Queue pages for prerendering.
+
+        The specified pages will be prerendered for all the registered widgets, in the given order.
+        Prerendering jobs waiting for pages that are not in `pages` are cancelled, but jobs queued by
+        :meth:`request_render` or checking pages built from a region are kept.
+
+        Args:
+            pages (`list` of `int`):  numbers of the pages to be prerendered, most urgent first
+        """
+        self.prerender_pages = list(pages)
+        rank = {page_nb: pos for pos, page_nb in reversed(list(enumerate(pages)))}
+
+        for key in [key for key, priority in self.jobs.items() if key[1] not in rank and self._is_prerendering(priority)]:
+            del self.jobs[key]
+
         for name in self.active_widgets:
-            GLib.idle_add(self.renderer, name, page_nb)
+            for page_nb in rank:
+                if self.jobs.get((name, page_nb), (0,))[0] >= 0:
+                    # Requested renders keep their higher priority
+                    self.jobs[(name, page_nb)] = (rank[page_nb], self.widget_priority[name])
+
+        # Rebuilding the heap also discards the entries of all the cancelled jobs
+        self.job_queue = [(priority, name, page_nb) for (name, page_nb), priority in self.jobs.items()]
+        heapq.heapify(self.job_queue)
+
+        self.schedule_jobs()
+
+
+    def _is_prerendering(self, priority):
+        """ Tell whether a job was queued by :meth:`prerender`, from its priority.
+
+        Args:
+            priority (`tuple`):  the priority of the job in :attr:`jobs`
+
+        Returns:
+            `bool`: `False` for jobs queued by :meth:`request_render` or checking pages built from a region
+        """
+        return 0 <= priority[0] < self.verify_rank
+
+
+    def request_render(self, widget_name, page_nb):
+        """ Render a page in the background before any prerendering, e.g. to replace a displayed placeholder.
+
+        The widget will be redrawn once the page is in the cache.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page to render
+        """
+        key = (widget_name, page_nb)
+        priority = (-1, self.widget_priority[widget_name])
+        if self.jobs.get(key) != priority:
+            self.jobs[key] = priority
+            heapq.heappush(self.job_queue, (priority, widget_name, page_nb))
+
+        self.schedule_jobs()
+
+
+    def schedule_jobs(self):
+        """ Make sure the jobs queue is processed at idle time, if there are jobs to process.
+        """
+        if self.jobs and not self.job_source:
+            self.job_source = GLib.idle_add(self.process_jobs)
+
+
+    def process_jobs(self):
+        """ Start the most urgent prerendering job. Called at idle time in the main loop.
+
+        Jobs whose page is already cached or being rendered are skipped, until a job needs
+        rendering or the :attr:`job_time_budget` is elapsed. At most one page is rendered on
+        the main thread per call, and when rendering with the :attr:`render_pool`, only as many
+        jobs as there are workers are started, so that the others can still be reordered or cancelled.
+
+        Returns:
+            `bool`: whether this function should be called again at the next idle time
+        """
+        start = time.time()
+        pool_active = self.render_pool.is_active()
+
+        while self.job_queue and time.time() - start < self.job_time_budget:
+            if pool_active and len(self.pending_renders) + self.pending_fingerprints >= self.render_pool.workers:
+                # Resumed by store_async_render when a worker is available
+                self.job_source = 0
+                return False
+
+            priority, name, page_nb = heapq.heappop(self.job_queue)
+            if self.jobs.get((name, page_nb)) != priority:
+                # Cancelled or queued again with another priority
+                continue
+            del self.jobs[(name, page_nb)]
+
+            if name not in self.active_widgets and self._is_prerendering(priority):
+                # Only explicitly requested pages are rendered for widgets that are not prerendered
+                continue
+
+            with self.cache_lock:
+                cached = page_nb in self.surface_cache[name] or self._find_shared(name, page_nb) is not None \
+                         or self._find_compressed(name, page_nb) is not None
+                partial = cached and self._shared_key(name, page_nb) in self.partial_keys
+            if cached and not partial:
+                continue
+            elif not partial and (self.downscale_larger(name, page_nb) or self.load_from_disk(name, page_nb) is not None):
+                break
+            elif pool_active:
+                if self.render_async(name, page_nb):
+                    continue
+            elif self.renderer(name, page_nb):
+                break
+
+        if not self.jobs:
+            self.job_source = 0
+        return bool(self.jobs)
+
+
+    def render_async(self, widget_name, page_nb):
+        """ Send a page to be rendered by the :attr:`render_pool`.
+
+        The result is handed back to the main thread through GLib.idle_add(), where
+        :meth:`~pympress.surfacecache.SurfaceCache.store_async_render` stores it.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the page to render
+
+        Returns:
+            `bool`: `True` if the page was sent to a worker, `False` if no rendering was needed or possible
+        """
+        with self.doc_lock:
+            page = self.doc.page(page_nb)
+
+        if page is None or not page.can_render():
+            return False
+
+        with self.cache_lock:
+            key = self._shared_key(widget_name, page_nb)
+            verify = key in self.partial_keys
+            if not verify and (page_nb in self.surface_cache[widget_name] or self._find_shared(widget_name, page_nb)
+                               is not None or self._find_compressed(widget_name, page_nb) is not None):
+                return False
+            if (widget_name, page_nb) in self.pending_renders or key in self.pending_keys:
+                # Being rendered, possibly for another widget: this widget will find it in the shared surfaces
+                return False
+            ww, wh = self.surface_size[widget_name]
+            wtype = self.surface_type[widget_name]
+            base = self._find_base(widget_name, page_nb) if not verify else None
+            halves = self._split_halves(widget_name, page_nb, *page.get_size()) if not verify and base is None else None
+
+        if ww < 0 or wh < 0:
+            logger.warning('Widget {} with invalid size {}x{} when rendering'.format(widget_name, ww, wh))
+            return False
+
+        with self.doc_lock:
+            doc = self.doc
+            if base is not None:
+                # Only render the region that probably differs from a neighbouring page
+                base_surface, region = base
+                self.pending_renders.add((widget_name, page_nb))
+                self.pending_keys.add(key)
+                self.render_pool.submit(page_nb, ww, wh, wtype, lambda result:
+                    GLib.idle_add(self.store_async_render, doc, widget_name, page_nb, wtype, result, key,
+                                  (base_surface, region, ww, wh)),
+                    region, lambda error: GLib.idle_add(self.render_failed, doc, [(widget_name, page_nb)], [key], error)
+                )
+                return True
+
+            if halves is not None:
+                # Render the whole page once for both widgets showing one of its halves
+                names = halves[:2]
+                keys = [self._shared_key(name, page_nb) for name in names]
+                self.pending_renders.update((name, page_nb) for name in names)
+                self.pending_keys.update(keys)
+                self.render_pool.submit(page_nb, halves[2], halves[3], document.PDF_REGULAR, lambda result:
+                    GLib.idle_add(self.store_async_halves, doc, page_nb, halves, result, keys),
+                    error_callback = lambda error: GLib.idle_add(self.render_failed, doc,
+                                                                 [(name, page_nb) for name in names], keys, error)
+                )
+                return True
+
+            self.pending_renders.add((widget_name, page_nb))
+            self.pending_keys.add(key)
+            self.render_pool.submit(page_nb, ww, wh, wtype, lambda result:
+                GLib.idle_add(self.store_async_render, doc, widget_name, page_nb, wtype, result, key),
+                error_callback = lambda error: GLib.idle_add(self.render_failed, doc, [(widget_name, page_nb)], [key], error)
+            )
+
+        return True
+
+
+    def render_failed(self, doc, renders, keys, error):
+        """ Render again pages that failed in the worker processes. Called on the main thread.
+
+        Renders that raised an error are done on the main thread instead. Renders that were lost,
+        e.g. because their worker died, are sent to a worker again up to :attr:`max_render_retries`
+        times, but never rendered on the main thread, which could crash the same way.
+
+        Args:
+            doc (:class:`~pympress.document.Document`):  the document for which the pages were rendered
+            renders (`list`):  the (widget name, page number) of the failed renders
+            keys (`list`): the keys in :attr:`shared` of the failed renders
+            error (`Exception`): the reason why the renders failed, or `None` if it is unknown
+        """
+        logger.warning('Rendering {} in a worker process failed: {}'.format(renders, error))
+
+        with self.doc_lock:
+            if doc is not self.doc:
+                return False
+            self.pending_renders.difference_update(renders)
+            self.pending_keys.difference_update(keys)
+
+        for widget_name, page_nb in renders:
+            if isinstance(error, multiprocessing.TimeoutError):
+                self.render_failures[(widget_name, page_nb)] += 1
+                if self.render_failures[(widget_name, page_nb)] <= self.max_render_retries:
+                    self.request_render(widget_name, page_nb)
+                else:
+                    logger.error('Giving up on rendering page {} for {}'.format(page_nb, widget_name))
+            elif self.renderer(widget_name, page_nb):
+                self.widgets[widget_name].queue_draw()
+
+        # A worker is available for the next job
+        self.schedule_jobs()
+        return False
+
+
+    def store_async_halves(self, doc, page_nb, halves, result, keys):
+        """ Store both halves of a page with notes rendered by a worker process in the cache. Called on the main thread.
+
+        Args:
+            doc (:class:`~pympress.document.Document`):  the document for which the page was rendered
+            page_nb (`int`):  number of the rendered page
+            halves (`tuple`):  the layout of the halves, as returned by :meth:`_split_halves`
+            result (`tuple`): buffer as returned by :func:`~pympress.render_pool.render_to_buffer`, or `None`
+            keys (`list`): the keys of both halves in :attr:`shared`
+        """
+        if result is None:
+            # Only python 2 workers report failures this way
+            return self.render_failed(doc, [(name, page_nb) for name in halves[:2]], keys, None)
+
+        with self.doc_lock:
+            if doc is not self.doc:
+                render_pool.discard_buffer(result)
+                return False
+            self.pending_renders.difference_update((name, page_nb) for name in halves[:2])
+            self.pending_keys.difference_update(keys)
+
+        # A worker is available for the next job
+        self.schedule_jobs()
+
+        self.store_halves(page_nb, halves, render_pool.load_buffer(*result))
+        return False
+
+
+    def store_async_render(self, doc, widget_name, page_nb, wtype, result, key, base = None):
+        """ Store a page rendered by a worker process in the cache. Called on the main thread.
+
+        Args:
+            doc (:class:`~pympress.document.Document`):  the document for which the page was rendered
+            widget_name (`str`):  name of the concerned widget
+            page_nb (`int`):  number of the rendered page
+            wtype (`int`):  type of document for which the page was rendered
+            result (`tuple`): buffer as returned by :func:`~pympress.render_pool.render_to_buffer`, or `None`
+            key (`tuple`): the key of the page in :attr:`shared`
+            base (`tuple`): if only a region of the page was rendered, the surface of the neighbouring page
+                            on which to paint it, the region, and the width and height of the page
+        """
+        if result is None:
+            # Only python 2 workers report failures this way
+            return self.render_failed(doc, [(widget_name, page_nb)], [key], None)
+
+        with self.doc_lock:
+            if doc is not self.doc:
+                render_pool.discard_buffer(result)
+                return False
+            self.pending_renders.discard((widget_name, page_nb))
+            self.pending_keys.discard(key)
+
+        # A worker is available for the next job
+        self.schedule_jobs()
+
+        with self.cache_lock:
+            ww, wh = result[1:3] if base is None else base[2:]
+            verify = base is None and key in self.partial_keys and key == self._shared_key(widget_name, page_nb)
+            if (ww, wh) != self.surface_size[widget_name] or wtype != self.surface_type[widget_name] \
+                    or (page_nb in self.surface_cache[widget_name] and not verify):
+                render_pool.discard_buffer(result)
+                return False
+
+            surface = render_pool.load_buffer(*result)
+            if verify:
+                self._replace_partial(key, surface, ww, wh)
+            elif base is not None:
+                surface = self.paint_region(widget_name, base[0], surface, *base[1])
+                self.partial_keys.add(key)
+                self._store(widget_name, page_nb, surface)
+            else:
+                self._store(widget_name, page_nb, surface)
+
+        if base is not None:
+            # Check the page against its full rendering once there is nothing else to render
+            self.jobs[(widget_name, page_nb)] = (self.verify_rank, self.widget_priority[widget_name])
+            heapq.heappush(self.job_queue, (self.jobs[(widget_name, page_nb)], widget_name, page_nb))
+            self.schedule_jobs()
+        else:
+            self.save_to_disk(widget_name, page_nb, surface)
+        return False
+
+
+    def paint_region(self, widget_name, base, region_surface, x, y, width, height):
+        """ Build a page from a neighbouring page and the rendered region in which they differ.
+
+        Args:
+            widget_name (`str`):  name of the concerned widget
+            base (:class:`~cairo.Surface`):  the rendered neighbouring page
+            region_surface (:class:`~cairo.Surface`):  the rendered region
+            x (`int`):  left of the region in pixels
+            y (`int`):  top of the region in pixels
+            width (`int`):  width of the region in pixels
+            height (`int`):  height of the region in pixels
+
+        Returns:
+            :class:`~cairo.ImageSurface`: the page, whose pixels can be compared with its full rendering
+        """
+        ww, wh = self.surface_size[widget_name]
+        surface = cairo.ImageSurface(render_pool.PIXEL_FORMAT, ww, wh)
+
+        context = cairo.Context(surface)
+        context.set_source_surface(base, 0, 0)
+        context.paint()
+        context.set_source_surface(region_surface, x, y)
+        context.rectangle(x, y, width, height)
+        context.fill()
+        del context
+        surface.flush()
+
+        self.partial_renders += 1
+        return surface
 
 
     def renderer(self, widget_name, page_nb):
-        """ Rendering thread.
+        """ Render a page on the main thread, when there is no :attr:`render_pool` or it failed to render the page.
 
-        This function is meant to be run in the prerendering thread. It runs
-        infinitely (until the program ends) and does the following steps:
+        This function does the following steps:
 
         - check if the job's result is not already available in the cache
+        - downscale a larger rendering of the same page if there is one
+        - render the whole page if another widget needs its other half at the same scale, or
         - render it in a new :class:`~cairo.ImageSurface` if necessary
         - store it in the cache if it was not added there since the beginning of
           the process and the widget configuration is still valid
@@ -276,45 +1612,65 @@ class SurfaceCache(object):
         Args:
             widget_name (`str`):  name of the concerned widget
             page_nb (`int`):  number of the page to store in the cache
+
+        Returns:
+            `bool`: whether a page was rendered
         """
 
-        with self.locks[widget_name]:
-            if page_nb in self.surface_cache[widget_name]:
-                # Already in cache
+        with self.cache_lock:
+            if page_nb in self.surface_cache[widget_name] or self._find_shared(widget_name, page_nb) is not None \
+                    or self._find_compressed(widget_name, page_nb) is not None:
+                # Already in cache, possibly for another widget
                 return False
             ww, wh = self.surface_size[widget_name]
             wtype = self.surface_type[widget_name]
 
         if ww < 0 or wh < 0:
             logger.warning('Widget {} with invalid size {}x{} when rendering'.format(widget_name, ww, wh))
-            return
+            return False
+
+        if self.downscale_larger(widget_name, page_nb):
+            return True
 
         with self.doc_lock:
             page = self.doc.page(page_nb)
-            pw, ph = page.get_size(wtype)
+
+        if page is None or not page.can_render():
+            return False
+
+        with self.cache_lock:
+            halves = self._split_halves(widget_name, page_nb, *page.get_size())
 
         # Render to a ImageSurface
         try:
-            surface = self.surface_factory[widget_name](cairo.CONTENT_COLOR, ww, wh)
+            if halves is not None:
+                surface = self.surface_factory[widget_name](cairo.CONTENT_COLOR, halves[2], halves[3])
+            else:
+                surface = self.surface_factory[widget_name](cairo.CONTENT_COLOR, ww, wh)
         except AttributeError:
             logger.warning('Widget {} was not mapped when rendering'.format(widget_name), exc_info = True)
             return False
 
         context = cairo.Context(surface)
+        if halves is not None:
+            # Render the whole page once for both widgets showing one of its halves
+            page.render_cairo(context, halves[2], halves[3], document.PDF_REGULAR)
+            del context
+
+            self.store_halves(page_nb, halves, surface)
+            return True
+
         page.render_cairo(context, ww, wh, wtype)
         del context
 
         # Save if possible and necessary
-        with self.locks[widget_name]:
-            pc = self.surface_cache[widget_name]
-            if (ww, wh) == self.surface_size[widget_name] and not page_nb in pc:
-                pc[page_nb] = surface
-                pc.move_to_end(page_nb)
-
-            while len(pc) > self.max_pages:
-                pc.popitem(False)
+        with self.cache_lock:
+            if (ww, wh) != self.surface_size[widget_name] or page_nb in self.surface_cache[widget_name]:
+                return True
+            self._store(widget_name, page_nb, surface)
 
-        return False
+        self.save_to_disk(widget_name, page_nb, surface)
+        return True
 
 
 ##
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+#
+#       tilecache.py
+#
+#       Copyright 2018 Cimbali <me@cimba.li>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+
+"""
+:mod:`pympress.tilecache` -- tiles of zoomed pages
+--------------------------------------------------
+
+When zooming on a slide, only a small part of the page is visible, at a high magnification.
+Instead of rendering the whole page at that magnification, the zoomed page is split into
+square tiles of :const:`TILE_SIZE` pixels, and only the tiles that intersect the visible
+area are rendered.
+
+Tiles are identified by the page, the size of the whole zoomed page in pixels, the type of
+page and their position in the grid of tiles, which is aligned on the top left corner of the
+zoomed page. They thus do not depend on the part of the page that is displayed: zooming again
+on the same area, or on an overlapping area at the same magnification, reuses the tiles that
+were already rendered. The Least Recently Used tiles are evicted when the cache grows beyond
+its memory budget.
+
+Missing tiles are never rendered while drawing: they are sent to the workers of the
+:class:`~pympress.render_pool.RenderPool` if there are any, or else rendered one at a time on the
+main thread at idle times. Meanwhile, the page of the widget is painted scaled up in their place.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import logging
+logger = logging.getLogger(__name__)
+
+import gi
+import cairo
+gi.require_version('Gtk', '3.0')
+from gi.repository import GLib
+
+from pympress import render_pool
+from pympress.surfacecache import OrderedDict, surface_bytes
+
+
+#: Size of the side of tiles, in pixels
+TILE_SIZE = 256
+
+
+class TileCache(object):
+    """ Cache of the tiles of zoomed pages, rendered on demand.
+
+    Args:
+        max_bytes (`int`): The maximum memory used by all the tiles, in bytes
+        workers (:class:`~pympress.render_pool.RenderPool`): The processes that render the tiles, if active
+    """
+    #: :class:`~pympress.surfacecache.OrderedDict` of the tiles, as :class:`~cairo.Surface`, by
+    #: (page number, zoomed width, zoomed height, type, column, row), least recently used first
+    tiles = None
+    #: `dict` of the memory used by each tile, in bytes, with the same keys as :attr:`tiles`
+    tile_bytes = {}
+    #: `int` memory used by all the tiles, in bytes
+    total_bytes = 0
+    #: `int` maximum memory used by all the tiles, in bytes
+    max_bytes = 64 << 20
+
+    #: :class:`~pympress.render_pool.RenderPool` that renders tiles when it is active
+    workers = None
+    #: `dict` of the widgets to redraw when each tile being rendered is ready, with the same keys as :attr:`tiles`
+    pending = {}
+    #: :class:`~pympress.surfacecache.OrderedDict` of the tiles to render on the main thread, when there are no
+    #: workers, with the same keys as :attr:`tiles` and the :class:`~pympress.document.Page` as values
+    queue = None
+    #: `set` of the keys of tiles whose rendering failed, which are not requested again
+    failed = set()
+    #: `int` the GLib source ID of :meth:`process_queue`, or 0 if it is not scheduled
+    job_source = 0
+    #: `int` incremented when the tiles are cleared, to ignore tiles rendered for a previous document
+    generation = 0
+
+    #: `int` number of tiles found in the cache when drawing
+    hits = 0
+    #: `int` number of tiles that had to be rendered when drawing
+    misses = 0
+
+    def __init__(self, max_bytes, workers = None):
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.tiles = OrderedDict()
+        self.tile_bytes = {}
+        self.total_bytes = 0
+        self.pending = {}
+        self.queue = OrderedDict()
+        self.failed = set()
+
+
+    def clear(self):
+        """ Remove all the tiles, e.g. when the document changes.
+        """
+        self.tiles.clear()
+        self.tile_bytes.clear()
+        self.total_bytes = 0
+        self.pending.clear()
+        self.queue.clear()
+        self.failed.clear()
+        self.generation += 1
+
+
+    @staticmethod
+    def visible_tiles(ww, wh, zw, zh, ox, oy):
+        """ Get the positions of the tiles of a zoomed page that are visible in a widget.
+
+        Args:
+            ww (`int`):  width of the widget
+            wh (`int`):  height of the widget
+            zw (`int`):  width of the whole zoomed page
+            zh (`int`):  height of the whole zoomed page
+            ox (`int`):  horizontal position of the zoomed page's top left corner in the widget
+            oy (`int`):  vertical position of the zoomed page's top left corner in the widget
+
+        Returns:
+            `list` of `tuple`: the column and row of each visible tile
+        """
+        cols = range(max(0, -ox // TILE_SIZE), min((zw + TILE_SIZE - 1) // TILE_SIZE, (ww - ox + TILE_SIZE - 1) // TILE_SIZE))
+        rows = range(max(0, -oy // TILE_SIZE), min((zh + TILE_SIZE - 1) // TILE_SIZE, (wh - oy + TILE_SIZE - 1) // TILE_SIZE))
+        return [(col, row) for row in rows for col in cols]
+
+
+    def request_tile(self, widget, page, key):
+        """ Start rendering a tile of a zoomed page, in the workers or else at idle time on the main thread.
+
+        Args:
+            widget (:class:`~Gtk.Widget`):  the widget to redraw when the tile is rendered
+            page (:class:`~pympress.document.Page`):  the page to render
+            key (`tuple`):  the page number, width and height of the whole zoomed page, type, column and row of the tile
+        """
+        if key in self.failed:
+            return
+        elif key in self.pending:
+            if widget not in self.pending[key]:
+                self.pending[key].append(widget)
+            return
+
+        self.misses += 1
+        self.pending[key] = [widget]
+
+        page_nb, zw, zh, wtype, col, row = key
+        tw, th = min(TILE_SIZE, zw - col * TILE_SIZE), min(TILE_SIZE, zh - row * TILE_SIZE)
+
+        if self.workers is not None and self.workers.is_active():
+            generation = self.generation
+            self.workers.submit(page_nb, zw, zh, wtype, lambda result:
+                GLib.idle_add(self.store_async_tile, generation, key, result),
+                (col * TILE_SIZE, row * TILE_SIZE, tw, th),
+                lambda error: GLib.idle_add(self.store_async_tile, generation, key, None)
+            )
+        else:
+            self.queue[key] = page
+            if not self.job_source:
+                self.job_source = GLib.idle_add(self.process_queue)
+
+
+    def process_queue(self):
+        """ Render the most recently requested tile on the main thread. Called at idle time in the main loop.
+
+        Returns:
+            `bool`: whether this function should be called again at the next idle time
+        """
+        if self.queue:
+            key, page = self.queue.popitem()
+            if key in self.pending:
+                self.store_tile(key, self.render_tile(page, key))
+
+        if not self.queue:
+            self.job_source = 0
+        return bool(self.queue)
+
+
+    def render_tile(self, page, key):
+        """ Render a tile of a zoomed page on the main thread.
+
+        Args:
+            page (:class:`~pympress.document.Page`):  the page to render
+            key (`tuple`):  the page number, width and height of the whole zoomed page, type, column and row of the tile
+
+        Returns:
+            :class:`~cairo.Surface`: the rendered tile
+        """
+        page_nb, zw, zh, wtype, col, row = key
+        tw, th = min(TILE_SIZE, zw - col * TILE_SIZE), min(TILE_SIZE, zh - row * TILE_SIZE)
+        tile = cairo.ImageSurface(cairo.FORMAT_RGB24, tw, th)
+
+        context = cairo.Context(tile)
+        context.translate(-col * TILE_SIZE, -row * TILE_SIZE)
+        # All the tiles of a page replay the same recording, instead of each parsing the page
+        page.render_cairo(context, zw, zh, wtype)
+        del context
+
+        return tile
+
+
+    def store_async_tile(self, generation, key, result):
+        """ Store a tile rendered by a worker. Called on the main thread.
+
+        Args:
+            generation (`int`):  the value of :attr:`generation` when the tile was requested
+            key (`tuple`):  the key of the tile in :attr:`tiles`
+            result (`tuple`):  the buffer as returned by :func:`~pympress.render_pool.render_to_buffer`, or `None`
+
+        Returns:
+            `bool`: `False`, so that the callback is not called again
+        """
+        if generation != self.generation or key not in self.pending:
+            render_pool.discard_buffer(result)
+        elif result is None:
+            logger.warning('Rendering the zoomed tile {} failed'.format(key))
+            self.failed.add(key)
+            del self.pending[key]
+        else:
+            self.store_tile(key, render_pool.load_buffer(*result))
+        return False
+
+
+    def store_tile(self, key, tile):
+        """ Add a rendered tile to the cache and redraw the widgets that are waiting for it.
+
+        Args:
+            key (`tuple`):  the key of the tile in :attr:`tiles`
+            tile (:class:`~cairo.Surface`):  the rendered tile
+        """
+        page_nb, zw, zh, wtype, col, row = key
+        tw, th = min(TILE_SIZE, zw - col * TILE_SIZE), min(TILE_SIZE, zh - row * TILE_SIZE)
+
+        self.tiles[key] = tile
+        self.tile_bytes[key] = surface_bytes(tile, tw, th)
+        self.total_bytes += self.tile_bytes[key]
+
+        # The widgets evict the tiles they do not display when they are drawn
+        for widget in self.pending.pop(key):
+            if widget.get_mapped():
+                widget.queue_draw()
+
+
+    def evict(self, keep):
+        """ Remove the least recently used tiles until the cache is within :attr:`max_bytes`.
+
+        Args:
+            keep (`set`):  the keys of the tiles that must not be removed, e.g. because they are being displayed
+        """
+        for key in list(self.tiles):
+            if self.total_bytes <= self.max_bytes:
+                break
+            elif key not in keep:
+                del self.tiles[key]
+                self.total_bytes -= self.tile_bytes.pop(key)
+
+
+    def draw(self, widget, cairo_context, page, ww, wh, wtype, zoom_matrix, placeholder = None):
+        """ Draw the visible part of a zoomed page, requesting the tiles that are not cached yet.
+
+        Args:
+            widget (:class:`~Gtk.Widget`):  the widget in which the page is displayed
+            cairo_context (:class:`~cairo.Context`):  the context of the widget
+            page (:class:`~pympress.document.Page`):  the page to draw
+            ww (`int`):  width of the widget
+            wh (`int`):  height of the widget
+            wtype (`int`):  the type of document to render
+            zoom_matrix (:class:`~cairo.Matrix`):  the zoom transformation, see :meth:`~pympress.extras.Zoom.get_matrix`
+            placeholder (`tuple`):  a :class:`~cairo.Surface` of the unzoomed page, its width and height, painted scaled up
+                                    where tiles are missing, or `None`
+        """
+        # Round the zoomed page's size and position to whole pixels, so that tiles are painted without resampling
+        zw, zh = int(round(ww * zoom_matrix.xx)), int(round(wh * zoom_matrix.yy))
+        ox, oy = int(round(zoom_matrix.x0)), int(round(zoom_matrix.y0))
+
+        visible = set()
+        missing = []
+        for col, row in self.visible_tiles(ww, wh, zw, zh, ox, oy):
+            key = (page.number(), zw, zh, wtype, col, row)
+            visible.add(key)
+            if key not in self.tiles:
+                missing.append(key)
+
+        if missing and placeholder is not None:
+            surface, pw, ph = placeholder
+            cairo_context.save()
+            cairo_context.translate(ox, oy)
+            cairo_context.scale(float(zw) / pw, float(zh) / ph)
+            cairo_context.set_source_surface(surface, 0, 0)
+            cairo_context.paint()
+            cairo_context.restore()
+
+        for key in visible.difference(missing):
+            self.hits += 1
+            self.tiles.move_to_end(key)
+
+            col, row = key[4:]
+            cairo_context.set_source_surface(self.tiles[key], ox + col * TILE_SIZE, oy + row * TILE_SIZE)
+            cairo_context.paint()
+
+        for key in missing:
+            self.request_tile(widget, page, key)
+
+        self.evict(visible)
+
+
+    def get_stats(self):
+        """ Get statistics about the tiles cache usage.
+
+        Returns:
+            `dict`: the hits and misses counts, the number of tiles and the bytes they use
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'tiles': len(self.tiles),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+        }
+
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
@@ -46,15 +46,8 @@ import cairo
 gi.require_version('Gtk', '3.0')
 from gi.repository import GObject, Gtk, Gdk, GLib
 
-#: "Regular" PDF file (without notes)
-PDF_REGULAR      = 0
-#: Content page (left side) of a PDF file with notes
-PDF_CONTENT_PAGE = 1
-#: Notes page (right side) of a PDF file with notes
-PDF_NOTES_PAGE   = 2
-
-
-from pympress import __main__, document, surfacecache, util, pointer, scribble, config, builder, talk_time, extras, editable_label
+from pympress.document import PDF_REGULAR, PDF_CONTENT_PAGE, PDF_NOTES_PAGE
+from pympress import __main__, document, surfacecache, tilecache, util, pointer, scribble, config, builder, talk_time, extras, editable_label
 
 
 class UI(builder.Builder):
@@ -100,6 +93,8 @@ class UI(builder.Builder):
     resize_panes = False
     #: Tracks return values of GLib.timeout_add to cancel gtk.paned's redraw callbacks
     redraw_timeout = 0
+    #: Scale of the fast preview rendered and painted on a cache miss, while the page is rendered at full size
+    preview_scale = 0.25
 
     #: Whether to use notes mode or not
     notes_mode = False
@@ -135,6 +130,10 @@ class UI(builder.Builder):
 
     #: :class:`~pympress.surfacecache.SurfaceCache` instance.
     cache = None
+    #: :class:`~pympress.tilecache.TileCache` instance, for zoomed slides.
+    tiles = None
+    #: :class:`~pympress.extras.FrameCoalescer` instance, handling motion events and redraws once per frame.
+    frames = None
 
     #: Current :class:`~pympress.document.Document` instance.
     doc = document.EmptyDocument()
@@ -176,8 +175,14 @@ class UI(builder.Builder):
 
         self.show_annotations = self.config.getboolean('presenter', 'show_annotations')
 
-        # Surface cache
-        self.cache = surfacecache.SurfaceCache(self.doc, self.config.getint('cache', 'maxpages'))
+        # Surface cache, with memory, disk and compressed memory budgets in MiB
+        self.cache = surfacecache.SurfaceCache(self.doc, self.config.getint('cache', 'maxmemory') << 20,
+                                               self.config.getint('cache', 'workers'),
+                                               self.config.getint('cache', 'maxdisk') << 20,
+                                               self.config.get('cache', 'diskformat'),
+                                               self.config.getint('cache', 'maxcompressed') << 20)
+        self.tiles = tilecache.TileCache(self.config.getint('cache', 'maxtiles') << 20, self.cache.render_pool)
+        self.frames = extras.FrameCoalescer(self.handle_motion)
 
         # Make and populate windows
         self.load_ui('presenter')
@@ -249,8 +254,7 @@ class UI(builder.Builder):
         else:
             page_type = document.PDF_REGULAR
 
-        self.cache.add_widget(self.c_da, page_type)
-        self.cache.add_widget(self.c_da, page_type, zoomed = True)
+        self.cache.add_widget(self.c_da, page_type, priority = 0)
         self.c_frame.set_property("ratio", self.doc.current_page().get_aspect_ratio(page_type))
 
 
@@ -280,14 +284,13 @@ class UI(builder.Builder):
         for n in init_checkstates:
             self.get_object(n).set_active(init_checkstates[n])
 
+        # Prerendering priorities: content first, then current and next slide previews, then notes
         slide_type = PDF_CONTENT_PAGE if self.notes_mode else PDF_REGULAR
-        self.cache.add_widget(self.p_da_cur, slide_type)
-        self.cache.add_widget(self.p_da_cur, slide_type, zoomed = True)
-        self.cache.add_widget(self.p_da_next, slide_type)
+        self.cache.add_widget(self.p_da_cur, slide_type, priority = 1)
+        self.cache.add_widget(self.p_da_next, slide_type, priority = 2)
         self.cache.add_widget(self.p_da_notes, PDF_NOTES_PAGE if self.notes_mode else PDF_REGULAR,
-                                               prerender_enabled = self.notes_mode)
+                                               prerender_enabled = self.notes_mode, priority = 3)
         self.cache.add_widget(self.scribbler.scribble_p_da, slide_type, prerender_enabled = False)
-        self.cache.add_widget(self.scribbler.scribble_p_da, slide_type, zoomed = True)
 
         # set default value
         self.page_number.set_last(self.doc.pages_number())
@@ -433,8 +436,15 @@ class UI(builder.Builder):
         """ Save configuration and exit the main loop.
         """
         self.scribbler.disable_scribbling()
+        self.scribbler.scribbles.save()
 
         self.doc.cleanup_media_files()
+        self.cache.shutdown()
+        logger.info('Surface cache statistics: {}'.format(self.cache.get_stats()))
+        logger.info('Zoom tiles statistics: {}'.format(self.tiles.get_stats()))
+        logger.info('Input coalescing statistics: {}'.format(self.frames.get_stats()))
+        logger.info('Scribbles statistics: {}'.format(self.scribbler.scribbles.get_stats()))
+        logger.info('Page prefetching statistics: {}'.format(self.doc.predictor.get_stats()))
 
         self.config.update_layout('notes' if self.notes_mode else 'plain',
                                   self.p_central.get_children()[0], self.pane_handle_pos)
@@ -481,7 +491,8 @@ class UI(builder.Builder):
             docpath (`str`): the absolute path to the new document
         """
         try:
-            self.doc = document.Document.create(self, docpath)
+            self.doc = document.Document.create(self, docpath, max_pages = self.config.getint('cache', 'loadedpages'),
+                                                max_recording_bytes = self.config.getint('cache', 'maxrecordings') << 20)
         except GLib.Error:
             self.doc = document.Document.create(self, None)
             self.error_opening_file(docpath)
@@ -492,6 +503,8 @@ class UI(builder.Builder):
 
         # Some things that need updating
         self.cache.swap_document(self.doc)
+        self.tiles.clear()
+        self.scribbler.set_document(self.doc.path)
         self.page_number.set_last(self.doc.pages_number())
         self.medias.purge_media_overlays()
 
@@ -617,6 +630,7 @@ class UI(builder.Builder):
         page_next = self.doc.page(page_nb + 1)
 
         self.page_preview_nb = page_nb
+        self.doc.pin({self.doc.current_page().number(), page_nb, page_nb + 1})
 
         # Aspect ratios and queue redraws
         if not self.notes_mode:
@@ -639,12 +653,8 @@ class UI(builder.Builder):
         self.annotations.add_annotations(page_cur.get_annotations())
 
 
-        # Prerender the 4 next pages and the 2 previous ones
-        cur = page_cur.number()
-        page_max = min(self.doc.pages_number(), cur + 5)
-        page_min = max(0, cur - 2)
-        for p in list(range(cur+1, page_max)) + list(range(cur, page_min, -1)):
-            self.cache.prerender(p)
+        # Prerender the pages that we are likely to display next, without scoring predictions against previews
+        self.cache.prerender(self.doc.prefetch_pages(page_cur.number(), preview = True))
 
 
     def on_page_change(self, unpause=True):
@@ -663,6 +673,7 @@ class UI(builder.Builder):
 
         # Page change: resynchronize miniatures
         self.page_preview_nb = page_cur.number()
+        self.doc.pin({page_cur.number(), page_cur.number() + 1})
 
         # Aspect ratios and queue redraws
         if not self.notes_mode:
@@ -691,9 +702,9 @@ class UI(builder.Builder):
 
         self.p_da_next.queue_draw()
 
-        # Remove scribbles and scribbling/zooming modes
+        # Show the scribbles of the new page, and stop scribbling/zooming modes
         self.scribbler.disable_scribbling()
-        self.scribbler.clear_scribble()
+        self.scribbler.set_page(self.doc.current_page().number())
         self.zoom.stop_zooming()
 
         # Start counter if needed
@@ -703,11 +714,8 @@ class UI(builder.Builder):
         # Update display
         self.page_number.update_page_numbers(self.doc.current_page().number())
 
-        # Prerender the 4 next pages and the 2 previous ones
-        page_max = min(self.doc.pages_number(), self.page_preview_nb + 5)
-        page_min = max(0, self.page_preview_nb - 2)
-        for p in list(range(self.page_preview_nb+1, page_max)) + list(range(self.page_preview_nb, page_min, -1)):
-            self.cache.prerender(p)
+        # Prerender the pages that we are likely to display next
+        self.cache.prerender(self.doc.prefetch_pages(self.page_preview_nb))
 
         self.medias.replace_media_overlays(self.doc.current_page(), page_type)
 
@@ -747,40 +755,52 @@ class UI(builder.Builder):
         wtype = self.cache.get_widget_type(name)
         ww, wh = widget.get_allocated_width(), widget.get_allocated_height()
 
-        if self.zoom.scale != 1. and (widget is self.p_da_cur or widget is self.c_da
-                                      or widget is self.scribbler.scribble_p_da):
-            zoom_matrix = self.zoom.get_matrix(ww, wh)
-            name += '_zoomed'
-        else:
-            zoom_matrix = cairo.Matrix()
+        zoomed = self.zoom.scale != 1. and (widget is self.p_da_cur or widget is self.c_da
+                                            or widget is self.scribbler.scribble_p_da)
+        zoom_matrix = self.zoom.get_matrix(ww, wh) if zoomed else cairo.Matrix()
+
+        resizing = self.resize_panes and widget in [self.p_da_next, self.p_da_cur, self.p_da_notes]
 
         pb = self.cache.get(name, nb)
-        if pb is None:
-            if self.resize_panes and widget in [self.p_da_next, self.p_da_cur, self.p_da_notes]:
+        if zoomed:
+            if resizing:
                 # too slow to render here when resize_panes things
                 return
 
-            # Cache miss: render the page, and save it to the cache
-            pb = widget.get_window().create_similar_surface(cairo.CONTENT_COLOR, ww, wh)
-
-            cairo_prerender = cairo.Context(pb)
-            cairo_prerender.transform(zoom_matrix)
-            page.render_cairo(cairo_prerender, ww, wh, wtype)
-
-            self.cache.set(name, nb, pb)
+            # Only draw the tiles of the zoomed page that are visible, with the page scaled up until they are rendered
+            placeholder = (pb, ww, wh) if pb is not None else self.cache.get_placeholder(name, nb)
+            self.tiles.draw(widget, cairo_context, page, ww, wh, wtype, zoom_matrix, placeholder)
+            if pb is None:
+                self.cache.request_render(name, nb)
+        elif pb is None:
+            # Paint a placeholder: the page rendered at another size, or else a fast low resolution render
+            placeholder = self.cache.get_placeholder(name, nb)
+            if placeholder is None and not resizing:
+                placeholder = self.render_preview(widget, page, ww, wh, wtype)
+                self.cache.set_stale(name, nb, *placeholder)
+            elif placeholder is None:
+                # too slow to render here when resize_panes things
+                return
 
+            pb, pw, ph = placeholder
+            cairo_context.save()
+            cairo_context.scale(float(ww) / pw, float(wh) / ph)
             cairo_context.set_source_surface(pb, 0, 0)
             cairo_context.paint()
+            cairo_context.restore()
+
+            # The widget is redrawn when the page is rendered at full size in the background
+            self.cache.request_render(name, nb)
         else:
             # Cache hit: draw the surface from the cache to the widget
             cairo_context.set_source_surface(pb, 0, 0)
             cairo_context.paint()
 
         if widget is self.c_da or widget is self.p_da_cur or widget is self.scribbler.scribble_p_da:
+            self.scribbler.draw_scribble(widget, cairo_context, zoom_matrix)
+
             cairo_context.save()
             cairo_context.transform(zoom_matrix)
-
-            self.scribbler.draw_scribble(widget, cairo_context)
             self.zoom.draw_zoom_target(widget, cairo_context)
 
             cairo_context.restore()
@@ -790,20 +810,41 @@ class UI(builder.Builder):
             self.laser.render_pointer(cairo_context, ww, wh)
 
 
-    def clear_zoom_cache(self):
-        """ Callback to clear the cache of zoomed widgets.
+    def render_preview(self, widget, page, ww, wh, wtype):
+        """ Render a page quickly, at a fraction of the widget's resolution given by :attr:`preview_scale`.
+
+        Args:
+            widget (:class:`~Gtk.Widget`):  the widget in which the page is displayed
+            page (:class:`~pympress.document.Page`):  the page to render
+            ww (`int`):  the width of the widget
+            wh (`int`):  the height of the widget
+            wtype (`int`):  the type of document to render
+
+        Returns:
+            `tuple`: the rendered :class:`~cairo.Surface`, its width and its height
         """
-        self.cache.clear_cache(self.c_da.get_name() + '_zoomed')
-        self.cache.clear_cache(self.p_da_cur.get_name() + '_zoomed')
-        self.cache.clear_cache(self.scribbler.scribble_p_da.get_name() + '_zoomed')
+        pw, ph = max(1, int(ww * self.preview_scale)), max(1, int(wh * self.preview_scale))
+        pb = widget.get_window().create_similar_surface(cairo.CONTENT_COLOR, pw, ph)
+
+        cairo_prerender = cairo.Context(pb)
+        page.render_cairo(cairo_prerender, pw, ph, wtype, record = False)
+        del cairo_prerender
+
+        return pb, pw, ph
 
 
-    def redraw_current_slide(self):
-        """ Callback to queue a redraw of the current slides (in both winows)
+    def redraw_current_slide(self, damage = None):
+        """ Callback to queue a redraw of the current slides (in both winows), at the next frame of each widget
+
+        Args:
+            damage (`function`): called with the width and height of each widget, returns the `list` of areas
+                                 (left, top, width, height) that need to be redrawn, or `None` to redraw whole slides
         """
-        self.c_da.queue_draw()
-        self.p_da_cur.queue_draw()
-        self.scribbler.scribble_p_da.queue_draw()
+        for widget in [self.c_da, self.p_da_cur, self.scribbler.scribble_p_da]:
+            if damage is None:
+                self.frames.queue_draw(widget)
+            else:
+                self.frames.queue_draw(widget, damage(widget.get_allocated_width(), widget.get_allocated_height()))
 
 
     ##############################################################################
@@ -924,7 +965,8 @@ class UI(builder.Builder):
     def track_motions(self, widget, event):
         """ Track mouse motion events
 
-        Handles mouse motions on the "about" menu.
+        Scribbles get every point immediately, other motions are only handled
+        once per frame with the latest event, see :meth:`~pympress.ui.UI.handle_motion`.
 
         Args:
             widget (:class:`~Gtk.Widget`):  the widget that received the mouse motion
@@ -933,9 +975,24 @@ class UI(builder.Builder):
         Returns:
             `bool`: whether the event was consumed
         """
-        if self.zoom.track_zoom_target(widget, event):
+        if not self.zoom.zoom_selecting and self.scribbler.track_scribble(widget, event):
             return True
-        elif self.scribbler.track_scribble(widget, event):
+
+        self.frames.add_motion(widget, event)
+        return True
+
+
+    def handle_motion(self, widget, event):
+        """ Handle the latest mouse motion event received by a widget, at the start of a frame.
+
+        Args:
+            widget (:class:`~Gtk.Widget`):  the widget that received the mouse motion
+            event (:class:`~Gdk.Event`):  the GTK event containing the mouse position
+
+        Returns:
+            `bool`: whether the event was consumed
+        """
+        if self.zoom.track_zoom_target(widget, event):
             return True
         elif self.laser.track_pointer(widget, event):
             return True
@@ -1248,10 +1305,8 @@ class UI(builder.Builder):
 
         if self.notes_mode:
             self.cache.set_widget_type("c_da", PDF_REGULAR)
-            self.cache.set_widget_type("c_da_zoomed", PDF_REGULAR)
             self.cache.set_widget_type("p_da_next", PDF_REGULAR)
             self.cache.set_widget_type("p_da_cur", PDF_REGULAR)
-            self.cache.set_widget_type("p_da_cur_zoomed", PDF_REGULAR)
             self.cache.set_widget_type("scribble_p_da", PDF_REGULAR)
             self.cache.disable_prerender("p_da_cur")
 
@@ -1261,10 +1316,8 @@ class UI(builder.Builder):
             self.swap_layout('notes', 'plain')
         else:
             self.cache.set_widget_type("c_da", PDF_CONTENT_PAGE)
-            self.cache.set_widget_type("c_da_zoomed", PDF_CONTENT_PAGE)
             self.cache.set_widget_type("p_da_next", PDF_CONTENT_PAGE)
             self.cache.set_widget_type("p_da_cur", PDF_CONTENT_PAGE)
-            self.cache.set_widget_type("p_da_cur_zoomed", PDF_CONTENT_PAGE)
             self.cache.set_widget_type("scribble_p_da", PDF_CONTENT_PAGE)
             self.cache.enable_prerender("p_da_cur")
 
@@ -33,8 +33,6 @@ logger = logging.getLogger(__name__)
 import gi
 import subprocess
 import importlib
-gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, Gdk, GObject, GdkPixbuf
 import pkg_resources
 import os, os.path, sys
 
@@ -49,12 +47,6 @@ if IS_WINDOWS:
         import winreg
     except ImportError:
         import _winreg as winreg
-else:
-    try:
-        gi.require_version('GdkX11', '3.0')
-        from gi.repository import GdkX11
-    except:
-        pass
 
 try:
     PermissionError()
@@ -126,6 +118,9 @@ def get_style_provider():
     else:
         css_fn = __get_resource_path('share', 'css', 'default.css')
 
+    gi.require_version('Gtk', '3.0')
+    from gi.repository import Gtk
+
     style_provider = Gtk.CssProvider()
     style_provider.load_from_path(css_fn)
     return style_provider
@@ -140,6 +135,7 @@ def get_icon_pixbuf(name):
     Returns:
         :class:`~GdkPixbuf.Pixbuf`: The loaded icon
     """
+    from gi.repository import GdkPixbuf
     return GdkPixbuf.Pixbuf.new_from_file(__get_resource_path('share', 'pixmaps', name))
 
 
@@ -217,6 +213,13 @@ def set_screensaver(must_disable, window):
                 set_screensaver.dpms_was_enabled = None
 
     elif IS_POSIX:
+        # Gdk windows only have get_xid() once GdkX11 is loaded
+        try:
+            gi.require_version('GdkX11', '3.0')
+            from gi.repository import GdkX11
+        except:
+            pass
+
         # On Linux, set screensaver with xdg-screensaver
         # (compatible with xscreensaver, gnome-screensaver and ksaver or whatever)
         cmd = "suspend" if must_disable else "resume"
@@ -63,7 +63,10 @@ setup(name='pympress',
         'gui_scripts': [
             'pympress = pympress.__main__:main',
             'pympress{} = pympress.__main__:main'.format(sys.version_info.major),
-        ]
+        ],
+        'console_scripts': [
+            'pympress-export = pympress.export:main',
+        ],
       },
       license='GPLv2',
       install_requires=[